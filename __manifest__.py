@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     "name": "Cabal FSM Customizations",
-    "version": "17.0.2.0.38",
+    "version": "17.0.2.0.39",
     "author": "Bálsamo Labs SAS",
     "maintainer": "Bálsamo Labs SAS",
     "category": "Services/Field Service",
@@ -20,6 +20,7 @@
         "views/planning_slot_views.xml",
         "views/fsm_capacity_views.xml",
         "views/fsm_day_reservation_views.xml",
+        "views/fsm_dispatch_run_views.xml",
         "views/fsm_booking_views.xml",
         "views/project_task_views.xml",
         "views/sale_order_views.xml",
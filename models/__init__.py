@@ -1,7 +1,14 @@
 from . import fsm_task_type, fsm_task_priority_slot, fsm_team, fsm_booking, project_task, sale_order, fsm_slot_engine
+from . import fsm_settings
 from . import res_config_settings
 from . import product
 from . import fsm_capacity
+from . import fsm_capacity_forecast
+from . import fsm_capacity_report
 from . import fsm_day_reservation
+from . import fsm_dispatch_run
 from . import fsm_dispatch_planner
 from . import planning_slot
+from . import fsm_crew_window
+from . import resource_calendar
+from . import hr_employee
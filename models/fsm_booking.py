@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from collections import Counter
 from datetime import datetime, timedelta
 
+
+# Booking fields that decide which capacity day a booking holds minutes on.
+_CAPACITY_HOLD_FIELDS = {"state", "task_id", "team_id", "start_datetime", "end_datetime", "allocated_hours"}
+
+
 class FsmBooking(models.Model):
     _name = "fsm.booking"
     _description = "FSM Booking"
@@ -24,6 +30,120 @@ class FsmBooking(models.Model):
 
     picking_id = fields.Many2one("stock.picking", string="Delivery Order", readonly=True, copy=False)
 
+    capacity_day_id = fields.Many2one(
+        "fsm.capacity.day",
+        string="Capacity Day",
+        readonly=True,
+        copy=False,
+        index=True,
+        ondelete="set null",
+        help="Capacity day whose booked minutes include this booking.",
+    )
+    capacity_minutes = fields.Integer(
+        string="Booked Capacity (min)",
+        readonly=True,
+        copy=False,
+        help="Minutes this booking adds to its capacity day. Bookings of dispatched "
+             "reservations hold nothing here; their reservation holds the minutes.",
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        bookings = super().create(vals_list)
+        bookings._sync_capacity_hold()
+        return bookings
+
+    def write(self, vals):
+        if not _CAPACITY_HOLD_FIELDS.intersection(vals):
+            return super().write(vals)
+        before = {rec.id: (rec.task_id.id, rec.team_id.id, rec.start_datetime) for rec in self}
+        res = super().write(vals)
+        if not self.env.context.get("fsm_dispatch_finalize"):
+            # A dispatched visit that is moved no longer uses the capacity its
+            # reservation consumed; the booking takes over the hold.
+            moved_task_ids = [
+                before[rec.id][0]
+                for rec in self
+                if before[rec.id] != (rec.task_id.id, rec.team_id.id, rec.start_datetime)
+            ]
+            if moved_task_ids:
+                self.env["fsm.day.reservation"].sudo().search([
+                    ("task_id", "in", moved_task_ids),
+                    ("dispatch_state", "!=", "cancelled"),
+                    ("capacity_consumed_minutes", ">", 0),
+                ])._release_capacity()
+        self._sync_capacity_hold()
+        return res
+
+    def unlink(self):
+        deltas = Counter()
+        for rec in self.filtered("capacity_day_id"):
+            deltas[rec.capacity_day_id.id] -= rec.capacity_minutes
+        self.env["fsm.capacity.ledger"]._apply_booked_deltas(deltas)
+        return super().unlink()
+
+    def _capacity_hold_minutes(self):
+        self.ensure_one()
+        minutes = int(round((self.allocated_hours or 0.0) * 60))
+        if minutes <= 0 and self.start_datetime and self.end_datetime:
+            minutes = int(round((self.end_datetime - self.start_datetime).total_seconds() / 60))
+        return max(0, minutes)
+
+    def _capacity_hold_targets(self):
+        """Return ``{booking id: (capacity day id, minutes)}`` for bookings that hold capacity.
+
+        A booking holds minutes on its team's capacity day for the local date
+        it starts on, unless a reservation of its task already consumed them.
+        """
+        engine = self.env["fsm.slot.engine"]
+        bookings = self.filtered(lambda b: b.state != "cancelled" and b.team_id and b.start_datetime)
+        if not bookings:
+            return {}
+        held_task_ids = set(self.env["fsm.day.reservation"].sudo().search([
+            ("task_id", "in", bookings.task_id.ids),
+            ("dispatch_state", "!=", "cancelled"),
+            ("capacity_line_id", "!=", False),
+            ("capacity_consumed_minutes", ">", 0),
+        ]).task_id.ids)
+        bookings = bookings.filtered(lambda b: b.task_id.id not in held_task_ids)
+        local_dates = {b.id: engine._to_local_naive(b.start_datetime).date() for b in bookings}
+        if not local_dates:
+            return {}
+        days = self.env["fsm.capacity.day"].sudo().search([
+            ("team_id", "in", bookings.team_id.ids),
+            ("date", "in", list(set(local_dates.values()))),
+        ], order="id")
+        day_by_key = {}
+        for day in days:
+            day_by_key.setdefault((day.team_id.id, day.date), day.id)
+        targets = {}
+        for booking in bookings:
+            day_id = day_by_key.get((booking.team_id.id, local_dates[booking.id]))
+            if day_id:
+                targets[booking.id] = (day_id, booking._capacity_hold_minutes())
+        return targets
+
+    def _sync_capacity_hold(self):
+        """Move booked minutes on capacity days to match these bookings."""
+        targets = self._capacity_hold_targets()
+        deltas = Counter()
+        changed = {}
+        for rec in self:
+            day_id, minutes = targets.get(rec.id, (False, 0))
+            if rec.capacity_day_id.id == day_id and rec.capacity_minutes == minutes:
+                continue
+            if rec.capacity_day_id:
+                deltas[rec.capacity_day_id.id] -= rec.capacity_minutes
+            if day_id:
+                deltas[day_id] += minutes
+            changed.setdefault((day_id, minutes), []).append(rec.id)
+        self.env["fsm.capacity.ledger"]._apply_booked_deltas(deltas)
+        for (day_id, minutes), booking_ids in changed.items():
+            self.browse(booking_ids).write({
+                "capacity_day_id": day_id,
+                "capacity_minutes": minutes,
+            })
+
     def action_cancel(self):
         for rec in self:
             rec.state = "cancelled"
@@ -1,7 +1,19 @@
 # -*- coding: utf-8 -*-
+import logging
+
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
-from datetime import timedelta
+from odoo.tools import split_every
+from datetime import datetime, time, timedelta
+
+_logger = logging.getLogger(__name__)
+
+
+# Days ahead of today for which capacity is kept generated.
+CAPACITY_HORIZON_DAYS = 14
+
+# Capacity kinds written by the generators (and pruned by them).
+GENERATED_CAPACITY_KINDS = ("forecast", "planning")
 
 
 def _skill_rank(skill):
@@ -32,6 +44,7 @@ class FsmCapacityDay(models.Model):
             ("manual", "Manual"),
             ("import", "Imported"),
             ("forecast", "Forecast"),
+            ("planning", "Planning"),
         ],
         string="Capacity Type",
         default="manual",
@@ -78,13 +91,7 @@ class FsmCapacityDay(models.Model):
     @api.depends("team_id", "date", "shift_id")
     def _compute_name(self):
         for rec in self:
-            team_name = rec.team_id.display_name or _("Team")
-            date_label = rec.date or _("No Date")
-            shift_label = rec.shift_id.name if rec.shift_id else False
-            parts = [str(date_label), team_name]
-            if shift_label:
-                parts.append(shift_label)
-            rec.name = " - ".join(parts)
+            rec.name = rec._capacity_day_label(rec.team_id, rec.date, rec.shift_id)
 
     @api.depends("total_minutes", "reserved_minutes")
     def _compute_sellable_minutes(self):
@@ -106,18 +113,12 @@ class FsmCapacityDay(models.Model):
 
     # ---- Capacity generation helpers ----
     def _protection_config(self):
-        icp = self.env["ir.config_parameter"].sudo()
-        def _get(key, default):
-            val = icp.get_param(key, default)
-            try:
-                return float(val)
-            except Exception:
-                return default
+        settings = self.env["fsm.settings"]
         return {
-            "standard_to_basic": _get("fsm_guided_intake.protect_standard_to_basic_pct", 0.25),
-            "fiber_to_basic": _get("fsm_guided_intake.protect_fiber_to_basic_pct", 0.40),
-            "fiber_to_standard": _get("fsm_guided_intake.protect_fiber_to_standard_pct", 0.40),
-            "urgent_reserve": _get("fsm_guided_intake.urgent_capacity_reserve_pct", 0.0),
+            "standard_to_basic": settings._get("protect_standard_to_basic_pct"),
+            "fiber_to_basic": settings._get("protect_fiber_to_basic_pct"),
+            "fiber_to_standard": settings._get("protect_fiber_to_standard_pct"),
+            "urgent_reserve": settings._get("urgent_capacity_reserve_pct"),
         }
 
     def _matching_shift_for_date(self, target_date):
@@ -128,57 +129,84 @@ class FsmCapacityDay(models.Model):
                 return shift
         return False
 
+    @api.model
+    def _bucket_line_values(self, team_skill, total, protection_cfg):
+        """Return bucket line values for a team skill and sellable minutes."""
+
+        def _protection_pct(bucket_skill):
+            # bucket_skill is the work type; team_skill is the team's skill level
+            if _skill_rank(bucket_skill) == _skill_rank(team_skill):
+                return 0.0
+            if bucket_skill == "L1" and team_skill == "L2":
+                return protection_cfg.get("standard_to_basic", 0.25)
+            if bucket_skill == "L1" and team_skill == "L3":
+                return protection_cfg.get("fiber_to_basic", 0.40)
+            if bucket_skill == "L2" and team_skill == "L3":
+                return protection_cfg.get("fiber_to_standard", 0.40)
+            return 0.0
+
+        lines = []
+        for bucket_skill in ("L3", "L2", "L1"):
+            if _skill_rank(team_skill) < _skill_rank(bucket_skill):
+                continue
+            protected = int(round(total * _protection_pct(bucket_skill)))
+            sellable = max(0, total - protected)
+            lines.append({
+                "bucket_skill_level": bucket_skill,
+                "total_minutes": total,
+                "protected_minutes": protected,
+                "sellable_minutes": sellable,
+                "available_minutes": sellable,
+            })
+        return lines
+
     def _rebuild_bucket_lines(self, protection_cfg=None):
         protection_cfg = protection_cfg or self._protection_config()
         for rec in self:
             if not rec.team_id:
                 rec.line_ids = [(5, 0, 0)]
                 continue
-            skill = rec.team_id.skill_level
-            total = rec.sellable_minutes or 0
-            lines = []
-
-            def _protection_pct(bucket_skill):
-                # bucket_skill is the work type; team skill is rec.team_id.skill_level
-                if _skill_rank(bucket_skill) == _skill_rank(skill):
-                    return 0.0
-                if bucket_skill == "L1" and skill == "L2":
-                    return protection_cfg.get("standard_to_basic", 0.25)
-                if bucket_skill == "L1" and skill == "L3":
-                    return protection_cfg.get("fiber_to_basic", 0.40)
-                if bucket_skill == "L2" and skill == "L3":
-                    return protection_cfg.get("fiber_to_standard", 0.40)
-                return 0.0
+            lines = rec._bucket_line_values(rec.team_id.skill_level, rec.sellable_minutes or 0, protection_cfg)
+            rec.line_ids = [(5, 0, 0)] + [(0, 0, vals) for vals in lines]
 
-            for bucket_skill in ("L3", "L2", "L1"):
-                if _skill_rank(skill) < _skill_rank(bucket_skill):
-                    continue
-                prot_pct = _protection_pct(bucket_skill)
-                protected = int(round(total * prot_pct))
-                sellable = max(0, total - protected)
-                lines.append(
-                    (0, 0, {
-                        "bucket_skill_level": bucket_skill,
-                        "total_minutes": total,
-                        "protected_minutes": protected,
-                        "sellable_minutes": sellable,
-                        "available_minutes": sellable,
-                    })
-                )
+    @api.model
+    def _capacity_day_label(self, team, day_date, shift):
+        parts = [str(day_date or _("No Date")), team.display_name or _("Team")]
+        if shift:
+            parts.append(shift.name)
+        return " - ".join(parts)
 
-            rec.line_ids = [(5, 0, 0)] + lines
+    @api.model
+    def _forecast_reserves(self, teams, start, end):
+        """Return ``{(team id, date): reserve minutes}`` from the demand forecast, or None when disabled."""
+        Forecast = self.env["fsm.capacity.forecast"].sudo()
+        if not teams or not Forecast._forecast_enabled():
+            return None
+        return {
+            (rec.team_id.id, rec.date): rec.reserve_minutes
+            for rec in Forecast.search([
+                ("team_id", "in", teams.ids),
+                ("date", ">=", start),
+                ("date", "<=", end),
+            ])
+        }
 
     @api.model
-    def generate_from_shifts(self, date_start=None, date_end=None):
-        """Generate daily capacity for active teams based on their shifts and protection rules."""
-        start = fields.Date.to_date(date_start) if date_start else fields.Date.context_today(self)
-        end = fields.Date.to_date(date_end) if date_end else start
-        protection_cfg = self._protection_config()
-        urgent_pct = protection_cfg.get("urgent_reserve", 0.0) or 0.0
+    def _urgent_reserved_minutes(self, team, day_date, total_minutes, urgent_pct, forecast_reserves):
+        """Urgent reserve of a team-day: the forecast reserve if there is one, else the static percentage."""
+        if forecast_reserves and (team.id, day_date) in forecast_reserves:
+            return min(total_minutes, forecast_reserves[(team.id, day_date)])
+        # The static urgent reserve only applies to L3-capable teams
+        return int(round(total_minutes * urgent_pct)) if team.skill_level == "L3" else 0
 
-        teams = self.env["fsm.team"].search([("active", "=", True)])
+    @api.model
+    def _shift_capacity_rows(self, teams, start, end, protection_cfg):
+        """Compute the (team, date, shift, skill) capacity rows implied by shifts."""
+        urgent_pct = protection_cfg.get("urgent_reserve", 0.0) or 0.0
+        forecast_reserves = self._forecast_reserves(teams, start, end)
+        hours_cache = {}
+        rows = []
         current = start
-        created = self.browse()
         while current <= end:
             weekday = current.weekday()
             for team in teams:
@@ -192,45 +220,470 @@ class FsmCapacityDay(models.Model):
 
                 # Derive hours from the team lead's resource calendar for this weekday
                 # and intersect with the shift window.
-                hours = shift._hours_for_weekday(weekday)
+                cache_key = (shift.id, weekday)
+                if cache_key not in hours_cache:
+                    hours_cache[cache_key] = shift._hours_for_weekday(weekday)
+                hours = hours_cache[cache_key]
                 if hours <= 0:
                     continue
 
                 total_minutes = int(round(hours * 60))
-                # Urgent reserve only applies to L3-capable teams
-                urgent_reserved = int(round(total_minutes * urgent_pct)) if team.skill_level == "L3" else 0
-
-                vals = {
-                    "team_id": team.id,
+                urgent_reserved = self._urgent_reserved_minutes(
+                    team, current, total_minutes, urgent_pct, forecast_reserves
+                )
+                rows.append({
+                    "team": team,
                     "date": current,
-                    "shift_id": shift.id,
-                    "skill_level": team.skill_level,
+                    "shift": shift,
+                    "skill_level": team.skill_level or None,
                     "capacity_kind": "forecast",
-                    "state": "ready",
                     "total_minutes": total_minutes,
                     "reserved_minutes": urgent_reserved,
-                }
-                rec = self.search([
-                    ("team_id", "=", team.id),
-                    ("date", "=", current),
-                    ("shift_id", "=", shift.id),
-                    ("skill_level", "=", team.skill_level),
-                ], limit=1)
-
-                if rec:
-                    rec.write(vals)
-                else:
-                    rec = self.create(vals)
-                rec._rebuild_bucket_lines(protection_cfg=protection_cfg)
-                created |= rec
+                })
             current = current + timedelta(days=1)
-        return created
+        return rows
+
+    @api.model
+    def _planning_capacity_rows(self, teams, start, end, protection_cfg):
+        """Compute capacity rows from published technician Planning shifts.
+
+        Mirrors ``fsm.slot.engine._planning_work_windows_by_team_day_local``:
+        shifts are split per local day and a team only counts the time in
+        which every resource rostered to it that day is working. The crew
+        minutes of all team-days are summed in one query: each day is cut at
+        every shift boundary and a segment counts when all rostered resources
+        cover it.
+        """
+        role = self.env.ref("fsm_guided_intake.planning_role_fsm_technician", raise_if_not_found=False)
+        if not role or not teams:
+            return []
+        engine = self.env["fsm.slot.engine"]
+        window_start_local = datetime.combine(start, time.min)
+        window_end_local = datetime.combine(end + timedelta(days=1), time.min)
+        self.env["planning.slot"].flush_model([
+            "fsm_team_id", "resource_id", "user_id", "role_id", "state", "start_datetime", "end_datetime",
+        ])
+        self.env.cr.execute("""
+            WITH slot AS (
+                SELECT s.fsm_team_id AS team_id,
+                       s.resource_id,
+                       GREATEST(
+                           timezone(%(tz)s, s.start_datetime AT TIME ZONE 'UTC'), %(window_start_local)s
+                       ) AS local_start,
+                       LEAST(
+                           timezone(%(tz)s, s.end_datetime AT TIME ZONE 'UTC'), %(window_end_local)s
+                       ) AS local_end
+                  FROM planning_slot s
+                 WHERE s.fsm_team_id IN %(team_ids)s
+                   AND s.role_id = %(role_id)s
+                   AND s.state = 'published'
+                   AND s.resource_id IS NOT NULL
+                   AND s.user_id IS NOT NULL
+                   AND s.start_datetime < %(window_end_utc)s
+                   AND s.end_datetime > %(window_start_utc)s
+            ),
+            piece AS (
+                SELECT slot.team_id,
+                       slot.resource_id,
+                       d::date AS day,
+                       GREATEST(slot.local_start, d) AS piece_start,
+                       LEAST(slot.local_end, d + interval '1 day') AS piece_end
+                  FROM slot
+                 CROSS JOIN LATERAL generate_series(
+                       date_trunc('day', slot.local_start), slot.local_end, interval '1 day'
+                 ) AS d
+                 WHERE LEAST(slot.local_end, d + interval '1 day') > GREATEST(slot.local_start, d)
+            ),
+            crew AS (
+                SELECT team_id, day, COUNT(DISTINCT resource_id) AS crew_size
+                  FROM piece
+                 GROUP BY team_id, day
+            ),
+            bound AS (
+                SELECT team_id, day, piece_start AS at FROM piece
+                 UNION
+                SELECT team_id, day, piece_end AS at FROM piece
+            ),
+            segment AS (
+                SELECT team_id, day, at AS seg_start,
+                       LEAD(at) OVER (PARTITION BY team_id, day ORDER BY at) AS seg_end
+                  FROM bound
+            ),
+            covered AS (
+                SELECT seg.team_id, seg.day, seg.seg_start, seg.seg_end
+                  FROM segment seg
+                  JOIN piece ON piece.team_id = seg.team_id
+                            AND piece.day = seg.day
+                            AND piece.piece_start <= seg.seg_start
+                            AND piece.piece_end >= seg.seg_end
+                  JOIN crew ON crew.team_id = seg.team_id AND crew.day = seg.day
+                 WHERE seg.seg_end IS NOT NULL
+                 GROUP BY seg.team_id, seg.day, seg.seg_start, seg.seg_end, crew.crew_size
+                HAVING COUNT(DISTINCT piece.resource_id) = crew.crew_size
+            )
+            SELECT team_id, day, SUM(EXTRACT(EPOCH FROM seg_end - seg_start)) / 60.0
+              FROM covered
+             GROUP BY team_id, day
+        """, {
+            "tz": engine._tz_name(),
+            "team_ids": tuple(teams.ids),
+            "role_id": role.id,
+            "window_start_local": window_start_local,
+            "window_end_local": window_end_local,
+            "window_start_utc": engine._to_utc_naive(window_start_local),
+            "window_end_utc": engine._to_utc_naive(window_end_local),
+        })
+
+        urgent_pct = protection_cfg.get("urgent_reserve", 0.0) or 0.0
+        forecast_reserves = self._forecast_reserves(teams, start, end)
+        teams_by_id = {team.id: team for team in teams}
+        rows = []
+        for team_id, day_date, minutes in self.env.cr.fetchall():
+            team = teams_by_id[team_id]
+            total_minutes = int(round(minutes or 0))
+            if total_minutes <= 0:
+                continue
+            urgent_reserved = self._urgent_reserved_minutes(
+                team, day_date, total_minutes, urgent_pct, forecast_reserves
+            )
+            rows.append({
+                "team": team,
+                "date": day_date,
+                "shift": self.env["fsm.team.shift"],
+                "skill_level": team.skill_level or None,
+                "capacity_kind": "planning",
+                "total_minutes": total_minutes,
+                "reserved_minutes": urgent_reserved,
+            })
+        return rows
+
+    @api.model
+    def _capacity_row_key(self, row):
+        return (row["team"].id, row["date"], row["shift"].id or None, row["skill_level"] or None)
+
+    @api.model
+    def _upsert_capacity_rows(self, rows):
+        """Write capacity rows set-based and return ``{row key: capacity day id}``.
+
+        Rows are upserted on the ``team_date_unique`` constraint. That constraint
+        cannot match a NULL shift or skill level, so existing rows with either
+        unset (Planning-derived days, teams without a skill level) are updated
+        by id instead.
+        """
+        if not rows:
+            return {}
+        self.flush_model()
+        cr = self.env.cr
+        team_ids = tuple({row["team"].id for row in rows})
+        cr.execute("""
+            SELECT id, team_id, date, shift_id, skill_level
+              FROM fsm_capacity_day
+             WHERE team_id IN %s
+               AND date BETWEEN %s AND %s
+               AND (shift_id IS NULL OR skill_level IS NULL)
+        """, [team_ids, min(row["date"] for row in rows), max(row["date"] for row in rows)])
+        nullable_ids = {
+            (team_id, day_date, shift_id or None, skill_level or None): day_id
+            for day_id, team_id, day_date, shift_id, skill_level in cr.fetchall()
+        }
+
+        uid = self.env.uid
+        now = fields.Datetime.now()
+        day_ids = {}
+        inserts = []
+        updates = []
+        for row in rows:
+            key = self._capacity_row_key(row)
+            total = row["total_minutes"]
+            reserved = row["reserved_minutes"]
+            values = (
+                self._capacity_day_label(row["team"], row["date"], row["shift"]),
+                row["capacity_kind"],
+                total,
+                reserved,
+                max(0, total - reserved),
+            )
+            if key in nullable_ids:
+                day_ids[key] = nullable_ids[key]
+                updates.append((nullable_ids[key],) + values)
+            else:
+                inserts.append(key + values)
+
+        for batch in split_every(500, updates):
+            cr.execute("""
+                UPDATE fsm_capacity_day AS day
+                   SET name = v.name,
+                       capacity_kind = v.capacity_kind,
+                       state = 'ready',
+                       total_minutes = v.total_minutes,
+                       reserved_minutes = v.reserved_minutes,
+                       sellable_minutes = v.sellable_minutes,
+                       remaining_minutes = GREATEST(0, v.sellable_minutes - COALESCE(day.booked_minutes, 0)),
+                       write_uid = %%s,
+                       write_date = %%s
+                  FROM (VALUES %s) AS v(id, name, capacity_kind, total_minutes, reserved_minutes, sellable_minutes)
+                 WHERE day.id = v.id
+            """ % ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch)),
+                       [uid, now] + [value for row in batch for value in row])
+
+        for batch in split_every(500, inserts):
+            cr.execute("""
+                INSERT INTO fsm_capacity_day (
+                    team_id, date, shift_id, skill_level, name, capacity_kind,
+                    total_minutes, reserved_minutes, sellable_minutes,
+                    state, booked_minutes, remaining_minutes,
+                    create_uid, create_date, write_uid, write_date
+                )
+                SELECT v.team_id, v.date, v.shift_id, v.skill_level, v.name, v.capacity_kind,
+                       v.total_minutes, v.reserved_minutes, v.sellable_minutes,
+                       'ready', 0, v.sellable_minutes,
+                       %%s, %%s, %%s, %%s
+                  FROM (VALUES %s) AS v(
+                      team_id, date, shift_id, skill_level, name, capacity_kind,
+                      total_minutes, reserved_minutes, sellable_minutes
+                  )
+                ON CONFLICT ON CONSTRAINT fsm_capacity_day_team_date_unique DO UPDATE
+                   SET name = EXCLUDED.name,
+                       capacity_kind = EXCLUDED.capacity_kind,
+                       state = EXCLUDED.state,
+                       total_minutes = EXCLUDED.total_minutes,
+                       reserved_minutes = EXCLUDED.reserved_minutes,
+                       sellable_minutes = EXCLUDED.sellable_minutes,
+                       remaining_minutes = GREATEST(
+                           0, EXCLUDED.sellable_minutes - COALESCE(fsm_capacity_day.booked_minutes, 0)
+                       ),
+                       write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+             RETURNING id, team_id, date, shift_id, skill_level
+            """ % ", ".join(["(%s, %s::date, %s::int, %s, %s, %s, %s, %s, %s)"] * len(batch)),
+                       [uid, now, uid, now] + [value for row in batch for value in row])
+            for day_id, team_id, day_date, shift_id, skill_level in cr.fetchall():
+                day_ids[(team_id, day_date, shift_id or None, skill_level or None)] = day_id
+
+        self.invalidate_model()
+        return day_ids
+
+    @api.model
+    def _sync_bucket_lines(self, days_by_id, protection_cfg):
+        """Diff bucket lines in place against the desired protection split.
+
+        Minutes already consumed from a line stay consumed when its sellable
+        minutes change, so regenerating capacity never frees booked work.
+        """
+        Line = self.env["fsm.capacity.day.line"]
+        if not days_by_id:
+            return
+        existing = {}
+        obsolete = Line
+        for line in Line.search([("capacity_day_id", "in", list(days_by_id))]):
+            key = (line.capacity_day_id.id, line.bucket_skill_level)
+            if key in existing:
+                obsolete |= line
+            else:
+                existing[key] = line
+
+        to_create = []
+        to_update = []
+        desired_keys = set()
+        for day_id, (team_skill, sellable_total) in days_by_id.items():
+            for vals in self._bucket_line_values(team_skill, sellable_total, protection_cfg):
+                key = (day_id, vals["bucket_skill_level"])
+                desired_keys.add(key)
+                line = existing.get(key)
+                if not line:
+                    to_create.append(dict(vals, capacity_day_id=day_id))
+                    continue
+                consumed = max(0, (line.sellable_minutes or 0) - (line.available_minutes or 0))
+                available = max(0, vals["sellable_minutes"] - consumed)
+                current = (line.total_minutes, line.protected_minutes, line.sellable_minutes, line.available_minutes)
+                desired = (vals["total_minutes"], vals["protected_minutes"], vals["sellable_minutes"], available)
+                if current != desired:
+                    to_update.append((line.id,) + desired)
+        obsolete |= Line.browse([line.id for key, line in existing.items() if key not in desired_keys])
+
+        if to_update:
+            Line.flush_model()
+            for batch in split_every(500, to_update):
+                self.env.cr.execute("""
+                    UPDATE fsm_capacity_day_line AS line
+                       SET total_minutes = v.total_minutes,
+                           protected_minutes = v.protected_minutes,
+                           sellable_minutes = v.sellable_minutes,
+                           available_minutes = v.available_minutes,
+                           write_uid = %%s,
+                           write_date = %%s
+                      FROM (VALUES %s) AS v(id, total_minutes, protected_minutes, sellable_minutes, available_minutes)
+                     WHERE line.id = v.id
+                """ % ", ".join(["(%s, %s, %s, %s, %s)"] * len(batch)),
+                    [self.env.uid, fields.Datetime.now()] + [value for row in batch for value in row])
+            Line.invalidate_model()
+        if obsolete:
+            obsolete.unlink()
+        if to_create:
+            Line.create(to_create)
+
+    @api.model
+    def _generation_scope(self, date_start, date_end, teams):
+        start = fields.Date.to_date(date_start) if date_start else fields.Date.context_today(self)
+        end = fields.Date.to_date(date_end) if date_end else start
+        if teams is None:
+            teams = self.env["fsm.team"].search([("active", "=", True)])
+        else:
+            teams = teams.filtered("active")
+        return start, end, teams
+
+    @api.model
+    def _write_generated_rows(self, rows, teams, start, end, protection_cfg, prune=False):
+        """Upsert generated rows, diff their bucket lines and optionally prune.
+
+        With ``prune``, generated rows of the given teams that ``rows`` no
+        longer contain are removed when nothing has been booked on them yet.
+        """
+        day_ids = self._upsert_capacity_rows(rows)
+        days_by_id = {}
+        for row in rows:
+            day_id = day_ids.get(self._capacity_row_key(row))
+            if day_id:
+                days_by_id[day_id] = (
+                    row["team"].skill_level,
+                    max(0, row["total_minutes"] - row["reserved_minutes"]),
+                )
+        self._sync_bucket_lines(days_by_id, protection_cfg)
+        if prune and teams:
+            self.search([
+                ("team_id", "in", teams.ids),
+                ("date", ">=", start),
+                ("date", "<=", end),
+                ("capacity_kind", "in", GENERATED_CAPACITY_KINDS),
+                ("booked_minutes", "=", 0),
+                ("id", "not in", list(days_by_id)),
+            ]).unlink()
+        return self.browse(list(days_by_id))
+
+    @api.model
+    def generate_from_shifts(self, date_start=None, date_end=None, teams=None, prune=False):
+        """Generate daily capacity for active teams based on their shifts and protection rules.
+
+        Rows are computed in memory and written set-based: one upsert for the
+        capacity days and an in-place diff of their bucket lines.
+        """
+        start, end, teams = self._generation_scope(date_start, date_end, teams)
+        protection_cfg = self._protection_config()
+        rows = self._shift_capacity_rows(teams, start, end, protection_cfg)
+        return self._write_generated_rows(rows, teams, start, end, protection_cfg, prune=prune)
+
+    @api.model
+    def generate_from_planning(self, date_start=None, date_end=None, teams=None, prune=False):
+        """Generate daily capacity from published technician Planning shifts."""
+        start, end, teams = self._generation_scope(date_start, date_end, teams)
+        protection_cfg = self._protection_config()
+        rows = self._planning_capacity_rows(teams, start, end, protection_cfg)
+        return self._write_generated_rows(rows, teams, start, end, protection_cfg, prune=prune)
+
+    @api.model
+    def generate_capacity(self, date_start=None, date_end=None, teams=None, prune=False):
+        """Generate capacity from the configured availability source."""
+        if self.env["fsm.slot.engine"]._availability_source() == "planning":
+            return self.generate_from_planning(date_start, date_end, teams=teams, prune=prune)
+        return self.generate_from_shifts(date_start, date_end, teams=teams, prune=prune)
+
+    @api.model
+    def _capacity_horizon(self):
+        today = fields.Date.context_today(self)
+        return today, today + timedelta(days=CAPACITY_HORIZON_DAYS)
 
     @api.model
     def cron_generate_from_shifts(self):
-        start = fields.Date.context_today(self)
-        end = start + timedelta(days=14)
-        return self.generate_from_shifts(start, end)
+        """Extend the capacity horizon and rebuild what changed since the last run.
+
+        Days already inside the horizon are kept current by the dirty queue, so
+        normally only the one day entering the horizon is generated.
+        """
+        today, horizon_end = self._capacity_horizon()
+        icp = self.env["ir.config_parameter"].sudo()
+        last_horizon = fields.Date.to_date(icp.get_param("fsm_guided_intake.capacity_horizon_date") or False)
+        start = today
+        if last_horizon and last_horizon >= today:
+            start = last_horizon + timedelta(days=1)
+        generated = self.browse()
+        if start <= horizon_end:
+            generated = self.generate_capacity(start, horizon_end)
+            # Bookings taken before these days existed start counting now.
+            self.env["fsm.capacity.ledger"].reconcile_booked_minutes(start, horizon_end)
+        icp.set_param("fsm_guided_intake.capacity_horizon_date", fields.Date.to_string(horizon_end))
+        self.env["fsm.capacity.dirty"].process_dirty()
+        return generated
+
+    @api.model
+    def cron_reconcile_booked_minutes(self):
+        return self.env["fsm.capacity.ledger"].reconcile_booked_minutes()
+
+
+class FsmCapacityDirty(models.Model):
+    _name = "fsm.capacity.dirty"
+    _description = "FSM Capacity Regeneration Queue"
+    _order = "id"
+
+    team_id = fields.Many2one("fsm.team", string="Team", required=True, ondelete="cascade", index=True)
+    date_from = fields.Date(string="From", required=True)
+    date_to = fields.Date(string="To", required=True)
+    reason = fields.Char(string="Reason")
+
+    @api.model
+    def mark(self, teams, date_from=None, date_to=None, reason=None):
+        """Queue capacity regeneration for teams over a date range (default: the horizon)."""
+        if not teams or self.env.context.get("fsm_skip_capacity_dirty"):
+            return self.browse()
+        today, horizon_end = self.env["fsm.capacity.day"]._capacity_horizon()
+        date_from = max(fields.Date.to_date(date_from) if date_from else today, today)
+        date_to = min(fields.Date.to_date(date_to) if date_to else horizon_end, horizon_end)
+        if date_to < date_from:
+            return self.browse()
+        return self.sudo().create([
+            {
+                "team_id": team.id,
+                "date_from": date_from,
+                "date_to": date_to,
+                "reason": reason,
+            }
+            for team in teams
+        ])
+
+    @api.model
+    def process_dirty(self):
+        """Rebuild only the queued (team, date range) capacity rows."""
+        entries = self.sudo().search([])
+        if not entries:
+            return 0
+        today = fields.Date.context_today(self)
+        ranges = {}
+        for entry in entries:
+            current = ranges.get(entry.team_id.id)
+            if current:
+                ranges[entry.team_id.id] = (min(current[0], entry.date_from), max(current[1], entry.date_to))
+            else:
+                ranges[entry.team_id.id] = (entry.date_from, entry.date_to)
+
+        teams_by_range = {}
+        for team_id, (date_from, date_to) in ranges.items():
+            date_from = max(date_from, today)
+            if date_to >= date_from:
+                teams_by_range.setdefault((date_from, date_to), []).append(team_id)
+
+        Capacity = self.env["fsm.capacity.day"].sudo()
+        for (date_from, date_to), team_ids in teams_by_range.items():
+            Capacity.generate_capacity(
+                date_from,
+                date_to,
+                teams=self.env["fsm.team"].sudo().browse(team_ids),
+                prune=True,
+            )
+        entries.unlink()
+        return len(ranges)
+
+    @api.model
+    def cron_process_dirty(self):
+        return self.process_dirty()
 
 
 class FsmCapacityDayLine(models.Model):
@@ -259,4 +712,208 @@ class FsmCapacityDayLine(models.Model):
     def _check_available_minutes(self):
         for rec in self:
             if rec.available_minutes < 0:
-                raise ValidationError(_("Available minutes cannot be negative."))
\ No newline at end of file
+                raise ValidationError(_("Available minutes cannot be negative."))
+
+
+class FsmCapacityLedger(models.AbstractModel):
+    _name = "fsm.capacity.ledger"
+    _description = "FSM Capacity Ledger"
+
+    def _flush_capacity(self):
+        self.env["fsm.capacity.day.line"].flush_model(["available_minutes", "sellable_minutes"])
+        self.env["fsm.capacity.day"].flush_model(["booked_minutes", "sellable_minutes", "remaining_minutes"])
+
+    def _adjust_booked_minutes(self, day_ids, delta):
+        """Shift booked minutes on capacity days and keep remaining minutes in step."""
+        self._apply_booked_deltas(dict.fromkeys(day_ids or (), delta))
+
+    def _apply_booked_deltas(self, deltas):
+        """Shift booked minutes by a per-day delta (``{day id: minutes}``) in one statement."""
+        deltas = [(day_id, delta) for day_id, delta in deltas.items() if day_id and delta]
+        if not deltas:
+            return
+        self._flush_capacity()
+        for batch in split_every(500, deltas):
+            self.env.cr.execute("""
+                UPDATE fsm_capacity_day AS day
+                   SET booked_minutes = GREATEST(0, COALESCE(day.booked_minutes, 0) + v.delta),
+                       remaining_minutes = GREATEST(
+                           0,
+                           COALESCE(day.sellable_minutes, 0) - GREATEST(0, COALESCE(day.booked_minutes, 0) + v.delta)
+                       )
+                  FROM (VALUES %s) AS v(id, delta)
+                 WHERE day.id = v.id
+            """ % ", ".join(["(%s, %s)"] * len(batch)), [value for row in batch for value in row])
+        self.env["fsm.capacity.day"].browse([day_id for day_id, _delta in deltas]).invalidate_recordset(
+            ["booked_minutes", "remaining_minutes"]
+        )
+
+    def reconcile_booked_minutes(self, date_from=None, date_to=None, team_ids=None):
+        """Recount booked minutes from bookings and reservations and fix drift.
+
+        Booking holds are reassigned first, then every capacity day in scope is
+        compared with the sum of the holds on it. Returns the corrected days as
+        ``[(day id, stored minutes, expected minutes)]``.
+        """
+        date_from = fields.Date.to_date(date_from) if date_from else fields.Date.context_today(self)
+        engine = self.env["fsm.slot.engine"]
+        self._flush_capacity()
+        self.env["fsm.booking"].flush_model()
+        self.env["fsm.day.reservation"].flush_model(["task_id", "dispatch_state", "capacity_line_id", "capacity_consumed_minutes"])
+
+        day_scope = ["day.date >= %(date_from)s"]
+        booking_scope = ["b.start_datetime >= %(scope_start_utc)s"]
+        params = {
+            "tz": engine._tz_name(),
+            "date_from": date_from,
+            "scope_start_utc": engine._to_utc_naive(datetime.combine(date_from, time.min)),
+        }
+        if date_to:
+            date_to = fields.Date.to_date(date_to)
+            day_scope.append("day.date <= %(date_to)s")
+            booking_scope.append("b.start_datetime < %(scope_end_utc)s")
+            params["date_to"] = date_to
+            params["scope_end_utc"] = engine._to_utc_naive(datetime.combine(date_to + timedelta(days=1), time.min))
+        if team_ids:
+            day_scope.append("day.team_id IN %(team_ids)s")
+            booking_scope.append("b.team_id IN %(team_ids)s")
+            params["team_ids"] = tuple(team_ids)
+        day_scope = " AND ".join(day_scope)
+        booking_scope = " AND ".join(booking_scope)
+
+        cr = self.env.cr
+        cr.execute("""
+            WITH scope_day AS (
+                SELECT day.id FROM fsm_capacity_day day WHERE %(day_scope)s
+            ),
+            target AS (
+                SELECT b.id,
+                       hold_day.id AS day_id,
+                       CASE WHEN hold_day.id IS NULL THEN 0 ELSE GREATEST(0, COALESCE(
+                           NULLIF(ROUND(COALESCE(b.allocated_hours, 0) * 60)::int, 0),
+                           ROUND(EXTRACT(EPOCH FROM b.end_datetime - b.start_datetime) / 60)::int
+                       )) END AS minutes
+                  FROM fsm_booking b
+                  LEFT JOIN LATERAL (
+                      SELECT d.id
+                        FROM fsm_capacity_day d
+                       WHERE d.team_id = b.team_id
+                         AND d.date = timezone(%%(tz)s, b.start_datetime AT TIME ZONE 'UTC')::date
+                       ORDER BY d.id
+                       LIMIT 1
+                  ) hold_day ON b.state != 'cancelled' AND NOT EXISTS (
+                      SELECT 1
+                        FROM fsm_day_reservation r
+                       WHERE r.task_id = b.task_id
+                         AND r.dispatch_state != 'cancelled'
+                         AND r.capacity_line_id IS NOT NULL
+                         AND r.capacity_consumed_minutes > 0
+                  )
+                 WHERE (%(booking_scope)s) OR b.capacity_day_id IN (SELECT id FROM scope_day)
+            )
+            UPDATE fsm_booking b
+               SET capacity_day_id = target.day_id,
+                   capacity_minutes = target.minutes
+              FROM target
+             WHERE b.id = target.id
+               AND (b.capacity_day_id IS DISTINCT FROM target.day_id
+                    OR COALESCE(b.capacity_minutes, 0) != target.minutes)
+        """ % {"day_scope": day_scope, "booking_scope": booking_scope}, params)
+
+        cr.execute("""
+            WITH scope_day AS (
+                SELECT day.id FROM fsm_capacity_day day WHERE %(day_scope)s
+            ),
+            hold AS (
+                SELECT b.capacity_day_id AS day_id, b.capacity_minutes AS minutes
+                  FROM fsm_booking b
+                 WHERE b.capacity_day_id IN (SELECT id FROM scope_day)
+                 UNION ALL
+                SELECT line.capacity_day_id, r.capacity_consumed_minutes
+                  FROM fsm_day_reservation r
+                  JOIN fsm_capacity_day_line line ON line.id = r.capacity_line_id
+                 WHERE r.dispatch_state != 'cancelled'
+                   AND r.capacity_consumed_minutes > 0
+                   AND line.capacity_day_id IN (SELECT id FROM scope_day)
+            ),
+            drift AS (
+                SELECT day.id,
+                       COALESCE(day.booked_minutes, 0) AS stored,
+                       COALESCE(SUM(hold.minutes), 0) AS expected
+                  FROM fsm_capacity_day day
+                  LEFT JOIN hold ON hold.day_id = day.id
+                 WHERE day.id IN (SELECT id FROM scope_day)
+                 GROUP BY day.id
+                HAVING COALESCE(day.booked_minutes, 0) != COALESCE(SUM(hold.minutes), 0)
+            )
+            UPDATE fsm_capacity_day day
+               SET booked_minutes = drift.expected,
+                   remaining_minutes = GREATEST(0, COALESCE(day.sellable_minutes, 0) - drift.expected)
+              FROM drift
+             WHERE day.id = drift.id
+         RETURNING day.id, drift.stored, drift.expected
+        """ % {"day_scope": day_scope}, params)
+        drift = cr.fetchall()
+
+        self.env["fsm.booking"].invalidate_model(["capacity_day_id", "capacity_minutes"])
+        self.env["fsm.capacity.day"].invalidate_model(["booked_minutes", "remaining_minutes"])
+        if drift:
+            _logger.warning(
+                "Capacity reconciliation corrected booked minutes on %s day(s), %s minute(s) of drift in total.",
+                len(drift),
+                sum(abs(expected - stored) for _day_id, stored, expected in drift),
+            )
+        return drift
+
+    def consume(self, line, minutes):
+        """Take minutes from a capacity line and book them on its day.
+
+        The check and the decrement happen in a single conditional UPDATE, so
+        concurrent planners or intake flows never oversell a line and never
+        lose each other's updates. Returns False when the line no longer has
+        enough available minutes.
+        """
+        minutes = int(minutes or 0)
+        if not line or minutes <= 0:
+            return False
+        line.ensure_one()
+        self._flush_capacity()
+        self.env.cr.execute("""
+            UPDATE fsm_capacity_day_line
+               SET available_minutes = available_minutes - %s
+             WHERE id = %s
+               AND available_minutes >= %s
+         RETURNING capacity_day_id
+        """, [minutes, line.id, minutes])
+        row = self.env.cr.fetchone()
+        line.invalidate_recordset(["available_minutes"])
+        if not row:
+            return False
+        self._adjust_booked_minutes([row[0]], minutes)
+        return True
+
+    def release(self, line, minutes):
+        """Give minutes back to a capacity line, e.g. when a reservation is cancelled.
+
+        Available minutes never exceed the line's sellable minutes.
+        """
+        minutes = int(minutes or 0)
+        if not line or minutes <= 0:
+            return False
+        line.ensure_one()
+        self._flush_capacity()
+        self.env.cr.execute("""
+            UPDATE fsm_capacity_day_line
+               SET available_minutes = LEAST(
+                       GREATEST(COALESCE(sellable_minutes, 0), available_minutes),
+                       available_minutes + %s
+                   )
+             WHERE id = %s
+         RETURNING capacity_day_id
+        """, [minutes, line.id])
+        row = self.env.cr.fetchone()
+        line.invalidate_recordset(["available_minutes"])
+        if not row:
+            return False
+        self._adjust_booked_minutes([row[0]], -minutes)
+        return True
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from .fsm_capacity import _skill_rank
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+_logger = logging.getLogger(__name__)
+
+# Work booked this many days or less before its service date counts as urgent.
+FORECAST_LATE_BOOKING_DAYS = 1
+FORECAST_BUCKETS = ("L1", "L2", "L3")
+
+
+class FsmCapacityForecast(models.Model):
+    _name = "fsm.capacity.forecast"
+    _description = "FSM Capacity Demand Forecast"
+    _order = "date, team_id"
+
+    team_id = fields.Many2one("fsm.team", string="Team", required=True, ondelete="cascade", index=True)
+    date = fields.Date(required=True, index=True)
+    demand_minutes = fields.Integer(
+        string="Forecast Urgent Demand (min)",
+        help="Share of the forecast urgent demand this team is expected to absorb.",
+    )
+    reserve_minutes = fields.Integer(
+        string="Reserve (min)",
+        help="Minutes held back from sale on this team-day; the demand capped by the day's capacity.",
+    )
+    computed_at = fields.Datetime(string="Computed", readonly=True)
+
+    _sql_constraints = [
+        (
+            "team_date_unique",
+            "unique(team_id, date)",
+            "A team already has a demand forecast for this date.",
+        )
+    ]
+
+    @api.model
+    def _forecast_enabled(self):
+        return np is not None and self.env["fsm.settings"]._get("capacity_forecast_enabled")
+
+    @api.model
+    def _forecast_config(self):
+        settings = self.env["fsm.settings"]
+        weeks = settings._get("capacity_forecast_history_weeks")
+        alpha = settings._get("capacity_forecast_smoothing")
+        return {
+            "history_weeks": max(1, weeks),
+            "alpha": min(1.0, max(0.01, alpha)),
+        }
+
+    @api.model
+    def _urgent_demand_history(self, date_from, date_to):
+        """Return observed urgent demand as ``[(date, bucket, zone, minutes)]``.
+
+        Urgent demand is work that had to be served at short notice: high and
+        critical reservations, and any reservation or appointment booked at
+        most ``FORECAST_LATE_BOOKING_DAYS`` before its service date.
+        Appointments of tasks with a reservation are counted through it.
+        """
+        engine = self.env["fsm.slot.engine"]
+        self.env["fsm.day.reservation"].flush_model()
+        self.env["fsm.booking"].flush_model()
+        self.env.cr.execute("""
+            SELECT demand.day, demand.bucket, demand.zone, SUM(demand.minutes)
+              FROM (
+                SELECT r.service_date AS day,
+                       r.capacity_bucket AS bucket,
+                       COALESCE(NULLIF(r.zone, ''), t.fsm_service_zone_name, '') AS zone,
+                       COALESCE(
+                           NULLIF(r.required_minutes, 0),
+                           ROUND(COALESCE(tt.default_planned_hours, 0) * 60)::int
+                       ) AS minutes,
+                       (
+                           r.priority IN ('4', '5')
+                           OR r.service_date - timezone(%(tz)s, r.create_date AT TIME ZONE 'UTC')::date <= %(late_days)s
+                       ) AS urgent
+                  FROM fsm_day_reservation r
+                  JOIN project_task t ON t.id = r.task_id
+                  LEFT JOIN fsm_task_type tt ON tt.id = r.task_type_id
+                 WHERE r.dispatch_state != 'cancelled'
+                   AND r.service_date BETWEEN %(date_from)s AND %(date_to)s
+                 UNION ALL
+                SELECT booking.day,
+                       COALESCE(tt.skill_level, 'L1'),
+                       COALESCE(t.fsm_service_zone_name, ''),
+                       ROUND(COALESCE(b.allocated_hours, 0) * 60)::int,
+                       booking.day - timezone(%(tz)s, b.create_date AT TIME ZONE 'UTC')::date <= %(late_days)s
+                  FROM fsm_booking b
+                 CROSS JOIN LATERAL (
+                       SELECT timezone(%(tz)s, b.start_datetime AT TIME ZONE 'UTC')::date AS day
+                 ) booking
+                  JOIN project_task t ON t.id = b.task_id
+                  LEFT JOIN fsm_task_type tt ON tt.id = t.fsm_task_type_id
+                 WHERE b.state != 'cancelled'
+                   AND booking.day BETWEEN %(date_from)s AND %(date_to)s
+                   AND NOT EXISTS (
+                       SELECT 1
+                         FROM fsm_day_reservation r
+                        WHERE r.task_id = b.task_id
+                          AND r.dispatch_state != 'cancelled'
+                   )
+              ) demand
+             WHERE demand.urgent
+               AND demand.minutes > 0
+             GROUP BY demand.day, demand.bucket, demand.zone
+        """, {
+            "tz": engine._company_tz_name(),
+            "late_days": FORECAST_LATE_BOOKING_DAYS,
+            "date_from": date_from,
+            "date_to": date_to,
+        })
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _fit_daily_demand(self, history, days, horizon, alpha):
+        """Forecast daily demand per series with weekday-seasonal exponential smoothing.
+
+        ``history`` is a (series x days) matrix of observed minutes on the
+        consecutive dates ``days``. Each weekday of each series is smoothed
+        over the past weeks, all at once; returns a (series x horizon) matrix
+        of expected minutes.
+        """
+        history = np.asarray(history, dtype=float)
+        n_weeks = history.shape[1] // 7
+        if not n_weeks:
+            return np.zeros((history.shape[0], len(horizon)))
+        # Keep whole weeks only, so every weekday has the same number of samples.
+        history = history[:, history.shape[1] - n_weeks * 7:]
+        days = days[len(days) - n_weeks * 7:]
+        by_week = history.reshape(history.shape[0], n_weeks, 7)
+
+        # Simple exponential smoothing written as one weighted sum: the last
+        # week weighs alpha and every earlier week decays by (1 - alpha).
+        weights = alpha * (1.0 - alpha) ** np.arange(n_weeks - 1, -1, -1)
+        level = np.einsum("swd,w->sd", by_week, weights) + (1.0 - alpha) ** n_weeks * by_week[:, 0, :]
+
+        column_by_weekday = {day.weekday(): column for column, day in enumerate(days[:7])}
+        columns = [column_by_weekday[day.weekday()] for day in horizon]
+        return np.maximum(0.0, level[:, columns])
+
+    @api.model
+    def _team_day_weights(self, date_from, date_to):
+        """Return ``{date: {team: total minutes}}`` of generated capacity."""
+        days = self.env["fsm.capacity.day"].sudo().search([
+            ("date", ">=", date_from),
+            ("date", "<=", date_to),
+            ("state", "=", "ready"),
+            ("team_id.active", "=", True),
+        ])
+        weights = {}
+        for day in days:
+            by_team = weights.setdefault(day.date, {})
+            by_team[day.team_id] = by_team.get(day.team_id, 0) + (day.total_minutes or 0)
+        return weights
+
+    @api.model
+    def run_forecast(self, date_start=None, date_end=None):
+        """Forecast urgent demand and store per team-day capacity reserves.
+
+        Demand is fitted per (bucket, zone) series. Teams are not zoned, so
+        the zone forecasts of a bucket are summed and spread over the teams
+        able to serve it in proportion to their capacity that day.
+        """
+        if np is None:
+            _logger.warning("Capacity demand forecast skipped: numpy is not installed.")
+            return self.browse()
+        today, horizon_end = self.env["fsm.capacity.day"]._capacity_horizon()
+        start = fields.Date.to_date(date_start) if date_start else today
+        end = fields.Date.to_date(date_end) if date_end else horizon_end
+        if end < start:
+            return self.browse()
+        cfg = self._forecast_config()
+
+        history_end = today - timedelta(days=1)
+        history_start = history_end - timedelta(days=cfg["history_weeks"] * 7 - 1)
+        history_days = [history_start + timedelta(days=i) for i in range((history_end - history_start).days + 1)]
+        horizon = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+        rows = self._urgent_demand_history(history_start, history_end)
+        series = sorted({(bucket, zone) for _day, bucket, zone, _minutes in rows})
+        bucket_demand = {bucket: np.zeros(len(horizon)) for bucket in FORECAST_BUCKETS}
+        if series:
+            series_index = {key: i for i, key in enumerate(series)}
+            day_index = {day: i for i, day in enumerate(history_days)}
+            matrix = np.zeros((len(series), len(history_days)))
+            np.add.at(
+                matrix,
+                (
+                    [series_index[(bucket, zone)] for _day, bucket, zone, _minutes in rows],
+                    [day_index[day] for day, _bucket, _zone, _minutes in rows],
+                ),
+                [float(minutes) for _day, _bucket, _zone, minutes in rows],
+            )
+            forecast = self._fit_daily_demand(matrix, history_days, horizon, cfg["alpha"])
+            for (bucket, _zone), values in zip(series, forecast):
+                if bucket in bucket_demand:
+                    bucket_demand[bucket] += values
+
+        weights = self._team_day_weights(start, end)
+        demand = {}
+        for h, day in enumerate(horizon):
+            team_totals = weights.get(day, {})
+            for team in team_totals:
+                demand.setdefault((team, day), 0.0)
+            for bucket in FORECAST_BUCKETS:
+                capable = {
+                    team: total
+                    for team, total in team_totals.items()
+                    if total > 0 and _skill_rank(team.skill_level) >= _skill_rank(bucket)
+                }
+                pool = sum(capable.values())
+                if not pool or not bucket_demand[bucket][h]:
+                    continue
+                for team, total in capable.items():
+                    demand[(team, day)] += bucket_demand[bucket][h] * total / pool
+
+        return self._store_forecast(demand, weights, start, end)
+
+    @api.model
+    def _store_forecast(self, demand, weights, start, end):
+        """Write team-day forecasts and queue capacity rebuilds where reserves moved."""
+        now = fields.Datetime.now()
+        existing = {
+            (rec.team_id, rec.date): rec
+            for rec in self.search([("date", ">=", start), ("date", "<=", end)])
+        }
+        changed_teams = self.env["fsm.team"]
+        to_create = []
+        for (team, day), minutes in demand.items():
+            demand_minutes = int(round(minutes))
+            reserve = min(demand_minutes, weights.get(day, {}).get(team, 0))
+            rec = existing.pop((team, day), None)
+            if rec:
+                if (rec.demand_minutes, rec.reserve_minutes) != (demand_minutes, reserve):
+                    rec.write({"demand_minutes": demand_minutes, "reserve_minutes": reserve, "computed_at": now})
+                    changed_teams |= team
+            else:
+                to_create.append({
+                    "team_id": team.id,
+                    "date": day,
+                    "demand_minutes": demand_minutes,
+                    "reserve_minutes": reserve,
+                    "computed_at": now,
+                })
+                changed_teams |= team
+        stale = self.browse([rec.id for rec in existing.values()])
+        changed_teams |= stale.team_id
+        stale.unlink()
+        self.create(to_create)
+        if changed_teams:
+            self.env["fsm.capacity.dirty"].mark(changed_teams, start, end, reason="demand forecast")
+        return self.search([("date", ">=", start), ("date", "<=", end)])
+
+    @api.model
+    def cron_run_forecast(self):
+        if not self._forecast_enabled():
+            return self.browse()
+        return self.run_forecast()
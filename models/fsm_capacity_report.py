@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models, tools
+
+
+class FsmCapacityReport(models.Model):
+    _name = "fsm.capacity.report"
+    _description = "FSM Capacity Analysis"
+    _auto = False
+    _order = "week_start desc, team_id"
+
+    team_id = fields.Many2one("fsm.team", string="Team", readonly=True)
+    week_start = fields.Date(string="Week", readonly=True)
+    iso_week = fields.Char(string="ISO Week", readonly=True)
+    bucket = fields.Selection(
+        [
+            ("L1", "Basic (L1)"),
+            ("L2", "Standard (L2)"),
+            ("L3", "Fiber (L3)"),
+        ],
+        string="Capability Bucket",
+        readonly=True,
+    )
+    zone = fields.Char(string="Zone", readonly=True)
+    total_minutes = fields.Integer(string="Total (min)", readonly=True)
+    reserved_minutes = fields.Integer(string="Reserved Urgent (min)", readonly=True)
+    sellable_minutes = fields.Integer(
+        string="Sellable (min)",
+        readonly=True,
+        help="Minutes sellable to the bucket's work; buckets share the same shift time, so only compare within a bucket.",
+    )
+    booked_minutes = fields.Integer(string="Booked (min)", readonly=True)
+    remaining_minutes = fields.Integer(
+        string="Remaining (min)",
+        readonly=True,
+        help="Minutes still open to the bucket's work; buckets share the same shift time, so only compare within a bucket.",
+    )
+    booking_minutes = fields.Integer(
+        string="Appointment Minutes",
+        readonly=True,
+        help="Minutes of confirmed and tentative appointments, by the zone of their task.",
+    )
+    booking_count = fields.Integer(string="Appointments", readonly=True)
+
+    def _query(self):
+        """Weekly capacity and appointment facts per team, bucket and zone.
+
+        Total and reserved minutes come from each capacity day once, under
+        the day's own skill bucket; every bucket line repeats the full day,
+        so sellable, booked and remaining minutes come from the lines and
+        only add up across a single bucket. Appointments are bucketed by the
+        line their reservation consumed, or else their task type's skill.
+        Capacity days carry no zone; their minutes are reported under an
+        empty zone so totals are never repeated per zone. Appointments are
+        dated in the main company's timezone, like the local dates of
+        capacity days.
+        """
+        return """
+            WITH settings AS (
+                SELECT COALESCE(
+                           (SELECT partner.tz
+                              FROM res_company company
+                              JOIN res_partner partner ON partner.id = company.partner_id
+                             ORDER BY company.id
+                             LIMIT 1),
+                           'America/El_Salvador'
+                       ) AS tz
+            ),
+            appointment AS (
+                SELECT booking.team_id,
+                       timezone(settings.tz, booking.start_datetime AT TIME ZONE 'UTC')::date AS local_date,
+                       COALESCE(line.bucket_skill_level, task_type.skill_level, 'L1') AS bucket,
+                       NULLIF(task.fsm_service_zone_name, '') AS zone,
+                       ROUND(COALESCE(booking.allocated_hours, 0) * 60)::int AS minutes,
+                       booking.capacity_day_id,
+                       COALESCE(booking.capacity_minutes, 0) AS hold_minutes
+                  FROM fsm_booking booking
+                 CROSS JOIN settings
+                  JOIN project_task task ON task.id = booking.task_id
+                  LEFT JOIN fsm_task_type task_type ON task_type.id = task.fsm_task_type_id
+                  LEFT JOIN LATERAL (
+                       SELECT consumed.bucket_skill_level
+                         FROM fsm_day_reservation reservation
+                         JOIN fsm_capacity_day_line consumed ON consumed.id = reservation.capacity_line_id
+                        WHERE reservation.task_id = booking.task_id
+                          AND reservation.dispatch_state != 'cancelled'
+                        ORDER BY reservation.id DESC
+                        LIMIT 1
+                  ) line ON TRUE
+                 WHERE booking.state != 'cancelled'
+            )
+            SELECT row_number() OVER (ORDER BY facts.week_start, facts.team_id, facts.bucket, facts.zone) AS id,
+                   facts.team_id,
+                   facts.week_start,
+                   to_char(facts.week_start, 'IYYY-"W"IW') AS iso_week,
+                   facts.bucket,
+                   facts.zone,
+                   SUM(facts.total_minutes) AS total_minutes,
+                   SUM(facts.reserved_minutes) AS reserved_minutes,
+                   SUM(facts.sellable_minutes) AS sellable_minutes,
+                   SUM(facts.booked_minutes) AS booked_minutes,
+                   GREATEST(0, SUM(facts.remaining_minutes)) AS remaining_minutes,
+                   SUM(facts.booking_minutes) AS booking_minutes,
+                   SUM(facts.booking_count) AS booking_count
+              FROM (
+                -- Day capacity, once per capacity day.
+                SELECT day.team_id,
+                       date_trunc('week', day.date)::date AS week_start,
+                       COALESCE(day.skill_level, 'L1') AS bucket,
+                       NULL::varchar AS zone,
+                       COALESCE(day.total_minutes, 0) AS total_minutes,
+                       COALESCE(day.reserved_minutes, 0) AS reserved_minutes,
+                       0 AS sellable_minutes,
+                       0 AS booked_minutes,
+                       0 AS remaining_minutes,
+                       0 AS booking_minutes,
+                       0 AS booking_count
+                  FROM fsm_capacity_day day
+                 WHERE day.state = 'ready'
+                 UNION ALL
+                -- Sellable minutes and dispatched reservations, per bucket line.
+                SELECT day.team_id,
+                       date_trunc('week', day.date)::date,
+                       line.bucket_skill_level,
+                       NULL::varchar,
+                       0, 0,
+                       COALESCE(line.sellable_minutes, 0),
+                       GREATEST(0, COALESCE(line.sellable_minutes, 0) - COALESCE(line.available_minutes, 0)),
+                       COALESCE(line.available_minutes, 0),
+                       0, 0
+                  FROM fsm_capacity_day_line line
+                  JOIN fsm_capacity_day day ON day.id = line.capacity_day_id
+                 WHERE day.state = 'ready'
+                 UNION ALL
+                -- Exact bookings hold minutes on their capacity day, not a line.
+                SELECT day.team_id,
+                       date_trunc('week', day.date)::date,
+                       appointment.bucket,
+                       NULL::varchar,
+                       0, 0, 0,
+                       appointment.hold_minutes,
+                       -appointment.hold_minutes,
+                       0, 0
+                  FROM appointment
+                  JOIN fsm_capacity_day day ON day.id = appointment.capacity_day_id
+                 WHERE day.state = 'ready'
+                   AND appointment.hold_minutes > 0
+                 UNION ALL
+                SELECT appointment.team_id,
+                       date_trunc('week', appointment.local_date)::date,
+                       appointment.bucket,
+                       appointment.zone,
+                       0, 0, 0, 0, 0,
+                       appointment.minutes,
+                       1
+                  FROM appointment
+              ) facts
+             GROUP BY facts.team_id, facts.week_start, facts.bucket, facts.zone
+        """
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute("CREATE OR REPLACE VIEW %s AS (%s)" % (self._table, self._query()))
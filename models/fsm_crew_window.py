@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, time, timedelta
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+
+
+class FsmCrewWindow(models.Model):
+    _name = "fsm.crew.window"
+    _description = "FSM Planning Crew Windows"
+    _order = "date, team_id"
+
+    team_id = fields.Many2one("fsm.team", string="Team", required=True, ondelete="cascade", index=True)
+    date = fields.Date(string="Local Date", required=True, index=True)
+    tz = fields.Char(string="Timezone", required=True)
+    windows = fields.Json(
+        string="Crew Windows",
+        help="Local ``[start, end]`` intervals in which every rostered resource of the team works.",
+    )
+
+    _sql_constraints = [
+        (
+            "team_date_unique",
+            "unique(team_id, date)",
+            "Crew windows are already stored for this team and date.",
+        )
+    ]
+
+    @api.model
+    def _windows_by_team_day(self, teams, window_start_local, window_end_local):
+        """Return ``{(team id, date): [(start, end)]}`` of crew windows, clipped to the window.
+
+        The window and the result are local to the searching user. Rows are
+        stored by company-local date and converted here; team-days not stored
+        yet are computed from Planning without being written; the cron and
+        the shift hooks keep the table filled.
+        """
+        result = {}
+        if not teams or window_end_local <= window_start_local:
+            return result
+        engine = self.env["fsm.slot.engine"]
+        company_tz = engine._company_tz_name()
+        company_engine = engine.with_context(tz=company_tz)
+        same_tz = engine._tz_name() == company_tz
+
+        start = window_start_local if same_tz else company_engine._to_local_naive(engine._to_utc_naive(window_start_local))
+        end = window_end_local if same_tz else company_engine._to_local_naive(engine._to_utc_naive(window_end_local))
+        first = start.date()
+        last = (end - timedelta(microseconds=1)).date()
+        rows = self.sudo().search([
+            ("team_id", "in", teams.ids),
+            ("date", ">=", first),
+            ("date", "<=", last),
+            ("tz", "=", company_tz),
+        ])
+        stored = {
+            (row.team_id.id, row.date): [
+                (fields.Datetime.to_datetime(row_start), fields.Datetime.to_datetime(row_end))
+                for row_start, row_end in row.windows or []
+            ]
+            for row in rows
+        }
+
+        day_count = (last - first).days + 1
+        missing = teams.browse([
+            team_id
+            for team_id in teams.ids
+            if any((team_id, first + timedelta(days=i)) not in stored for i in range(day_count))
+        ])
+        if missing:
+            computed = self._compute_windows(missing, first, last)
+            for key, windows in computed.items():
+                stored.setdefault(key, windows)
+
+        day_date = window_start_local.date()
+        while datetime.combine(day_date, time.min) < window_end_local:
+            for team_id in teams.ids:
+                result[(team_id, day_date)] = []
+            day_date += timedelta(days=1)
+        for (team_id, _day_date), windows in stored.items():
+            for start, end in windows:
+                if not same_tz:
+                    start = engine._to_local_naive(company_engine._to_utc_naive(start))
+                    end = engine._to_local_naive(company_engine._to_utc_naive(end))
+                start = max(start, window_start_local)
+                end = min(end, window_end_local)
+                # Another timezone can move a window across local midnight.
+                while end > start:
+                    day_end = min(end, datetime.combine(start.date() + timedelta(days=1), time.min))
+                    result.setdefault((team_id, start.date()), []).append((start, day_end))
+                    start = day_end
+        return result
+
+    @api.model
+    def _compute_windows(self, teams, first, last):
+        """Return ``{(team id, date): [(start, end)]}`` from Planning, company-local."""
+        engine = self.env["fsm.slot.engine"]
+        engine = engine.with_context(tz=engine._company_tz_name())
+        computed = engine._planning_work_windows_by_team_day_local(
+            teams,
+            datetime.combine(first, time.min),
+            datetime.combine(last + timedelta(days=1), time.min),
+        )
+        windows_by_team_day = {}
+        day_date = first
+        while day_date <= last:
+            for team in teams:
+                windows_by_team_day[(team.id, day_date)] = computed.get((team.id, day_date), [])
+            day_date += timedelta(days=1)
+        return windows_by_team_day
+
+    @api.model
+    def _store_windows(self, teams, first, last):
+        """Recompute and upsert the crew windows of ``teams`` from ``first`` to ``last``.
+
+        A single ``INSERT ... ON CONFLICT`` per batch keeps concurrent
+        refreshes of the same team-day from failing on the unique constraint.
+        """
+        tz = self.env["fsm.slot.engine"]._company_tz_name()
+        windows_field = self._fields["windows"]
+        rows = [
+            (team_id, day_date, tz, windows_field.convert_to_column(
+                [[fields.Datetime.to_string(start), fields.Datetime.to_string(end)] for start, end in windows],
+                self,
+            ))
+            for (team_id, day_date), windows in self._compute_windows(teams, first, last).items()
+        ]
+        self.flush_model()
+        now = fields.Datetime.now()
+        for batch in split_every(500, rows):
+            self.env.cr.execute("""
+                INSERT INTO fsm_crew_window (team_id, date, tz, windows, create_uid, create_date, write_uid, write_date)
+                VALUES %s
+                ON CONFLICT (team_id, date) DO UPDATE
+                   SET tz = EXCLUDED.tz,
+                       windows = EXCLUDED.windows,
+                       write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+                 WHERE fsm_crew_window.tz IS DISTINCT FROM EXCLUDED.tz
+                    OR fsm_crew_window.windows::text IS DISTINCT FROM EXCLUDED.windows::text
+            """ % ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(batch)),
+                [value for row in batch for value in row + (self.env.uid, now, self.env.uid, now)])
+        self.invalidate_model()
+
+    @api.model
+    def _refresh(self, ranges):
+        """Bring the stored windows of ``{team id: (first, last)}`` team-days up to date.
+
+        Outside Planning mode the windows are only dropped; the cron rebuilds
+        them once Planning becomes the availability source.
+        """
+        if not ranges:
+            return
+        Team = self.env["fsm.team"].sudo()
+        if self.env["fsm.slot.engine"]._availability_source() != "planning":
+            for team_id, (first, last) in ranges.items():
+                self.sudo().search([
+                    ("team_id", "=", team_id),
+                    ("date", ">=", first),
+                    ("date", "<=", last),
+                ]).unlink()
+            return
+        teams_by_range = {}
+        for team_id, date_range in ranges.items():
+            teams_by_range.setdefault(date_range, []).append(team_id)
+        for (first, last), team_ids in teams_by_range.items():
+            self._store_windows(Team.browse(team_ids), first, last)
+
+    @api.model
+    def cron_store_windows(self):
+        """Store the crew windows of every active team over the shift sync window."""
+        if self.env["fsm.slot.engine"]._availability_source() != "planning":
+            return False
+        engine = self.env["fsm.slot.engine"]
+        today = fields.Date.context_today(self.with_context(tz=engine._company_tz_name()))
+        _window_start, window_end = self.env["planning.slot"]._fsm_sync_window()
+        teams = self.env["fsm.team"].sudo().search([])
+        self._store_windows(teams, today, window_end)
+        return True
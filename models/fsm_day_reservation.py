@@ -78,6 +78,20 @@ class FsmDayReservation(models.Model):
         default="pending",
         required=True,
     )
+    capacity_line_id = fields.Many2one(
+        "fsm.capacity.day.line",
+        string="Capacity Line",
+        readonly=True,
+        copy=False,
+        ondelete="set null",
+        help="Capacity bucket line the dispatch planner consumed minutes from.",
+    )
+    capacity_consumed_minutes = fields.Integer(
+        string="Consumed Minutes",
+        readonly=True,
+        copy=False,
+        help="Minutes taken from the capacity line; released again on cancellation.",
+    )
 
     @api.constrains("required_minutes")
     def _check_required_minutes(self):
@@ -190,7 +204,7 @@ class FsmDayReservation(models.Model):
             if team.member_ids:
                 member_users = team.member_ids.mapped("user_id").filtered(lambda u: u).ids
 
-            ctx = dict(self.env.context)
+            ctx = dict(self.env.context, fsm_dispatch_finalize=True)
             ctx.pop("default_state", None)
             ctx.pop("state", None)
 
@@ -212,3 +226,30 @@ class FsmDayReservation(models.Model):
             })
 
         return True
+
+    def _release_capacity(self):
+        """Give consumed minutes back to their capacity lines."""
+        ledger = self.env["fsm.capacity.ledger"]
+        held = self.filtered(lambda r: r.capacity_line_id and r.capacity_consumed_minutes)
+        for rec in held:
+            ledger.release(rec.capacity_line_id, rec.capacity_consumed_minutes)
+        if held:
+            held.write({"capacity_consumed_minutes": 0})
+        return held
+
+    def action_cancel_dispatch(self):
+        """Cancel reservations and give their consumed minutes back to capacity."""
+        for rec in self.filtered(lambda r: r.dispatch_state != "cancelled"):
+            rec._release_capacity()
+            if rec.dispatch_state == "finalized" and rec.task_id.fsm_booking_id:
+                rec.task_id.fsm_booking_id.sudo().action_cancel()
+            rec.write({"dispatch_state": "cancelled"})
+        return True
+
+    def unlink(self):
+        released = self._release_capacity()
+        bookings = released.task_id.fsm_booking_id
+        res = super().unlink()
+        # Their bookings now hold the minutes the reservations consumed.
+        bookings.sudo()._sync_capacity_hold()
+        return res
@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import logging
 from datetime import datetime, time, timedelta
+from time import perf_counter
 
 from odoo import api, fields, models, _
 
+from .fsm_dispatch_run import DISPATCH_SKIP_REASONS
+
+_logger = logging.getLogger(__name__)
+
+# First key of the two-key advisory locks that serialize dispatch per team.
+_TEAM_LOCK_NAMESPACE = 0x46534D44
+
 
 def _float_hour_to_time(hour_float):
     hour = int(hour_float)
@@ -10,12 +22,47 @@ def _float_hour_to_time(hour_float):
     return time(hour, minute)
 
 
+class _DispatchStats:
+    """Accumulate wall time and SQL query counts per dispatch phase."""
+
+    PHASES = ("load", "plan", "commit", "stock")
+
+    def __init__(self, cr):
+        self.cr = cr
+        self.started = perf_counter()
+        self.durations = dict.fromkeys(self.PHASES, 0.0)
+        self.queries = dict.fromkeys(self.PHASES, 0)
+
+    def elapsed(self):
+        return perf_counter() - self.started
+
+    def merge(self, durations, queries):
+        """Add the phase totals reported by a worker."""
+        for name in self.PHASES:
+            self.durations[name] += durations.get(name, 0.0)
+            self.queries[name] += queries.get(name, 0)
+
+    def _query_count(self):
+        return getattr(self.cr, "sql_log_count", 0)
+
+    @contextmanager
+    def phase(self, name):
+        started = perf_counter()
+        queries = self._query_count()
+        try:
+            yield
+        finally:
+            self.durations[name] += perf_counter() - started
+            self.queries[name] += self._query_count() - queries
+
+
 class FsmDispatchPlanner(models.TransientModel):
     _name = "fsm.dispatch.planner"
     _description = "FSM Dispatch Planner"
 
     run_date = fields.Date(string="Run Date", default=lambda self: fields.Date.context_today(self) + timedelta(days=1))
     result_message = fields.Text(string="Results", readonly=True)
+    run_id = fields.Many2one("fsm.dispatch.run", string="Run History", readonly=True)
 
     @api.model
     def _skill_rank(self, skill):
@@ -118,79 +165,346 @@ class FsmDispatchPlanner(models.TransientModel):
         return candidates.filtered(lambda t: t.active and self._skill_rank(t.skill_level) >= self._skill_rank(needed))
 
     @api.model
-    def _schedule_time(self, team_id, cap_by_team, cursor_map, required_minutes):
+    def _schedule_time(self, team_id, cap_by_team, cursor_map, required_minutes, resume=False):
+        """Place the next job of a team; with ``resume`` start after its finalized work.
+
+        Zone workers resume so they do not overlap jobs committed by other
+        workers for the same team. Serial runs keep starting from the shift
+        start.
+        """
         cap = cap_by_team.get(team_id)
         if not cap:
             return (False, False)
         start = cursor_map.get(team_id)
         if not start:
             start = self._default_start_time(cap["day"])
+            if resume:
+                last_end = self._team_dispatched_until(team_id, cap["day"].date)
+                if last_end and last_end > start:
+                    start = last_end
         end = start + timedelta(minutes=required_minutes)
         cursor_map[team_id] = end
         return (start, end)
 
-    def action_plan(self):
-        target_date = self._target_date(self.run_date)
-        reservations = self._reservations_for_date(target_date)
-        if not reservations:
-            self.result_message = _("No pending reservations for %s") % target_date
-            return True
+    @api.model
+    def _team_dispatched_until(self, team_id, service_date):
+        self.env["fsm.day.reservation"].flush_model(
+            ["assigned_team_id", "assigned_end_datetime", "service_date", "dispatch_state"]
+        )
+        self.env.cr.execute("""
+            SELECT MAX(assigned_end_datetime)
+              FROM fsm_day_reservation
+             WHERE assigned_team_id = %s
+               AND service_date = %s
+               AND dispatch_state = 'finalized'
+        """, [team_id, service_date])
+        return self.env.cr.fetchone()[0]
 
-        cap_by_team = self._load_capacity(target_date)
-        cursor_map = {}
-        assigned = []
-        skipped = []
+    @api.model
+    def _parallel_worker_count(self):
+        """Number of zone workers; 0 or 1 keeps the serial single-transaction run.
 
-        # Group by zone (same-zone processed together)
+        Workers commit as they go, starting with the caller's transaction, so
+        only the scheduled run uses them; a run from the button stays serial.
+        """
+        if self.env.registry.in_test_mode() or self.env.context.get("fsm_dispatch_trigger") != "cron":
+            return 1
+        return max(self.env["fsm.settings"]._get("dispatch_parallel_workers"), 1)
+
+    @contextmanager
+    def _team_dispatch_lock(self, team_id, enabled=True):
+        """Serialize commits for one team across zone workers.
+
+        A session-level advisory lock is taken and the transaction is committed
+        straight away, so the work done under the lock runs on a snapshot that
+        already includes everything other workers committed for the team.
+        """
+        if not enabled:
+            yield
+            return
+        cr = self.env.cr
+        cr.execute("SELECT pg_advisory_lock(%s, %s)", [_TEAM_LOCK_NAMESPACE, team_id])
+        try:
+            cr.commit()
+            self.env.invalidate_all()
+            try:
+                yield
+            except Exception:
+                cr.rollback()
+                raise
+            cr.commit()
+        finally:
+            cr.execute("SELECT pg_advisory_unlock(%s, %s)", [_TEAM_LOCK_NAMESPACE, team_id])
+            cr.commit()
+
+    @api.model
+    def _zone_batches(self, reservations):
+        """Split reservations by zone, each ordered by priority high to low."""
         zones = sorted(set(reservations.mapped(lambda r: r.zone or r.task_id.fsm_service_zone_name or "")))
+        batches = []
         for zone in zones:
             zone_res = reservations.filtered(lambda r, z=zone: (r.zone or r.task_id.fsm_service_zone_name or "") == z)
             # Priority high to low, stable tie on id
-            zone_res = zone_res.sorted(key=lambda r: (int(r.priority or 3) * -1, r.id))
-            for res in zone_res:
+            batches.append(zone_res.sorted(key=lambda r: (int(r.priority or 3) * -1, r.id)))
+        return batches
+
+    @api.model
+    def _dispatch_reservations(self, reservations, cap_by_team, stats, isolated=False):
+        """Assign ordered reservations to teams and consume their capacity.
+
+        With ``isolated`` every assignment is committed on its own under the
+        chosen team's advisory lock; zone workers rely on it to share teams.
+        Returns ``(assigned, skipped, dispatched_minutes)``.
+        """
+        ledger = self.env["fsm.capacity.ledger"]
+        # Stock is reserved after every assignment is committed so its cost is
+        # measured separately from the planning and commit phases.
+        finalize_ctx = dict(self.env.context, fsm_defer_delivery=True)
+        dispatched_minutes = Counter()
+        cursor_map = {}
+        assigned = []
+        skipped = []
+        for res in reservations:
+            with stats.phase("plan"):
                 required_minutes = res.required_minutes or 0
                 if required_minutes <= 0:
-                    skipped.append((res, "Required minutes missing"))
+                    skipped.append((res, "missing_minutes"))
                     continue
                 bucket = res.capacity_bucket or (res.task_type_id.skill_level if res.task_type_id else "L1")
                 res.capacity_bucket = bucket
                 candidates = self._candidate_teams(res)
                 if not candidates:
-                    skipped.append((res, "No capable team"))
+                    skipped.append((res, "no_team"))
                     continue
                 team_id, used_bucket = self._score_candidates(res, candidates, cap_by_team, required_minutes)
                 if not team_id:
-                    skipped.append((res, "No capacity available"))
+                    skipped.append((res, "no_capacity"))
                     continue
-                start_dt, end_dt = self._schedule_time(team_id, cap_by_team, cursor_map, required_minutes)
+
+            with stats.phase("commit"), self._team_dispatch_lock(team_id, enabled=isolated):
+                if isolated:
+                    # Other workers may have scheduled this team since our last look.
+                    cursor_map.pop(team_id, None)
+                start_dt, end_dt = self._schedule_time(
+                    team_id, cap_by_team, cursor_map, required_minutes, resume=isolated
+                )
                 if not start_dt or not end_dt:
-                    skipped.append((res, "Could not schedule time"))
+                    skipped.append((res, "no_time"))
                     continue
 
-                # Update reservation and finalize (creates booking + delivery)
+                # Consume capacity first: another worker or a manual edit may
+                # have taken these minutes since the capacity was loaded.
+                line = cap_by_team[team_id]["buckets"].get(used_bucket or bucket)
+                if not ledger.consume(line, required_minutes):
+                    cursor_map[team_id] = start_dt
+                    skipped.append((res, "no_capacity"))
+                    continue
+                dispatched_minutes[line.id] += required_minutes
+
+                # Update reservation and finalize (creates booking; delivery is deferred)
                 res.write({
                     "capacity_bucket": used_bucket or res.capacity_bucket,
                     "assigned_team_id": team_id,
                     "assigned_start_datetime": start_dt,
                     "assigned_end_datetime": end_dt,
+                    "capacity_line_id": line.id,
+                    "capacity_consumed_minutes": required_minutes,
                 })
-                res.action_finalize_dispatch()
-
-                # Update capacity counters
-                day = cap_by_team[team_id]["day"]
-                line = cap_by_team[team_id]["buckets"].get(used_bucket or bucket)
-                if line:
-                    line.available_minutes = max(0, (line.available_minutes or 0) - required_minutes)
-                day.booked_minutes = (day.booked_minutes or 0) + required_minutes
+                res.with_context(finalize_ctx).action_finalize_dispatch()
                 assigned.append(res)
+        return assigned, skipped, dispatched_minutes
+
+    def _dispatch_zone_job(self, target_date, reservation_ids):
+        """Worker entry point: dispatch one zone with its own cursor."""
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            planner = env[self._name]
+            stats = _DispatchStats(cr)
+            with stats.phase("load"):
+                reservations = env["fsm.day.reservation"].browse(reservation_ids).filtered(
+                    lambda r: r.dispatch_state == "pending"
+                )
+                cap_by_team = planner._load_capacity(target_date)
+            assigned, skipped, dispatched_minutes = planner._dispatch_reservations(
+                reservations, cap_by_team, stats, isolated=True
+            )
+            return {
+                "assigned": [res.id for res in assigned],
+                "skipped": [(res.id, reason) for res, reason in skipped],
+                "dispatched": dict(dispatched_minutes),
+                "durations": stats.durations,
+                "queries": stats.queries,
+            }
+
+    @api.model
+    def _batch_zone(self, batch):
+        first = batch[:1]
+        return first.zone or first.task_id.fsm_service_zone_name or ""
+
+    def _dispatch_parallel(self, target_date, batches, stats, worker_count):
+        """Run zone batches through a worker pool and merge their results.
+
+        A failing worker only rolls back its own uncommitted assignment; the
+        zones it names are returned so the run can be recorded as partial.
+        """
+        # Workers use their own cursors: publish the pending state first.
+        self.env.cr.commit()
+        results = []
+        with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="fsm_dispatch") as pool:
+            futures = [
+                (self._batch_zone(batch), pool.submit(self._dispatch_zone_job, target_date, batch.ids))
+                for batch in batches
+            ]
+            for zone, future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as error:
+                    _logger.exception("Dispatch worker for zone %r on %s failed", zone, target_date)
+                    results.append({"zone": zone, "error": str(error) or error.__class__.__name__})
+        # The workers committed; drop everything cached from the old snapshot.
+        self.env.invalidate_all()
+        assigned, skipped, dispatched_minutes, failed_zones = self._merge_zone_results(results, stats)
+        _logger.info(
+            "Parallel dispatch for %s: %s zones on %s workers, %s assigned, %s skipped, %s failed",
+            target_date, len(batches), worker_count, len(assigned), len(skipped), len(failed_zones),
+        )
+        return assigned, skipped, dispatched_minutes, failed_zones
+
+    def _merge_zone_results(self, results, stats):
+        """Combine zone worker results; failed workers report ``zone`` and ``error``."""
+        Reservation = self.env["fsm.day.reservation"]
+        assigned = []
+        skipped = []
+        dispatched_minutes = Counter()
+        failed_zones = []
+        for result in results:
+            if "error" in result:
+                failed_zones.append((result["zone"], result["error"]))
+                continue
+            stats.merge(result["durations"], result["queries"])
+            assigned.extend(Reservation.browse(result["assigned"]))
+            skipped.extend((Reservation.browse(res_id), reason) for res_id, reason in result["skipped"])
+            dispatched_minutes.update(result["dispatched"])
+        return assigned, skipped, dispatched_minutes, failed_zones
+
+    @api.model
+    def _capacity_lines(self, cap_by_team):
+        for team_id, cap in cap_by_team.items():
+            for bucket, line in cap["buckets"].items():
+                yield team_id, cap["day"], bucket, line
+
+    def _record_run(self, target_date, started_at, stats, reservations, assigned, skipped, cap_by_team, available_before, dispatched_minutes, message, worker_count=1, state="done", failed_zones=()):
+        """Persist the outcome of a planner run so it survives transient vacuuming."""
+        utilization_commands = []
+        for team_id, day, bucket, line in self._capacity_lines(cap_by_team):
+            sellable = line.sellable_minutes or 0
+            available_after = line.available_minutes or 0
+            utilization_commands.append((0, 0, {
+                "team_id": team_id,
+                "capacity_day_id": day.id,
+                "bucket_skill_level": bucket,
+                "sellable_minutes": sellable,
+                "available_before_minutes": available_before.get(line.id, 0),
+                "available_after_minutes": available_after,
+                "dispatched_minutes": dispatched_minutes.get(line.id, 0),
+                "utilization": (100.0 * (sellable - available_after) / sellable) if sellable else 0.0,
+            }))
+        skip_commands = [
+            (0, 0, {
+                "reservation_id": res.id,
+                "reason": reason,
+                "capacity_bucket": res.capacity_bucket,
+                "zone": res.zone or res.task_id.fsm_service_zone_name or False,
+            })
+            for res, reason in skipped
+        ]
+        return self.env["fsm.dispatch.run"].sudo().create({
+            "trigger": self.env.context.get("fsm_dispatch_trigger") or "manual",
+            "state": state,
+            "failed_zones": ", ".join(zone or _("No Zone") for zone, _error in failed_zones) or False,
+            "target_date": target_date,
+            "started_at": started_at,
+            "worker_count": worker_count,
+            "duration_load": stats.durations["load"],
+            "duration_plan": stats.durations["plan"],
+            "duration_commit": stats.durations["commit"],
+            "duration_stock": stats.durations["stock"],
+            "duration_total": stats.elapsed(),
+            "query_count_load": stats.queries["load"],
+            "query_count_plan": stats.queries["plan"],
+            "query_count_commit": stats.queries["commit"],
+            "query_count_stock": stats.queries["stock"],
+            "query_count_total": sum(stats.queries.values()),
+            "reservation_count": len(reservations),
+            "assigned_count": len(assigned),
+            "skipped_count": len(skipped),
+            "result_message": message,
+            "skip_ids": skip_commands,
+            "utilization_ids": utilization_commands,
+        })
+
+    def action_plan(self):
+        target_date = self._target_date(self.run_date)
+        started_at = fields.Datetime.now()
+        stats = _DispatchStats(self.env.cr)
+        with stats.phase("load"):
+            reservations = self._reservations_for_date(target_date)
+            cap_by_team = self._load_capacity(target_date) if reservations else {}
+        available_before = {
+            line.id: line.available_minutes or 0
+            for _team_id, _day, _bucket, line in self._capacity_lines(cap_by_team)
+        }
+        skip_labels = dict(DISPATCH_SKIP_REASONS)
+
+        if not reservations:
+            self.result_message = _("No pending reservations for %s") % target_date
+            self.run_id = self._record_run(
+                target_date, started_at, stats, reservations, [], [],
+                cap_by_team, available_before, Counter(), self.result_message,
+            )
+            return True
+
+        # Group by zone (same-zone processed together)
+        with stats.phase("plan"):
+            batches = self._zone_batches(reservations)
+        worker_count = min(self._parallel_worker_count(), len(batches))
+        failed_zones = []
+        if worker_count > 1:
+            assigned, skipped, dispatched_minutes, failed_zones = self._dispatch_parallel(
+                target_date, batches, stats, worker_count
+            )
+        else:
+            ordered = self.env["fsm.day.reservation"].concat(*batches)
+            assigned, skipped, dispatched_minutes = self._dispatch_reservations(
+                ordered, cap_by_team, stats
+            )
+
+        with stats.phase("stock"):
+            bookings = self.env["fsm.booking"]
+            for res in assigned:
+                bookings |= res.task_id.fsm_booking_id
+            bookings.action_create_or_update_delivery()
 
         msg = _("Assigned %s reservations; %s skipped") % (len(assigned), len(skipped))
         if skipped:
-            from collections import Counter
-            reasons = Counter(reason for _, reason in skipped)
-            reason_lines = "; ".join("%s × %s" % (count, reason) for reason, count in reasons.most_common())
+            reasons = Counter(reason for _res, reason in skipped)
+            reason_lines = "; ".join("%s × %s" % (count, skip_labels[reason]) for reason, count in reasons.most_common())
             msg += "\nSkip reasons: " + reason_lines
+        if failed_zones:
+            msg += "\n" + _("Failed zones: %s") % "; ".join(
+                "%s: %s" % (zone or _("No Zone"), error) for zone, error in failed_zones
+            )
         self.result_message = msg
+        state = "done"
+        if failed_zones:
+            state = "failed" if len(failed_zones) == len(batches) else "partial"
+        self.run_id = self._record_run(
+            target_date, started_at, stats, reservations, assigned, skipped,
+            cap_by_team, available_before, dispatched_minutes, msg,
+            worker_count=max(worker_count, 1),
+            state=state,
+            failed_zones=failed_zones,
+        )
         return {
             "type": "ir.actions.act_window",
             "res_model": "fsm.dispatch.planner",
@@ -202,5 +516,5 @@ class FsmDispatchPlanner(models.TransientModel):
     @api.model
     def cron_run(self):
         planner = self.create({"run_date": fields.Date.context_today(self) + timedelta(days=1)})
-        planner.action_plan()
+        planner.with_context(fsm_dispatch_trigger="cron").action_plan()
         return True
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models, _
+
+
+DISPATCH_SKIP_REASONS = [
+    ("missing_minutes", "Required minutes missing"),
+    ("no_team", "No capable team"),
+    ("no_capacity", "No capacity available"),
+    ("no_time", "Could not schedule time"),
+]
+
+
+class FsmDispatchRun(models.Model):
+    _name = "fsm.dispatch.run"
+    _description = "FSM Dispatch Run"
+    _order = "started_at desc, id desc"
+
+    name = fields.Char(string="Label", compute="_compute_name", store=True)
+    trigger = fields.Selection(
+        [
+            ("manual", "Manual"),
+            ("cron", "Scheduled"),
+        ],
+        string="Trigger",
+        default="manual",
+        required=True,
+    )
+    target_date = fields.Date(string="Target Date", required=True, index=True)
+    started_at = fields.Datetime(string="Started", default=fields.Datetime.now, required=True)
+    user_id = fields.Many2one("res.users", string="Run By", default=lambda self: self.env.user, ondelete="set null")
+    worker_count = fields.Integer(string="Zone Workers", default=1, help="Parallel zone workers used; 1 means a serial run.")
+    state = fields.Selection(
+        [
+            ("done", "Done"),
+            ("partial", "Partially Failed"),
+            ("failed", "Failed"),
+        ],
+        string="Status",
+        default="done",
+        required=True,
+        help="Partially failed: some zone workers raised; the assignments of the other zones were committed.",
+    )
+    failed_zones = fields.Char(string="Failed Zones", readonly=True)
+
+    duration_load = fields.Float(string="Load (s)", digits=(16, 3), group_operator="avg")
+    duration_plan = fields.Float(string="Plan (s)", digits=(16, 3), group_operator="avg")
+    duration_commit = fields.Float(string="Commit (s)", digits=(16, 3), group_operator="avg")
+    duration_stock = fields.Float(string="Stock Reservation (s)", digits=(16, 3), group_operator="avg")
+    duration_total = fields.Float(string="Total (s)", digits=(16, 3), group_operator="avg")
+
+    query_count_load = fields.Integer(string="Load Queries", group_operator="avg")
+    query_count_plan = fields.Integer(string="Plan Queries", group_operator="avg")
+    query_count_commit = fields.Integer(string="Commit Queries", group_operator="avg")
+    query_count_stock = fields.Integer(string="Stock Queries", group_operator="avg")
+    query_count_total = fields.Integer(string="Total Queries", group_operator="avg")
+
+    reservation_count = fields.Integer(string="Pending Reservations")
+    assigned_count = fields.Integer(string="Assigned")
+    skipped_count = fields.Integer(string="Skipped")
+    result_message = fields.Text(string="Results", readonly=True)
+
+    skip_ids = fields.One2many("fsm.dispatch.run.skip", "run_id", string="Skipped Reservations")
+    utilization_ids = fields.One2many("fsm.dispatch.run.utilization", "run_id", string="Capacity Utilization")
+
+    @api.depends("target_date", "started_at")
+    def _compute_name(self):
+        for run in self:
+            started = fields.Datetime.to_string(run.started_at) if run.started_at else _("Not started")
+            run.name = _("Dispatch %s (%s)") % (run.target_date or _("No Date"), started)
+
+
+class FsmDispatchRunSkip(models.Model):
+    _name = "fsm.dispatch.run.skip"
+    _description = "FSM Dispatch Run Skipped Reservation"
+    _order = "run_id, id"
+
+    run_id = fields.Many2one("fsm.dispatch.run", required=True, ondelete="cascade", index=True)
+    reservation_id = fields.Many2one("fsm.day.reservation", string="Reservation", ondelete="set null")
+    reason = fields.Selection(DISPATCH_SKIP_REASONS, string="Reason", required=True)
+    target_date = fields.Date(related="run_id.target_date", store=True)
+    capacity_bucket = fields.Selection(
+        [
+            ("L1", "Basic (L1)"),
+            ("L2", "Standard (L2)"),
+            ("L3", "Fiber (L3)"),
+        ],
+        string="Capacity Bucket",
+    )
+    zone = fields.Char(string="Zone")
+    skip_count = fields.Integer(string="Skipped", default=1, readonly=True)
+
+
+class FsmDispatchRunUtilization(models.Model):
+    _name = "fsm.dispatch.run.utilization"
+    _description = "FSM Dispatch Run Capacity Utilization"
+    _order = "run_id, team_id, bucket_skill_level"
+
+    run_id = fields.Many2one("fsm.dispatch.run", required=True, ondelete="cascade", index=True)
+    target_date = fields.Date(related="run_id.target_date", store=True)
+    team_id = fields.Many2one("fsm.team", string="Team", ondelete="cascade")
+    capacity_day_id = fields.Many2one("fsm.capacity.day", string="Capacity Day", ondelete="set null")
+    bucket_skill_level = fields.Selection(
+        [
+            ("L1", "Basic (L1)"),
+            ("L2", "Standard (L2)"),
+            ("L3", "Fiber (L3)"),
+        ],
+        string="Capability Bucket",
+    )
+    sellable_minutes = fields.Integer(string="Sellable (min)")
+    available_before_minutes = fields.Integer(string="Available Before (min)")
+    available_after_minutes = fields.Integer(string="Available After (min)")
+    dispatched_minutes = fields.Integer(string="Dispatched (min)")
+    utilization = fields.Float(
+        string="Utilization (%)",
+        digits=(16, 2),
+        group_operator="avg",
+        help="Share of sellable minutes consumed once this run finished.",
+    )
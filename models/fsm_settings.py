@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models, tools
+from odoo.tools import frozendict
+
+
+def _parse_bool(value):
+    return str(value).strip().lower() in ("1", "true", "yes")
+
+
+def _parse_choice(*choices):
+    def parse(value):
+        if value not in choices:
+            raise ValueError(value)
+        return value
+    return parse
+
+
+def _parse_str(value):
+    value = str(value).strip()
+    if not value:
+        raise ValueError(value)
+    return value
+
+
+# Module settings stored as ``fsm_guided_intake.<name>`` parameters:
+# name -> (parser, default).
+FSM_SETTINGS = {
+    "availability_source": (_parse_choice("calendar", "planning"), "calendar"),
+    "slot_start_lead_minutes": (int, 0),
+    "slot_travel_buffer_minutes": (int, 0),
+    "auto_invoice_on_stage_done": (_parse_bool, False),
+    "invoice_stage_done_name": (_parse_str, "Done"),
+    "auto_invoice_batch_size": (int, 20),
+    "auto_invoice_time_budget_seconds": (float, 120.0),
+    "installation_task_type_id": (int, 0),
+    "cat6_cable_product_id": (int, 0),
+    "cat6_rj45_product_id": (int, 0),
+    "cat6_wall_jack_product_id": (int, 0),
+    "urgent_capacity_reserve_pct": (float, 0.0),
+    "protect_standard_to_basic_pct": (float, 0.25),
+    "protect_fiber_to_basic_pct": (float, 0.40),
+    "protect_fiber_to_standard_pct": (float, 0.40),
+    "capacity_forecast_enabled": (_parse_bool, False),
+    "capacity_forecast_history_weeks": (int, 12),
+    "capacity_forecast_smoothing": (float, 0.3),
+    "dispatch_parallel_workers": (int, 0),
+    "l3_capacity_reserve_hours": (float, 0.0),
+    "shift_sync_horizon_weeks": (int, 8),
+    "shift_sync_time_budget_seconds": (float, 90.0),
+}
+
+
+class FsmSettings(models.AbstractModel):
+    _name = "fsm.settings"
+    _description = "FSM Guided Intake Settings"
+
+    @api.model
+    @tools.ormcache()
+    def _values(self):
+        """Parse every module parameter once per registry.
+
+        ``ir.config_parameter`` clears the registry cache whenever a parameter
+        is created, written or deleted, which covers ``set_param`` and saving
+        ``res.config.settings``. Unparsable values fall back to the default.
+        """
+        icp = self.env["ir.config_parameter"].sudo()
+        values = {}
+        for name, (parse, default) in FSM_SETTINGS.items():
+            raw = icp.get_param("fsm_guided_intake.%s" % name)
+            if raw in (None, False, ""):
+                values[name] = default
+                continue
+            try:
+                values[name] = parse(raw)
+            except (TypeError, ValueError):
+                values[name] = default
+        return frozendict(values)
+
+    @api.model
+    def _get(self, name):
+        return self._values()[name]
@@ -2,10 +2,10 @@
 # -*- coding: utf-8 -*-
 
 from odoo import api, fields, models
+from odoo.osv import expression
 from datetime import datetime, timedelta, time
 import pytz
 import logging  
-import unicodedata
 _logger = logging.getLogger(__name__)
 
 
@@ -61,6 +61,10 @@ class FsmSlotEngine(models.AbstractModel):
     def _tz_name(self):
         return self.env.context.get("tz") or self.env.user.tz or "America/El_Salvador"
 
+    def _company_tz_name(self):
+        """Timezone of the local dates stored for all users, e.g. crew windows."""
+        return self.env.company.partner_id.tz or "America/El_Salvador"
+
     def _to_utc_naive(self, dt_local_naive):
         if not dt_local_naive:
             return dt_local_naive
@@ -120,10 +124,7 @@ class FsmSlotEngine(models.AbstractModel):
 
     # ---- Calendars / working windows ----
     def _availability_source(self):
-        source = self.env["ir.config_parameter"].sudo().get_param(
-            "fsm_guided_intake.availability_source", "calendar"
-        )
-        return source if source in {"calendar", "planning"} else "calendar"
+        return self.env["fsm.settings"]._get("availability_source")
 
     def _get_calendar_for_team(self, team):
         return (
@@ -341,13 +342,9 @@ class FsmSlotEngine(models.AbstractModel):
 
     # ---- Busy intervals from tasks (team-first with fallback to user overlap) ----
     def _get_team_users(self, team):
-        users = self.env["res.users"]
-        if team.lead_user_id:
-            users |= team.lead_user_id
-        # member_ids is typically fsm.team.member -> user_id
-        member_users = team.member_ids.mapped("user_id").filtered(lambda u: u)
-        users |= member_users
-        return users
+        if not team:
+            return self.env["res.users"]
+        return self.env["res.users"].browse(team._fsm_roster_user_ids())
 
     def _task_fields(self):
         Task = self.env["project.task"]
@@ -394,48 +391,39 @@ class FsmSlotEngine(models.AbstractModel):
     ):
         """
         Returns dict: team_id -> list[(busy_start_utc, busy_end_utc)] (UTC naive).
-        Busy is derived from scheduled, non-final tasks using either planned_* or date_* fields.
+        Busy is derived from scheduled, non-final tasks through their stored
+        ``fsm_busy_start``/``fsm_busy_end`` bounds.
         """
         Task, start_fields, end_fields, team_field = self._task_fields()
         if not start_fields:
             return {t.id: [] for t in teams}
 
-        travel_mins = int(
-            self.env["ir.config_parameter"].sudo().get_param(
-                "fsm_guided_intake.slot_travel_buffer_minutes", "0"
-            ) or 0
-        )
+        travel_mins = self.env["fsm.settings"]._get("slot_travel_buffer_minutes")
         buffer_before = timedelta(minutes=(buffer_before_mins or 0) + travel_mins)
         buffer_after = timedelta(minutes=(buffer_after_mins or 0) + travel_mins)
 
-        # Build a “fallback user set” across all teams
-        team_users_map = {t.id: self._get_team_users(t) for t in teams}
-        all_users = self.env["res.users"].browse([])
-        for u in team_users_map.values():
-            all_users |= u
-
-        # ---- Domain: start in any start_field < window_end_utc ----
-        # OR-chain: (planned_date_begin < end) OR (date_start < end)
-        start_dom = []
-        for f in start_fields:
-            start_dom = (["|"] + start_dom if start_dom else []) + [(f, "<", window_end_utc)]
-
-        domain = start_dom
-
-        # ---- Domain: overlaps window start (end missing OR end > window_start_utc) ----
-        # end_false_dom: (planned_end = False) OR (date_end = False)
-        # end_gt_dom:    (planned_end > start) OR (date_end > start)
-        if end_fields:
-            end_false_dom = []
-            for f in end_fields:
-                end_false_dom = (["|"] + end_false_dom if end_false_dom else []) + [(f, "=", False)]
-
-            end_gt_dom = []
-            for f in end_fields:
-                end_gt_dom = (["|"] + end_gt_dom if end_gt_dom else []) + [(f, ">", window_start_utc)]
-
-            domain += ["|"] + end_false_dom + end_gt_dom
-
+        # Assignees fall back to the teams they are rostered on.
+        user_ids_by_team, team_ids_by_user = self.env["fsm.team"]._fsm_roster_user_index()
+        all_users = self.env["res.users"].browse(sorted({
+            user_id for team_id in teams.ids for user_id in user_ids_by_team.get(team_id, ())
+        }))
+
+        # Stored effective bounds keep this a plain range predicate on the
+        # (team_id, fsm_busy_start, fsm_busy_end) index.
+        domain = [
+            ("fsm_blocks_availability", "=", True),
+            ("fsm_busy_start", "<", window_end_utc),
+            ("fsm_busy_end", ">", window_start_utc),
+        ]
+        owner_domains = []
+        if team_field:
+            owner_domains.append([(team_field, "in", teams.ids)])
+        if all_users and "user_ids" in Task._fields:
+            owner_domains.append([("user_ids", "in", all_users.ids)])
+        if all_users and "user_id" in Task._fields:
+            owner_domains.append([("user_id", "in", all_users.ids)])
+        if owner_domains:
+            domain = expression.AND([domain, expression.OR(owner_domains)])
         if exclude_task_id:
             domain += [("id", "!=", exclude_task_id)]
 
@@ -453,30 +441,25 @@ class FsmSlotEngine(models.AbstractModel):
         busy = {t.id: [] for t in teams}
 
         for task in tasks:
-            if not self._slot_task_blocks_availability(task):
-                continue
-
-            start_utc, end_utc = self._task_interval_utc(task, start_fields, end_fields, default_hours=1.0)
-            if not start_utc or not end_utc:
-                continue
+            start_utc, end_utc = task.fsm_busy_start, task.fsm_busy_end
 
             b_start = start_utc - buffer_before
             b_end = end_utc + buffer_after
 
-            assigned_team_ids = []
+            assigned_team_ids = set()
 
             if team_field and getattr(task, "team_id", False):
-                assigned_team_ids.append(task.team_id.id)
-            if all_users and "user_ids" in Task._fields and task.user_ids:
-                for t in teams:
-                    if task.user_ids & team_users_map.get(t.id, self.env["res.users"]):
-                        assigned_team_ids.append(t.id)
-            if all_users and "user_id" in Task._fields and task.user_id:
-                for t in teams:
-                    if task.user_id in team_users_map.get(t.id, self.env["res.users"]):
-                        assigned_team_ids.append(t.id)
-
-            for tid in set(assigned_team_ids):
+                assigned_team_ids.add(task.team_id.id)
+            if all_users:
+                task_user_ids = []
+                if "user_ids" in Task._fields:
+                    task_user_ids += task.user_ids.ids
+                if "user_id" in Task._fields and task.user_id:
+                    task_user_ids.append(task.user_id.id)
+                for user_id in task_user_ids:
+                    assigned_team_ids.update(team_ids_by_user.get(user_id, ()))
+
+            for tid in assigned_team_ids:
                 if tid not in busy:
                     # Skip tasks assigned to teams outside the requested set
                     continue
@@ -487,58 +470,12 @@ class FsmSlotEngine(models.AbstractModel):
 
         return busy
 
-    def _normalize_stage_name(self, stage):
-        text = unicodedata.normalize("NFKD", stage.name or "")
-        return "".join(ch for ch in text if not unicodedata.combining(ch)).strip().lower()
-
     def _slot_task_blocks_availability(self, task):
         """Return whether a scheduled task consumes team availability.
 
-        Explicit operational status is authoritative.  A stage can be stale
-        after a task is put back on the schedule, so a folded/closed-looking
-        stage must not release capacity while the task is still active,
-        current, and explicitly not done or cancelled.
+        Resolved by the stored ``project.task.fsm_blocks_availability``.
         """
-        if "active" in task._fields and not task.active:
-            return False
-        if (
-            "fsm_rescheduled_to_task_id" in task._fields
-            and task.fsm_rescheduled_to_task_id
-        ):
-            return False
-        if "fsm_done" in task._fields and task.fsm_done:
-            return False
-
-        terminal_states = {"1_done", "1_canceled"}
-        state = task.state if "state" in task._fields else False
-        if state in terminal_states:
-            return False
-
-        # When operational status fields exist and say the task is open, they
-        # take precedence over a stale folded/completed stage.
-        has_explicit_open_status = (
-            ("fsm_done" in task._fields and not task.fsm_done)
-            or ("state" in task._fields and state and state not in terminal_states)
-        )
-        if has_explicit_open_status:
-            return True
-
-        stage = task.stage_id
-        if not stage:
-            return True
-        if getattr(stage, "fold", False):
-            return False
-        name = self._normalize_stage_name(stage)
-        non_blocking_tokens = (
-            "cancel",
-            "closed",
-            "complet",
-            "cerrad",
-            "done",
-            "finaliz",
-            "hecho",
-        )
-        return not any(token in name for token in non_blocking_tokens)
+        return task.fsm_blocks_availability
 
 
     # ---- Public API: compute slots ----
@@ -590,7 +527,7 @@ class FsmSlotEngine(models.AbstractModel):
         planning_windows_by_team_day = None
         if self._availability_source() == "planning":
             planning_windows_by_team_day = (
-                self._planning_work_windows_by_team_day_local(
+                self.env["fsm.crew.window"]._windows_by_team_day(
                     teams, start_dt_local, search_end_local
                 )
             )
@@ -4,7 +4,7 @@ import logging
 
 import pytz
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import ValidationError
 
 
@@ -59,16 +59,79 @@ class FsmTeam(models.Model):
                 employees |= team.lead_user_id.employee_id
         return employees
 
-    def _fsm_planning_team_for_employee(self, employee):
-        """Resolve the employee's current legacy team for bridge propagation."""
-        teams = self.search([
-            ("active", "=", True),
-            "|",
-            ("member_ids", "in", employee.id),
-            ("lead_user_id.employee_id", "=", employee.id),
-        ])
-        preferred = teams & self
-        return preferred[:1] or teams[:1]
+    @api.model
+    @tools.ormcache()
+    def _fsm_roster_user_index(self):
+        """Return ``(user ids by team id, team ids by user id)`` over every team's lead and members.
+
+        Cached per registry and cleared on roster changes; values are tuples
+        and frozensets of ids, never records.
+        """
+        user_ids_by_team = {}
+        team_ids_by_user = {}
+        for team in self.sudo().search([("active", "in", [True, False])]):
+            users = team.lead_user_id | team.member_ids.user_id
+            user_ids_by_team[team.id] = tuple(users.ids)
+            for user_id in users.ids:
+                team_ids_by_user.setdefault(user_id, set()).add(team.id)
+        return user_ids_by_team, {user_id: frozenset(team_ids) for user_id, team_ids in team_ids_by_user.items()}
+
+    def _fsm_roster_user_ids(self):
+        """Lead and member user ids of the team, read from the cached roster index."""
+        self.ensure_one()
+        if not self._origin:
+            # Unsaved team: its roster only exists in memory.
+            return (self.lead_user_id | self.member_ids.user_id).ids
+        return list(self._fsm_roster_user_index()[0].get(self._origin.id, ()))
+
+    def _fsm_planning_team_by_employee(self, employees):
+        """Resolve each employee's current legacy team for bridge propagation.
+
+        Returns ``{employee_id: team}`` from a single query. Teams in ``self``
+        win over other teams of the employee; ties go to the team name order.
+        Employees without an active team are absent from the result.
+        """
+        if not employees:
+            return {}
+        members = self._fields["member_ids"]
+        self.flush_model(["active", "name", "member_ids", "lead_user_id"])
+        self.env["hr.employee"].flush_model(["user_id", "company_id"])
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT ON (roster.employee_id) roster.employee_id, roster.team_id
+              FROM (
+                SELECT rel.{employee_col} AS employee_id, team.id AS team_id, team.name
+                  FROM fsm_team team
+                  JOIN {relation} rel ON rel.{team_col} = team.id
+                 WHERE team.active
+                   AND rel.{employee_col} = ANY(%(employee_ids)s)
+                 UNION
+                SELECT employee.id, team.id, team.name
+                  FROM fsm_team team
+                  JOIN hr_employee employee ON employee.user_id = team.lead_user_id
+                 WHERE team.active
+                   AND employee.company_id = %(company_id)s
+                   AND employee.id = ANY(%(employee_ids)s)
+              ) roster
+             ORDER BY roster.employee_id,
+                      roster.team_id = ANY(%(preferred_ids)s) DESC,
+                      roster.name,
+                      roster.team_id
+            """.format(
+                relation=members.relation,
+                team_col=members.column1,
+                employee_col=members.column2,
+            ),
+            {
+                "employee_ids": employees.ids,
+                "preferred_ids": self.ids,
+                "company_id": self.env.company.id,
+            },
+        )
+        return {
+            employee_id: self.browse(team_id)
+            for employee_id, team_id in self.env.cr.fetchall()
+        }
 
     def _fsm_sync_impacted_planning_teams(self, employees, effective_date=None):
         """Apply a static roster edit to Planning from its effective date.
@@ -101,22 +164,26 @@ class FsmTeam(models.Model):
             datetime.combine(effective_date, time.min)
         ).astimezone(pytz.UTC).replace(tzinfo=None)
 
+        team_by_employee = self._fsm_planning_team_by_employee(employees)
+        employee_by_resource = {employee.resource_id.id: employee.id for employee in employees}
+        slots = self.env["planning.slot"].sudo().search([
+            ("resource_id", "in", list(employee_by_resource)),
+            ("role_id", "=", role.id),
+            ("end_datetime", ">", effective_start_utc),
+        ])
+        no_team = self.browse()
+        to_update = {}
+        for slot in slots:
+            target_team = team_by_employee.get(employee_by_resource[slot.resource_id.id], no_team)
+            if slot.fsm_team_id != target_team:
+                to_update.setdefault(target_team, []).append(slot.id)
+
         changed = 0
-        for employee in employees:
-            target_team = self._fsm_planning_team_for_employee(employee)
-            slots = self.env["planning.slot"].sudo().search([
-                ("resource_id", "=", employee.resource_id.id),
-                ("role_id", "=", role.id),
-                ("end_datetime", ">", effective_start_utc),
-            ])
-            to_update = slots.filtered(
-                lambda slot: slot.fsm_team_id != target_team
-            )
-            if to_update:
-                to_update.with_context(
-                    fsm_skip_team_planning_sync=True
-                ).write({"fsm_team_id": target_team.id or False})
-                changed += len(to_update)
+        for target_team, slot_ids in to_update.items():
+            self.env["planning.slot"].sudo().browse(slot_ids).with_context(
+                fsm_skip_team_planning_sync=True
+            ).write({"fsm_team_id": target_team.id or False})
+            changed += len(slot_ids)
         if changed:
             _logger.info(
                 "Updated %s technician Planning shift team assignments from %s",
@@ -128,10 +195,12 @@ class FsmTeam(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         teams = super().create(vals_list)
+        self.env.registry.clear_cache()
         if not self.env.context.get("fsm_skip_team_planning_sync"):
-            teams._fsm_sync_impacted_planning_teams(
-                teams._fsm_roster_employees()
-            )
+            employees = teams._fsm_roster_employees()
+            teams._fsm_sync_impacted_planning_teams(employees)
+            self.env["fsm.planning.dirty"].mark(employees, reason="team roster")
+        self.env["fsm.capacity.dirty"].mark(teams, reason="team")
         return teams
 
     def write(self, vals):
@@ -141,11 +210,35 @@ class FsmTeam(models.Model):
         )
         previous_employees = self._fsm_roster_employees() if sync_roster else self.env["hr.employee"]
         result = super().write(vals)
+        if {"member_ids", "lead_user_id"} & set(vals):
+            self.env.registry.clear_cache()
         if sync_roster:
             impacted_employees = previous_employees | self._fsm_roster_employees()
             self._fsm_sync_impacted_planning_teams(impacted_employees)
+            # Joining or leaving every active team adds or retires generated shifts.
+            self.env["fsm.planning.dirty"].mark(impacted_employees, reason="team roster")
+        capacity_fields = {"skill_level", "calendar_id", "lead_user_id", "active"}
+        if capacity_fields & set(vals):
+            self.env["fsm.capacity.dirty"].mark(self, reason="team")
         return result
 
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
+
+    @api.model
+    def _fsm_teams_for_calendars(self, calendars):
+        """Teams whose shift capacity derives from any of these calendars."""
+        if not calendars:
+            return self.browse()
+        return self.sudo().search([
+            ("active", "=", True),
+            "|",
+            ("calendar_id", "in", calendars.ids),
+            ("lead_user_id.employee_id.resource_calendar_id", "in", calendars.ids),
+        ])
+
     @api.depends("lead_user_id", "warehouse_id", "member_ids", "member_ids.name")
     def _compute_name(self):
         for team in self:
@@ -193,6 +286,24 @@ class FsmTeamShift(models.Model):
     capacity_hours = fields.Float(required=True, default=8.0,
                                   help="Total hours the team can perform during this shift.")
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        shifts = super().create(vals_list)
+        self.env["fsm.capacity.dirty"].mark(shifts.team_id, reason="shift")
+        return shifts
+
+    def write(self, vals):
+        teams = self.team_id
+        result = super().write(vals)
+        self.env["fsm.capacity.dirty"].mark(teams | self.team_id, reason="shift")
+        return result
+
+    def unlink(self):
+        teams = self.team_id
+        result = super().unlink()
+        self.env["fsm.capacity.dirty"].mark(teams.exists(), reason="shift")
+        return result
+
     @api.constrains("start_time", "end_time", "capacity_hours")
     def _check_shift(self):
         for rec in self:
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from odoo import models
+
+
+class HrEmployee(models.Model):
+    _inherit = "hr.employee"
+
+    def write(self, vals):
+        result = super().write(vals)
+        if {"user_id", "active"} & set(vals):
+            # Team rosters resolve members to users through the employee.
+            self.env.registry.clear_cache()
+        if "resource_calendar_id" in vals:
+            # A lead's calendar defines the shift capacity of the teams they lead.
+            teams = self.env["fsm.team"].sudo().search([
+                ("active", "=", True),
+                ("lead_user_id.employee_id", "in", self.ids),
+            ])
+            self.env["fsm.capacity.dirty"].mark(teams, reason="employee calendar")
+        if {"resource_calendar_id", "tz", "active"} & set(vals):
+            self.env["fsm.planning.dirty"].mark(self, reason="employee schedule")
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
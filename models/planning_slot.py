@@ -1,9 +1,26 @@
 # -*- coding: utf-8 -*-
+from bisect import bisect_right
 from datetime import datetime, time, timedelta
+from time import perf_counter
 
 import pytz
 
 from odoo import api, fields, models, _
+from odoo.tools import split_every
+
+
+# Shift fields that change the crew windows capacity is derived from.
+_FSM_CAPACITY_FIELDS = {
+    "state",
+    "start_datetime",
+    "end_datetime",
+    "fsm_team_id",
+    "resource_id",
+    "role_id",
+}
+
+# Progress of the chunked long-horizon shift synchronization.
+SHIFT_SYNC_EMPLOYEE_BATCH = 50
 
 
 class PlanningSlot(models.Model):
@@ -58,6 +75,77 @@ class PlanningSlot(models.Model):
     def _get_fields_breaking_publication(self):
         return super()._get_fields_breaking_publication() + ["fsm_team_id"]
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        slots = super().create(vals_list)
+        slots._fsm_crew_days_changed(slots._fsm_crew_ranges())
+        return slots
+
+    def write(self, vals):
+        if not _FSM_CAPACITY_FIELDS.intersection(vals):
+            return super().write(vals)
+        ranges = self._fsm_crew_ranges()
+        res = super().write(vals)
+        self._fsm_crew_days_changed(self._fsm_crew_ranges(), ranges)
+        return res
+
+    def unlink(self):
+        ranges = self._fsm_crew_ranges()
+        res = super().unlink()
+        self._fsm_crew_days_changed(ranges)
+        return res
+
+    def _fsm_crew_ranges(self):
+        """Return ``{team id: (first, last local date)}`` of published technician shifts.
+
+        Dates are local to the company timezone, in which crew windows are stored.
+        """
+        if not self:
+            return {}
+        engine = self.env["fsm.slot.engine"]
+        engine = engine.with_context(tz=engine._company_tz_name())
+        role = self.env.ref("fsm_guided_intake.planning_role_fsm_technician", raise_if_not_found=False)
+        ranges = {}
+        for slot in self:
+            if (
+                slot.state != "published"
+                or slot.role_id != role
+                or not slot.fsm_team_id
+                or not slot.start_datetime
+                or not slot.end_datetime
+            ):
+                continue
+            first = engine._to_local_naive(slot.start_datetime).date()
+            last = engine._to_local_naive(slot.end_datetime).date()
+            current = ranges.get(slot.fsm_team_id.id)
+            if current:
+                first, last = min(first, current[0]), max(last, current[1])
+            ranges[slot.fsm_team_id.id] = (first, last)
+        return ranges
+
+    def _fsm_crew_days_changed(self, *range_maps):
+        """Refresh stored crew windows and queue Planning-derived capacity of the affected team-days.
+
+        Capacity is only queued when derived from Planning, so shift edits
+        never trigger regeneration of calendar-based capacity.
+        """
+        merged = {}
+        for ranges in range_maps:
+            for team_id, (first, last) in ranges.items():
+                current = merged.get(team_id)
+                if current:
+                    first, last = min(first, current[0]), max(last, current[1])
+                merged[team_id] = (first, last)
+        if not merged:
+            return
+        self.env["fsm.crew.window"]._refresh(merged)
+        if self.env["fsm.slot.engine"]._availability_source() != "planning":
+            return
+        Dirty = self.env["fsm.capacity.dirty"]
+        Team = self.env["fsm.team"].sudo()
+        for team_id, (first, last) in merged.items():
+            Dirty.mark(Team.browse(team_id), first, last, reason="planning")
+
     @api.model
     def _fsm_technician_employees(self):
         """Technicians are the active employees assigned to active FSM teams."""
@@ -100,26 +188,58 @@ class PlanningSlot(models.Model):
         shift spans from the first work period to the last so the native Planning
         view shows one daily shift, including the intervening lunch break.
         """
-        calendar = employee.resource_calendar_id
-        timezone = pytz.timezone(employee.tz or calendar.tz or "UTC")
-        local_start = timezone.localize(datetime.combine(schedule_date, time.min))
-        local_end = timezone.localize(datetime.combine(schedule_date + timedelta(days=1), time.min))
-        intervals_by_resource = calendar._attendance_intervals_batch(
-            local_start,
-            local_end,
-            resources=employee.resource_id,
-            tz=timezone,
-        )
-        intervals = intervals_by_resource.get(employee.resource_id.id, [])
-        if not intervals:
-            return False, False
-
-        start_datetime = min(interval[0] for interval in intervals)
-        end_datetime = max(interval[1] for interval in intervals)
-        return (
-            start_datetime.astimezone(pytz.UTC).replace(tzinfo=None),
-            end_datetime.astimezone(pytz.UTC).replace(tzinfo=None),
-        )
+        bounds = self._fsm_calendar_shift_bounds_batch(employee, schedule_date, schedule_date)
+        return bounds.get((employee.id, schedule_date), (False, False))
+
+    @api.model
+    def _fsm_calendar_shift_bounds_batch(self, employees, date_start, date_end):
+        """Return ``{(employee id, date): (start, end)}`` UTC shift bounds for a date range.
+
+        Employees sharing a working schedule and timezone are resolved with a
+        single attendance query over the whole range; intervals are then split
+        per local day in memory, matching ``_fsm_calendar_shift_bounds``.
+        """
+        groups = {}
+        for employee in employees:
+            calendar = employee.resource_calendar_id
+            if not calendar or not employee.resource_id:
+                continue
+            tz_name = employee.tz or calendar.tz or "UTC"
+            groups.setdefault((calendar, tz_name), self.env["hr.employee"])
+            groups[(calendar, tz_name)] |= employee
+
+        bounds = {}
+        for (calendar, tz_name), group in groups.items():
+            timezone = pytz.timezone(tz_name)
+            local_start = timezone.localize(datetime.combine(date_start, time.min))
+            local_end = timezone.localize(datetime.combine(date_end + timedelta(days=1), time.min))
+            intervals_by_resource = calendar._attendance_intervals_batch(
+                local_start,
+                local_end,
+                resources=group.resource_id,
+                tz=timezone,
+            )
+            for employee in group:
+                for interval_start, interval_end, _meta in intervals_by_resource.get(employee.resource_id.id, []):
+                    segment_start = interval_start
+                    while segment_start < interval_end:
+                        day = segment_start.date()
+                        next_day = timezone.localize(datetime.combine(day + timedelta(days=1), time.min))
+                        segment_end = min(interval_end, next_day)
+                        key = (employee.id, day)
+                        if key in bounds:
+                            bounds[key] = (min(bounds[key][0], segment_start), max(bounds[key][1], segment_end))
+                        else:
+                            bounds[key] = (segment_start, segment_end)
+                        segment_start = segment_end
+
+        return {
+            key: (
+                start.astimezone(pytz.UTC).replace(tzinfo=None),
+                end.astimezone(pytz.UTC).replace(tzinfo=None),
+            )
+            for key, (start, end) in bounds.items()
+        }
 
     @api.model
     def _fsm_assign_technician_role(self, employees, role):
@@ -133,41 +253,64 @@ class PlanningSlot(models.Model):
                 employee.sudo().write(values)
 
     @api.model
-    def sync_fsm_technician_shifts(self, date_start=None, date_end=None):
+    def _fsm_sync_horizon_weeks(self):
+        return max(1, self.env["fsm.settings"]._get("shift_sync_horizon_weeks"))
+
+    @api.model
+    def _fsm_sync_time_budget(self):
+        return max(0.0, self.env["fsm.settings"]._get("shift_sync_time_budget_seconds"))
+
+    @api.model
+    def _fsm_sync_window(self, weeks=None):
+        """Synchronization horizon: whole weeks from the current calendar week."""
+        today = fields.Date.context_today(self)
+        default_start = today - timedelta(days=today.weekday())
+        weeks = weeks or self._fsm_sync_horizon_weeks()
+        return default_start, default_start + timedelta(days=weeks * 7 - 1)
+
+    @api.model
+    def sync_fsm_technician_shifts(self, date_start=None, date_end=None, employees=None):
         """Synchronize technician Planning shifts with employee work schedules.
 
         The default window is the current and following calendar week. Only
         records tagged by this integration are updated or removed; manual
-        Planning shifts are never modified.
+        Planning shifts are never modified. With ``employees`` only their
+        shifts are synchronized, including removal of shifts of employees
+        who no longer are technicians.
         """
-        today = fields.Date.context_today(self)
-        default_start = today - timedelta(days=today.weekday())
+        default_start, _default_end = self._fsm_sync_window()
         date_start = fields.Date.to_date(date_start) if date_start else default_start
         date_end = fields.Date.to_date(date_end) if date_end else date_start + timedelta(days=13)
         if date_end < date_start:
             raise ValueError(_("The Planning shift end date cannot be before the start date."))
 
         role = self._fsm_technician_role().sudo()
-        employees = self._fsm_technician_employees().sudo()
-        self._fsm_assign_technician_role(employees, role)
-        seed_team_by_employee = self._fsm_seed_team_by_employee(employees)
-
-        existing_slots = self.sudo().search([
+        technicians = self._fsm_technician_employees().sudo()
+        existing_domain = [
             ("fsm_employee_schedule_generated", "=", True),
             ("fsm_schedule_date", ">=", date_start),
             ("fsm_schedule_date", "<=", date_end),
-        ])
+        ]
+        if employees is not None:
+            technicians &= employees.sudo()
+            existing_domain.append(("resource_id", "in", employees.sudo().resource_id.ids))
+        employees = technicians
+        self._fsm_assign_technician_role(employees, role)
+        seed_team_by_employee = self._fsm_seed_team_by_employee(employees)
+
+        existing_slots = self.sudo().search(existing_domain)
         existing_by_key = {slot.fsm_schedule_key: slot for slot in existing_slots}
         desired_keys = set()
-        created = self.browse()
-        updated = self.browse()
+        to_create = []
+        writes = {}
         protected = self.browse()
 
+        bounds = self._fsm_calendar_shift_bounds_batch(employees, date_start, date_end)
         current_date = date_start
         while current_date <= date_end:
             for employee in employees:
-                start_datetime, end_datetime = self._fsm_calendar_shift_bounds(
-                    employee, current_date
+                start_datetime, end_datetime = bounds.get(
+                    (employee.id, current_date), (False, False)
                 )
                 if not start_datetime:
                     continue
@@ -177,8 +320,8 @@ class PlanningSlot(models.Model):
                     "name": _("Employee work schedule"),
                     "resource_id": employee.resource_id.id,
                     "role_id": role.id,
-                    "start_datetime": fields.Datetime.to_string(start_datetime),
-                    "end_datetime": fields.Datetime.to_string(end_datetime),
+                    "start_datetime": start_datetime,
+                    "end_datetime": end_datetime,
                     "company_id": employee.company_id.id,
                     "fsm_employee_schedule_generated": True,
                     "fsm_schedule_date": current_date,
@@ -188,22 +331,28 @@ class PlanningSlot(models.Model):
                 slot = existing_by_key.get(key)
                 if slot:
                     if slot.state == "published":
-                        if not slot.fsm_team_id and seed_team_by_employee.get(employee.id):
-                            slot.write({
-                                "fsm_team_id": seed_team_by_employee[employee.id].id,
-                            })
+                        values = {}
                         protected |= slot
-                    else:
-                        if not slot.fsm_team_id and seed_team_by_employee.get(employee.id):
-                            values["fsm_team_id"] = seed_team_by_employee[employee.id].id
-                        slot.write(values)
-                        updated |= slot
+                    if not slot.fsm_team_id and seed_team_by_employee.get(employee.id):
+                        values["fsm_team_id"] = seed_team_by_employee[employee.id].id
+                    changes = self._fsm_slot_changes(slot, values)
+                    if changes:
+                        writes.setdefault(tuple(sorted(changes.items())), []).append(slot.id)
                 else:
                     if seed_team_by_employee.get(employee.id):
                         values["fsm_team_id"] = seed_team_by_employee[employee.id].id
-                    created |= self.sudo().create(values)
+                    to_create.append(values)
             current_date += timedelta(days=1)
 
+        # Slots sharing the same changes are written together.
+        updated = self.browse()
+        for changes, slot_ids in writes.items():
+            slots = self.sudo().browse(slot_ids)
+            slots.write(dict(changes))
+            updated |= slots
+        updated -= protected
+        created = self.sudo().create(to_create)
+
         stale = existing_slots.filtered(
             lambda slot: slot.state == "draft"
             and slot.fsm_schedule_key not in desired_keys
@@ -220,6 +369,208 @@ class PlanningSlot(models.Model):
             "date_end": date_end,
         }
 
+    @api.model
+    def _fsm_slot_changes(self, slot, values):
+        """Return the subset of ``values`` that differs from the slot's current values."""
+        changes = {}
+        for field_name, value in values.items():
+            current = slot[field_name]
+            if self._fields[field_name].type == "many2one":
+                current = current.id
+            if current != value:
+                changes[field_name] = value
+        return changes
+
+    @api.model
+    def _fsm_sync_chunk_employees(self, date_start, date_end):
+        """Employees a long-horizon run covers: technicians and holders of generated shifts."""
+        groups = self.sudo()._read_group(
+            [
+                ("fsm_employee_schedule_generated", "=", True),
+                ("fsm_schedule_date", ">=", date_start),
+                ("fsm_schedule_date", "<=", date_end),
+            ],
+            ["resource_id"],
+        )
+        holders = self.env["hr.employee"].sudo().with_context(active_test=False).search([
+            ("resource_id", "in", [resource.id for resource, in groups]),
+        ])
+        return (self._fsm_technician_employees().sudo() | holders).sorted("id")
+
+    @api.model
+    def _fsm_sync_checkpoint(self):
+        record = self.env["fsm.shift.sync.checkpoint"].sudo().search([], limit=1)
+        if not record:
+            return {}
+        return {
+            "date_start": fields.Date.to_string(record.date_start),
+            "date_end": fields.Date.to_string(record.date_end),
+            "week": record.week,
+            "employee_id": record.employee_id,
+            "done": record.done,
+        }
+
+    @api.model
+    def _fsm_store_sync_checkpoint(self, checkpoint):
+        # A record rather than a config parameter: set_param clears the
+        # registry caches of every worker, and this is written per chunk.
+        Checkpoint = self.env["fsm.shift.sync.checkpoint"].sudo()
+        record = Checkpoint.search([], limit=1)
+        if record:
+            record.write(checkpoint)
+        else:
+            Checkpoint.create(checkpoint)
+
+    @api.model
+    def sync_fsm_technician_shifts_chunked(self, weeks=None, batch_size=SHIFT_SYNC_EMPLOYEE_BATCH, time_budget=None, commit=False):
+        """Synchronize the long horizon in (employee batch, week) chunks.
+
+        Progress is checkpointed after every chunk, so a run stopped by the
+        time budget, a timeout or a crash resumes where it left off. A
+        finished horizon is not synchronized again until the week rolls over;
+        edits in between reach Planning through ``fsm.planning.dirty``. With
+        ``commit`` every chunk is committed on its own.
+        """
+        started = perf_counter()
+        date_start, date_end = self._fsm_sync_window(weeks)
+        week_count = (date_end - date_start).days // 7 + 1
+        checkpoint = self._fsm_sync_checkpoint()
+        if (checkpoint.get("date_start"), checkpoint.get("date_end")) != (date_start.isoformat(), date_end.isoformat()):
+            checkpoint = {
+                "date_start": date_start.isoformat(),
+                "date_end": date_end.isoformat(),
+                "week": 0,
+                "employee_id": 0,
+                "done": False,
+            }
+        totals = {"created": 0, "updated": 0, "removed": 0, "protected": 0, "chunks": 0}
+        if not checkpoint["done"]:
+            employees = self._fsm_sync_chunk_employees(date_start, date_end)
+            employee_ids = employees.ids
+            while checkpoint["week"] < week_count:
+                if time_budget and totals["chunks"] and perf_counter() - started >= time_budget:
+                    break
+                position = bisect_right(employee_ids, checkpoint["employee_id"])
+                batch = employees.browse(employee_ids[position:position + batch_size])
+                if batch:
+                    week_start = date_start + timedelta(weeks=checkpoint["week"])
+                    result = self.sync_fsm_technician_shifts(
+                        week_start,
+                        week_start + timedelta(days=6),
+                        employees=batch,
+                    )
+                    for key in ("created", "updated", "removed", "protected"):
+                        totals[key] += result[key]
+                    totals["chunks"] += 1
+                if position + batch_size >= len(employee_ids):
+                    checkpoint["week"] += 1
+                    checkpoint["employee_id"] = 0
+                else:
+                    checkpoint["employee_id"] = batch[-1].id
+                checkpoint["done"] = checkpoint["week"] >= week_count
+                self._fsm_store_sync_checkpoint(checkpoint)
+                if commit:
+                    self.env.cr.commit()
+        totals.update({
+            "done": checkpoint["done"],
+            "week": checkpoint["week"],
+            "date_start": date_start,
+            "date_end": date_end,
+        })
+        return totals
+
     @api.model
     def _cron_sync_fsm_technician_shifts(self):
-        return self.sync_fsm_technician_shifts()
+        return self.sync_fsm_technician_shifts_chunked(
+            time_budget=self._fsm_sync_time_budget(),
+            commit=not self.env.registry.in_test_mode(),
+        )
+
+
+class FsmPlanningDirty(models.Model):
+    _name = "fsm.planning.dirty"
+    _description = "FSM Technician Shift Sync Queue"
+    _order = "id"
+
+    employee_id = fields.Many2one("hr.employee", string="Employee", required=True, ondelete="cascade", index=True)
+    date_from = fields.Date(string="From", required=True)
+    date_to = fields.Date(string="To", required=True)
+    reason = fields.Char(string="Reason")
+
+    @api.model
+    def mark(self, employees, date_from=None, date_to=None, reason=None):
+        """Queue a shift re-sync for employees over a date range (default: the sync window)."""
+        if not employees or self.env.context.get("fsm_skip_planning_dirty"):
+            return self.browse()
+        today = fields.Date.context_today(self)
+        _window_start, window_end = self.env["planning.slot"]._fsm_sync_window()
+        date_from = max(fields.Date.to_date(date_from) if date_from else today, today)
+        date_to = min(fields.Date.to_date(date_to) if date_to else window_end, window_end)
+        if date_to < date_from:
+            return self.browse()
+        return self.sudo().create([
+            {
+                "employee_id": employee.id,
+                "date_from": date_from,
+                "date_to": date_to,
+                "reason": reason,
+            }
+            for employee in employees
+        ])
+
+    @api.model
+    def process_dirty(self, batch_size=100, commit=False):
+        """Re-sync the queued (employee, date range) shifts, ``batch_size`` employees at a time.
+
+        With ``commit`` every batch is committed on its own, so a long queue
+        does not hold its slot locks for the whole run. Returns the number of
+        employees synchronized.
+        """
+        Slot = self.env["planning.slot"].sudo()
+        Employee = self.env["hr.employee"].sudo().with_context(active_test=False)
+        today = fields.Date.context_today(self)
+        # One snapshot of the queue; entries queued meanwhile wait for the next run.
+        entry_ids_by_employee = {}
+        ranges = {}
+        for entry in self.sudo().search_fetch([], ["employee_id", "date_from", "date_to"]):
+            employee_id = entry.employee_id.id
+            entry_ids_by_employee.setdefault(employee_id, []).append(entry.id)
+            current = ranges.get(employee_id)
+            if current:
+                ranges[employee_id] = (min(current[0], entry.date_from), max(current[1], entry.date_to))
+            else:
+                ranges[employee_id] = (entry.date_from, entry.date_to)
+
+        processed = 0
+        for employee_ids in split_every(batch_size, list(entry_ids_by_employee)):
+            employees_by_range = {}
+            for employee_id in employee_ids:
+                date_from, date_to = ranges[employee_id]
+                date_from = max(date_from, today)
+                if date_to >= date_from:
+                    employees_by_range.setdefault((date_from, date_to), []).append(employee_id)
+
+            for (date_from, date_to), range_employee_ids in employees_by_range.items():
+                Slot.sync_fsm_technician_shifts(date_from, date_to, employees=Employee.browse(range_employee_ids))
+            self.sudo().browse([
+                entry_id for employee_id in employee_ids for entry_id in entry_ids_by_employee[employee_id]
+            ]).exists().unlink()
+            processed += len(employee_ids)
+            if commit:
+                self.env.cr.commit()
+        return processed
+
+    @api.model
+    def cron_process_dirty(self):
+        return self.process_dirty(commit=not self.env.registry.in_test_mode())
+
+
+class FsmShiftSyncCheckpoint(models.Model):
+    _name = "fsm.shift.sync.checkpoint"
+    _description = "FSM Technician Shift Sync Checkpoint"
+
+    date_start = fields.Date(string="Window Start", required=True)
+    date_end = fields.Date(string="Window End", required=True)
+    week = fields.Integer(string="Next Week", help="Index of the first week of the window not fully synchronized.")
+    employee_id = fields.Integer(string="Last Employee ID", help="Last employee synchronized in the current week.")
+    done = fields.Boolean(string="Window Synchronized")
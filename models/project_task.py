@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
+import logging
+import unicodedata
+from time import perf_counter
+
 from markupsafe import Markup
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import AccessError, UserError, ValidationError
+from odoo.tools import frozendict, split_every
 from datetime import datetime, timedelta, time
 
+_logger = logging.getLogger(__name__)
+
 
 class ProjectTaskMaterial(models.Model):
     _name = "fsm.task.material"
@@ -25,6 +32,108 @@ class ProjectTaskMaterial(models.Model):
         for rec in self:
             rec.is_service = rec.product_id and rec.product_id.type == "service"
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        materials = super().create(vals_list)
+        materials.task_id._fsm_reset_invoice_error()
+        return materials
+
+    def write(self, vals):
+        tasks = self.task_id
+        result = super().write(vals)
+        (tasks | self.task_id)._fsm_reset_invoice_error()
+        return result
+
+    def unlink(self):
+        tasks = self.task_id
+        result = super().unlink()
+        tasks.exists()._fsm_reset_invoice_error()
+        return result
+
+
+# Stage name fragments (normalized, accent-free) that mark a closed stage.
+FSM_CLOSED_STAGE_TOKENS = (
+    "cancel",
+    "closed",
+    "complet",
+    "cerrad",
+    "done",
+    "finaliz",
+    "hecho",
+)
+
+
+# Stage names (case-insensitive, in order of preference) of each scheduling role.
+# Common Spanish labels are included so scheduling works across translations.
+FSM_STAGE_ROLE_NAMES = {
+    "unscheduled": ("to be scheduled", "to schedule", "new"),
+    "scheduled": ("scheduled", "planned", "planificado", "programado", "agendado"),
+    "rescheduled": (
+        "rescheduled",
+        "reprogrammed",
+        "reprogramado",
+        "reprogramada",
+        "reagendado",
+        "reagendada",
+    ),
+}
+
+
+def _normalize_stage_name(name):
+    text = unicodedata.normalize("NFKD", name or "")
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).strip().lower()
+
+
+class ProjectTaskType(models.Model):
+    _inherit = "project.task.type"
+
+    fsm_closes_availability = fields.Boolean(
+        string="Releases Team Availability",
+        compute="_compute_fsm_closes_availability",
+        store=True,
+        help="Folded stages and stages named like a closed state release the team time of their tasks.",
+    )
+
+    @api.depends("name", "fold")
+    def _compute_fsm_closes_availability(self):
+        # Check every translation of the name, so the flag does not depend on
+        # the language of whoever renamed the stage last.
+        langs = {"en_US"} | {code for code, _label in self.env["res.lang"].get_installed()}
+        for stage in self:
+            names = {_normalize_stage_name(stage.with_context(lang=lang).name) for lang in langs}
+            stage.fsm_closes_availability = bool(stage.fold) or any(
+                token in name for name in names for token in FSM_CLOSED_STAGE_TOKENS
+            )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        stages = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return stages
+
+    def write(self, vals):
+        result = super().write(vals)
+        if {"name", "project_ids", "sequence", "active"} & set(vals):
+            # Stage roles are resolved by name, project and order.
+            self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
+
+
+class ProjectProject(models.Model):
+    _inherit = "project.project"
+
+    def write(self, vals):
+        result = super().write(vals)
+        if "type_ids" in vals:
+            # Same relation as project.task.type's project_ids: stage roles move.
+            self.env.registry.clear_cache()
+        return result
+
 
 class ProjectTask(models.Model):
     _inherit = "project.task"
@@ -80,9 +189,33 @@ class ProjectTask(models.Model):
         compute="_compute_fsm_task_type_edit_mode",
     )
     team_id = fields.Many2one("fsm.team", string="FSM Team", copy=False, help="Assigned field service team")
+    fsm_blocks_availability = fields.Boolean(
+        string="Blocks Team Availability",
+        compute="_compute_fsm_blocks_availability",
+        store=True,
+        help="Whether the task's scheduled time is busy time for its team.",
+    )
+    fsm_busy_start = fields.Datetime(
+        string="Busy From",
+        compute="_compute_fsm_busy_interval",
+        store=True,
+        help="Effective scheduled start used when loading team busy time.",
+    )
+    fsm_busy_end = fields.Datetime(
+        string="Busy Until",
+        compute="_compute_fsm_busy_interval",
+        store=True,
+        help="Effective scheduled end; derived from the planned hours when the task has no end date.",
+    )
     fsm_material_ids = fields.One2many("fsm.task.material", "task_id", string="Materials/Services", copy=False)
     fsm_invoiced = fields.Boolean(string="FSM Invoiced", default=False, copy=False)
     fsm_last_invoiced_so_id = fields.Many2one("sale.order", string="Last Invoiced SO", copy=False)
+    fsm_invoice_error = fields.Text(
+        string="Auto-Invoice Error",
+        copy=False,
+        readonly=True,
+        help="Why the scheduled auto-invoicing skipped this task. Cleared when the task's stage, sales order or materials change, which retries it.",
+    )
     fsm_default_planned_hours = fields.Float(string="Default Planned Hours (Type)", copy=False)
     bonus_points = fields.Integer(
         string="Bonus Points",
@@ -222,10 +355,7 @@ class ProjectTask(models.Model):
         """Return assignees for a team: all member users plus team lead."""
         if not team:
             return []
-        users = team.member_ids.mapped("user_id")
-        if team.lead_user_id:
-            users |= team.lead_user_id
-        return users.ids
+        return team._fsm_roster_user_ids()
 
     @api.onchange("team_id")
     def _onchange_team_id_sync_assignees(self):
@@ -236,8 +366,9 @@ class ProjectTask(models.Model):
             assignee_ids = task._fsm_get_team_assignee_user_ids(task.team_id)
             task.user_ids = [(6, 0, assignee_ids)]
 
-    def _fsm_find_stage(self, names):
-        """Find a stage by name (case-insensitive), preferring the task's project.
+    @api.model
+    def _fsm_search_stage(self, names, project_id=False):
+        """Find a stage by name (case-insensitive), preferring the given project.
 
         The lookup tries each candidate name with the project filter first, then
         without project restriction as a fallback.
@@ -247,8 +378,8 @@ class ProjectTask(models.Model):
             # Exact case-insensitive matching prevents "Scheduled" from
             # incorrectly selecting the "To Be Scheduled" stage.
             domain = [("name", "=ilike", name)]
-            if self.project_id:
-                domain = [("project_ids", "in", self.project_id.id)] + domain
+            if project_id:
+                domain = [("project_ids", "in", project_id)] + domain
             stage = Stage.search(domain, limit=1)
             if stage:
                 return stage
@@ -258,21 +389,46 @@ class ProjectTask(models.Model):
                 return stage
         return False
 
+    def _fsm_find_stage(self, names):
+        return self._fsm_search_stage(names, self.project_id.id)
+
+    @api.model
+    @tools.ormcache("project_id", "lang")
+    def _fsm_stage_role_ids(self, project_id, lang):
+        """Return ``{role: stage id}`` for a project; cached until stages change."""
+        resolver = self.sudo().with_context(lang=lang)
+        return frozendict({
+            role: (resolver._fsm_search_stage(names, project_id) or resolver.env["project.task.type"]).id
+            for role, names in FSM_STAGE_ROLE_NAMES.items()
+        })
+
+    def _fsm_role_stage(self, role):
+        """Return the task project's stage for a scheduling role, or an empty recordset."""
+        self.ensure_one()
+        stage_id = self._fsm_stage_role_ids(self.project_id.id or False, self.env.lang)[role]
+        return self.env["project.task.type"].browse(stage_id)
+
+    def _fsm_move_to_role_stage(self, role):
+        """Write each task's role stage, one write per target stage."""
+        tasks_by_stage = {}
+        for task in self:
+            stage = task._fsm_role_stage(role)
+            if stage and task.stage_id != stage:
+                tasks_by_stage.setdefault(stage, self.browse())
+                tasks_by_stage[stage] |= task
+        for stage, tasks in tasks_by_stage.items():
+            tasks.with_context(fsm_skip_auto_stage=True).write({"stage_id": stage.id})
+
     def _fsm_apply_unscheduled_stage(self):
         """Move tasks without a planned start to the unscheduled stage.
 
         Uses common stage labels to avoid hard-coded IDs. Skips folded stages to
         avoid re-opening done tasks.
         """
-        unscheduled_candidates = ["to be scheduled", "to schedule", "new"]
-        for task in self:
-            if task.planned_date_begin:
-                continue
-            if task.stage_id and task.stage_id.fold:
-                continue
-            stage = task._fsm_find_stage(unscheduled_candidates)
-            if stage and task.stage_id != stage:
-                task.with_context(fsm_skip_auto_stage=True).write({"stage_id": stage.id})
+        self.filtered(
+            lambda task: not task.planned_date_begin
+            and not (task.stage_id and task.stage_id.fold)
+        )._fsm_move_to_role_stage("unscheduled")
 
     def _fsm_apply_scheduled_stage(self):
         """Move tasks with a planned date to the scheduled stage.
@@ -280,23 +436,10 @@ class ProjectTask(models.Model):
         Uses common stage labels to avoid hard-coded IDs. Skips folded stages to
         avoid moving already closed tasks.
         """
-        # Include common Spanish labels so scheduling works across translations
-        scheduled_candidates = [
-            "scheduled",
-            "planned",
-            "planificado",
-            "programado",
-            "agendado",
-        ]
-        for task in self:
-            has_schedule = bool(task.planned_date_begin or task.date_deadline)
-            if not has_schedule:
-                continue
-            if task.stage_id and task.stage_id.fold:
-                continue
-            stage = task._fsm_find_stage(scheduled_candidates)
-            if stage and task.stage_id != stage:
-                task.with_context(fsm_skip_auto_stage=True).write({"stage_id": stage.id})
+        self.filtered(
+            lambda task: (task.planned_date_begin or task.date_deadline)
+            and not (task.stage_id and task.stage_id.fold)
+        )._fsm_move_to_role_stage("scheduled")
 
     def _fsm_stage_is_done(self, stage):
         """Return True when a stage represents a done/closed state."""
@@ -312,11 +455,7 @@ class ProjectTask(models.Model):
 
     def _link_installation_task_to_subscription(self):
         """Link task to subscription's installation_task_id if task type matches setting."""
-        installation_type_id = int(
-            self.env['ir.config_parameter'].sudo().get_param(
-                'fsm_guided_intake.installation_task_type_id', '0'
-            )
-        )
+        installation_type_id = self.env["fsm.settings"]._get("installation_task_type_id")
         if not installation_type_id:
             return
 
@@ -334,21 +473,20 @@ class ProjectTask(models.Model):
         """Create/Update SO from task materials and create a draft invoice (account.move).
         This does NOT post the invoice. It marks task as fsm_invoiced to avoid duplicates.
         """
-        AccountMove = self.env["account.move"]
-        for task in self:
-            if task.fsm_invoiced:
-                continue
-            # Prepare SO lines
-            task.action_fsm_prepare_invoice()
-            so = task.sale_order_id
-            if not so:
-                continue
+        tasks = self.filtered(lambda t: not t.fsm_invoiced)
+        # Prepare SO lines for all tasks at once
+        tasks.action_fsm_prepare_invoice()
+        tasks_by_so = {}
+        for task in tasks:
+            if task.sale_order_id:
+                tasks_by_so.setdefault(task.sale_order_id, self.browse())
+                tasks_by_so[task.sale_order_id] |= task
+        for so, so_tasks in tasks_by_so.items():
             # Create draft invoice from SO
             inv = so._create_invoices()
             if inv:
                 # leave draft; do not post
-                task.fsm_invoiced = True
-                task.fsm_last_invoiced_so_id = so.id
+                so_tasks.write({"fsm_invoiced": True, "fsm_last_invoiced_so_id": so.id})
         return True
 
     @api.depends("fsm_rx_dbm", "fsm_tx_dbm", "fsm_task_type_id.optics_rx_min", "fsm_task_type_id.optics_rx_max", "fsm_task_type_id.optics_tx_min", "fsm_task_type_id.optics_tx_max")
@@ -383,6 +521,63 @@ class ProjectTask(models.Model):
             ]
             task.fsm_install_complete = all(required)
 
+    @api.depends(
+        "active",
+        "fsm_rescheduled_to_task_id",
+        "fsm_done",
+        "state",
+        "stage_id.fsm_closes_availability",
+    )
+    def _compute_fsm_blocks_availability(self):
+        """Explicit operational status is authoritative.
+
+        A stage can be stale after a task is put back on the schedule, so a
+        folded/closed-looking stage must not release capacity while the task
+        is still active, current, and explicitly not done or cancelled.
+        """
+        terminal_states = {"1_done", "1_canceled"}
+        for task in self:
+            if not task.active or task.fsm_rescheduled_to_task_id or task.fsm_done:
+                blocks = False
+            elif task.state in terminal_states:
+                blocks = False
+            elif task.state:
+                # An open operational state wins over a stale closed stage.
+                blocks = True
+            else:
+                blocks = not task.stage_id.fsm_closes_availability
+            task.fsm_blocks_availability = blocks
+
+    def _fsm_busy_interval_depends(self):
+        _Task, start_fields, end_fields, _team_field = self.env["fsm.slot.engine"]._task_fields()
+        hours_fields = [f for f in ("planned_hours", "allocated_hours") if f in self._fields]
+        return start_fields + end_fields + hours_fields + ["fsm_task_type_id.default_planned_hours"]
+
+    @api.depends(lambda self: self._fsm_busy_interval_depends())
+    def _compute_fsm_busy_interval(self):
+        engine = self.env["fsm.slot.engine"]
+        _Task, start_fields, end_fields, _team_field = engine._task_fields()
+        for task in self:
+            start, end = engine._task_interval_utc(task, start_fields, end_fields, default_hours=1.0)
+            task.fsm_busy_start = start
+            task.fsm_busy_end = end
+
+    def init(self):
+        super().init()
+        tools.create_index(
+            self.env.cr,
+            "project_task_fsm_team_blocks_availability_index",
+            self._table,
+            ["team_id", "fsm_blocks_availability"],
+        )
+        tools.create_index(
+            self.env.cr,
+            "project_task_fsm_team_busy_interval_index",
+            self._table,
+            ["team_id", "fsm_busy_start", "fsm_busy_end"],
+            where="fsm_blocks_availability",
+        )
+
     @api.depends("fsm_default_planned_hours", "allocated_hours")
     def _compute_planned_hours_warning(self):
         for task in self:
@@ -412,6 +607,35 @@ class ProjectTask(models.Model):
         create_ctx.pop("state", None)
         create_self = self.with_context(create_ctx)
 
+        # Related records of the whole batch are fetched once, not per row.
+        task_types = {
+            task_type.id: task_type
+            for task_type in create_self.env["fsm.task.type"].with_context(active_test=False).search_fetch(
+                [("id", "in", list({
+                    vals["fsm_task_type_id"]
+                    for vals in vals_list
+                    if "bonus_points" not in vals and vals.get("fsm_task_type_id")
+                }))],
+                ["bonus_base_points"],
+            )
+        }
+        coordinate_partners = {
+            partner.id: partner
+            for partner in create_self.env["res.partner"].with_context(active_test=False).search_fetch(
+                [("id", "in", list({
+                    vals.get("fsm_service_address_id") or vals.get("partner_id")
+                    for vals in vals_list
+                    if vals.get("fsm_service_address_id") or vals.get("partner_id")
+                }))],
+                ["partner_latitude", "partner_longitude"],
+            )
+        }
+        team_ids = set(
+            create_self.env["fsm.team"].with_context(active_test=False).search([
+                ("id", "in", list({vals["team_id"] for vals in vals_list if vals.get("team_id")})),
+            ]).ids
+        )
+
         normalized_vals_list = []
         should_compute_warning = False
         for vals in vals_list:
@@ -419,8 +643,8 @@ class ProjectTask(models.Model):
             if new_vals.get("state") in self._FSM_INTAKE_WIZARD_STATES:
                 new_vals.pop("state", None)
             if "bonus_points" not in new_vals and new_vals.get("fsm_task_type_id"):
-                task_type = create_self.env["fsm.task.type"].browse(new_vals["fsm_task_type_id"])
-                if task_type.exists():
+                task_type = task_types.get(new_vals["fsm_task_type_id"])
+                if task_type:
                     new_vals["bonus_points"] = task_type.bonus_base_points or 0
             if {
                 "planned_hours",
@@ -433,9 +657,7 @@ class ProjectTask(models.Model):
                 new_vals.get("fsm_service_address_id")
                 or new_vals.get("partner_id")
             )
-            coordinate_partner = create_self.env["res.partner"].browse(
-                coordinate_partner_id
-            ).exists()
+            coordinate_partner = coordinate_partners.get(coordinate_partner_id)
             if coordinate_partner:
                 if "fsm_latitude" not in new_vals:
                     new_vals["fsm_latitude"] = coordinate_partner.partner_latitude
@@ -443,8 +665,9 @@ class ProjectTask(models.Model):
                     new_vals["fsm_longitude"] = coordinate_partner.partner_longitude
 
             if "team_id" in new_vals and "user_ids" not in new_vals and "user_ids" in self._fields:
-                team = create_self.env["fsm.team"].browse(new_vals.get("team_id")) if new_vals.get("team_id") else False
-                assignee_ids = self._fsm_get_team_assignee_user_ids(team) if team and team.exists() else []
+                team_id = new_vals.get("team_id")
+                team = create_self.env["fsm.team"].browse(team_id) if team_id in team_ids else False
+                assignee_ids = self._fsm_get_team_assignee_user_ids(team) if team else []
                 new_vals["user_ids"] = [(6, 0, assignee_ids)]
 
             normalized_vals_list.append(new_vals)
@@ -456,59 +679,94 @@ class ProjectTask(models.Model):
             tasks._compute_planned_hours_warning()
 
         if not create_self.env.context.get("fsm_skip_auto_stage"):
-            for task in tasks:
-                if task.planned_date_begin:
-                    task._fsm_apply_scheduled_stage()
-                else:
-                    task._fsm_apply_unscheduled_stage()
+            scheduled = tasks.filtered("planned_date_begin")
+            scheduled._fsm_apply_scheduled_stage()
+            (tasks - scheduled)._fsm_apply_unscheduled_stage()
         return tasks
 
     def action_fsm_prepare_invoice(self):
         """V1: Create/Update a Sales Order linked to the task partner with task materials.
         Invoicing policy (when to invoice) is usually controlled by products; you can invoice at close.
         This method prepares the SO so accounting can invoice it.
+
+        Works set-based over many tasks and is idempotent: quantities are
+        summed per (task, product, unit) into order lines marked with the
+        task, whose quantity is set rather than added to. Lines entered on the
+        order by other means are never touched.
         """
+        if not self:
+            return True
+        if any(not task.partner_id for task in self):
+            raise UserError(_("Set a customer first."))
+        without_order = self.filtered(lambda t: not t.sale_order_id)
+        new_orders = self.env["sale.order"].create([
+            {"partner_id": task.partner_id.id, "origin": task.display_name}
+            for task in without_order
+        ])
+        for task, so in zip(without_order, new_orders):
+            task.sale_order_id = so.id
+
+        settings = self.env["fsm.settings"]
+        cat6_products = {}
+        for setting in ("cat6_cable_product_id", "cat6_rj45_product_id", "cat6_wall_jack_product_id"):
+            product_id = settings._get(setting)
+            product = self.env["product.product"].browse(product_id).exists() if product_id else False
+            if product:
+                cat6_products[setting] = product
+        qty_by_key = {}
         for task in self:
-            if not task.partner_id:
-                raise UserError(_("Set a customer first."))
             so = task.sale_order_id
-            if not so:
-                so = self.env["sale.order"].create({
-                    "partner_id": task.partner_id.id,
-                    "origin": task.display_name,
-                })
-                task.sale_order_id = so.id
-            # add lines
             for ml in task.fsm_material_ids.filtered(lambda l: l.product_uom_qty > 0 and l.product_id.fsm_bill_from_task):
-                self.env["sale.order.line"].create({
-                    "order_id": so.id,
-                    "product_id": ml.product_id.id,
-                    "product_uom_qty": ml.product_uom_qty,
-                })
+                key = (so.id, task.id, ml.product_id.id, ml.product_id.uom_id.id)
+                qty_by_key[key] = qty_by_key.get(key, 0.0) + ml.product_uom_qty
             if task.fsm_cat6_installed:
-                config = self.env["ir.config_parameter"].sudo()
                 cat6_map = [
-                    ("fsm_guided_intake.cat6_cable_product_id", task.fsm_cat6_meters),
-                    ("fsm_guided_intake.cat6_rj45_product_id", task.fsm_cat6_rj45),
-                    ("fsm_guided_intake.cat6_wall_jack_product_id", task.fsm_cat6_wall_jacks),
+                    ("cat6_cable_product_id", task.fsm_cat6_meters),
+                    ("cat6_rj45_product_id", task.fsm_cat6_rj45),
+                    ("cat6_wall_jack_product_id", task.fsm_cat6_wall_jacks),
                 ]
-                for param_key, qty in cat6_map:
-                    if not qty or qty <= 0:
+                for setting, qty in cat6_map:
+                    if not qty or qty <= 0 or setting not in cat6_products:
                         continue
-                    product_id = int(config.get_param(param_key, "0") or "0")
-                    if not product_id:
-                        continue
-                    product = self.env["product.product"].browse(product_id)
-                    if not product.exists():
-                        continue
-                    self.env["sale.order.line"].create({
-                        "order_id": so.id,
-                        "product_id": product.id,
-                        "product_uom_qty": qty,
-                    })
+                    product = cat6_products[setting]
+                    key = (so.id, task.id, product.id, product.uom_id.id)
+                    qty_by_key[key] = qty_by_key.get(key, 0.0) + qty
+        if not qty_by_key:
+            return True
+
+        SaleOrderLine = self.env["sale.order.line"]
+        task_lines = {}
+        for line in SaleOrderLine.search_fetch([
+            ("fsm_task_id", "in", self.ids),
+            ("order_id", "in", list({key[0] for key in qty_by_key})),
+            ("display_type", "=", False),
+        ], ["order_id", "fsm_task_id", "product_id", "product_uom", "product_uom_qty", "qty_invoiced"], order="id"):
+            task_lines.setdefault(
+                (line.order_id.id, line.fsm_task_id.id, line.product_id.id, line.product_uom.id), line
+            )
+        to_create = []
+        for (order_id, task_id, product_id, uom_id), qty in qty_by_key.items():
+            line = task_lines.get((order_id, task_id, product_id, uom_id))
+            if not line:
+                to_create.append({
+                    "order_id": order_id,
+                    "fsm_task_id": task_id,
+                    "product_id": product_id,
+                    "product_uom": uom_id,
+                    "product_uom_qty": qty,
+                })
+                continue
+            # Never drop below what was already invoiced.
+            qty = max(qty, line.qty_invoiced)
+            if line.product_uom_qty != qty:
+                line.product_uom_qty = qty
+        SaleOrderLine.create(to_create)
         return True
 
     def write(self, vals):
+        if self.env.context.get("fsm_assignee_sync"):
+            # Assignees following a team change: nothing FSM-specific to do.
+            return super().write(vals)
         skip_auto_stage = self.env.context.get("fsm_skip_auto_stage")
         force_close_bypass = bool(
             self.env.su
@@ -543,6 +801,11 @@ class ProjectTask(models.Model):
                             "Cannot mark this task as done until the install worksheet is complete and optical levels are in range."
                         ))
             stage_change_requested = any(task.stage_id.id != vals["stage_id"] for task in self)
+        if "fsm_invoice_error" not in vals and (
+            stage_change_requested or {"sale_order_id", "fsm_material_ids"}.intersection(vals)
+        ):
+            # A new stage, order or materials may let a failed invoice through.
+            vals = dict(vals, fsm_invoice_error=False)
         if "fsm_done" in self._fields and vals.get("fsm_done"):
             for task in self:
                 target_stage = new_stage or task.stage_id
@@ -551,76 +814,48 @@ class ProjectTask(models.Model):
         res = super().write(vals)
 
         if coordinate_updates and not self.env.context.get("fsm_skip_coordinate_sync"):
-            for task in self:
-                old_latitude, old_longitude = coordinate_updates[task.id]
-                if (
-                    old_latitude == task.fsm_latitude
-                    and old_longitude == task.fsm_longitude
-                ):
-                    continue
-                coordinate_partner = task.fsm_service_address_id or task.partner_id
-                if coordinate_partner:
-                    coordinate_partner.sudo().write({
-                        "partner_latitude": task.fsm_latitude,
-                        "partner_longitude": task.fsm_longitude,
-                    })
-                task.message_post(
-                    body=Markup(
-                        "<p><strong>%s</strong></p>"
-                        "<p>%s: %s &rarr; %s<br/>%s: %s &rarr; %s</p>"
-                        "<p>%s: %s</p>"
-                    ) % (
-                        _("GPS coordinates updated"),
-                        _("Latitude"),
-                        task._fsm_format_coordinate(old_latitude),
-                        task._fsm_format_coordinate(task.fsm_latitude),
-                        _("Longitude"),
-                        task._fsm_format_coordinate(old_longitude),
-                        task._fsm_format_coordinate(task.fsm_longitude),
-                        _("Partner/Service Address"),
-                        coordinate_partner.display_name if coordinate_partner else _("Not set"),
-                    ),
-                    subtype_xmlid="mail.mt_note",
-                )
-                if task.partner_id:
-                    task.partner_id.sudo().message_post(
-                        author_id=self.env.user.partner_id.id,
-                        body=Markup(
-                            "<p><strong>%s</strong></p>"
-                            "<p>%s: <a href=\"/web#id=%s&amp;model=project.task&amp;view_type=form\">%s</a></p>"
-                            "<p>%s: %s &rarr; %s<br/>%s: %s &rarr; %s</p>"
-                            "<p>%s: %s</p>"
-                        ) % (
-                            _("GPS coordinates updated"),
-                            _("Task"),
-                            task.id,
-                            task.display_name,
-                            _("Latitude"),
-                            task._fsm_format_coordinate(old_latitude),
-                            task._fsm_format_coordinate(task.fsm_latitude),
-                            _("Longitude"),
-                            task._fsm_format_coordinate(old_longitude),
-                            task._fsm_format_coordinate(task.fsm_longitude),
-                            _("Partner/Service Address"),
-                            coordinate_partner.display_name if coordinate_partner else _("Not set"),
-                        ),
-                        subtype_xmlid="mail.mt_note",
+            changes = [
+                (task, *coordinate_updates[task.id])
+                for task in self
+                if coordinate_updates[task.id] != (task.fsm_latitude, task.fsm_longitude)
+            ]
+            # Bulk callers (geocoding, imports) opt in to queued notes with
+            # fsm_coordinate_async; edits otherwise keep their immediate notes.
+            if self.env.context.get("fsm_coordinate_async"):
+                self._fsm_queue_coordinate_changes(changes)
+            else:
+                for task, old_latitude, old_longitude in changes:
+                    coordinate_partner = task.fsm_service_address_id or task.partner_id
+                    if coordinate_partner:
+                        coordinate_partner.sudo().write({
+                            "partner_latitude": task.fsm_latitude,
+                            "partner_longitude": task.fsm_longitude,
+                        })
+                    task._fsm_post_coordinate_notes(
+                        coordinate_partner,
+                        old_latitude,
+                        old_longitude,
+                        task.fsm_latitude,
+                        task.fsm_longitude,
                     )
         if "stage_id" in vals:
-            auto = self.env["ir.config_parameter"].sudo().get_param("fsm_guided_intake.auto_invoice_on_stage_done", default="False")
-            stage_name = (self.env["ir.config_parameter"].sudo().get_param("fsm_guided_intake.invoice_stage_done_name", default="Done") or "Done").strip().lower()
-            if auto in ("True", True, "1", 1):
-                for task in self:
-                    if task.fsm_invoiced:
-                        continue
-                    if task.stage_id and (task.stage_id.name or "").strip().lower() == stage_name:
-                        # Only invoice once, and only if there are materials/services
-                        if task.fsm_material_ids:
-                            task._fsm_create_draft_invoice()
+            settings = self.env["fsm.settings"]
+            stage_name = settings._get("invoice_stage_done_name").lower()
+            if settings._get("auto_invoice_on_stage_done"):
+                # Only invoice once, and only if there are materials/services
+                self.filtered(
+                    lambda task: not task.fsm_invoiced
+                    and task.stage_id
+                    and (task.stage_id.name or "").strip().lower() == stage_name
+                    and task.fsm_material_ids
+                )._fsm_create_draft_invoice()
         if not skip_auto_stage and not stage_change_requested:
             if planned_date_in_vals or "date_deadline" in vals:
-                unscheduled_stage = self._fsm_find_stage(["to be scheduled", "to schedule", "new"])
-                to_schedule = self.filtered(lambda t: unscheduled_stage and t.stage_id == unscheduled_stage and (t.planned_date_begin or t.date_deadline))
+                to_schedule = self.filtered(
+                    lambda t: (t.planned_date_begin or t.date_deadline)
+                    and t.stage_id
+                    and t.stage_id == t._fsm_role_stage("unscheduled")
+                )
                 if to_schedule:
                     to_schedule._fsm_apply_scheduled_stage()
             elif planned_date_in_vals and not planned_date_value:
@@ -637,10 +872,13 @@ class ProjectTask(models.Model):
             self._compute_planned_hours_warning()
 
         if team_changed_ids and "user_ids" in self._fields:
-            changed_tasks = self.browse(list(team_changed_ids))
-            for task in changed_tasks:
-                assignee_ids = task._fsm_get_team_assignee_user_ids(task.team_id)
-                task.write({"user_ids": [(6, 0, assignee_ids)]})
+            tasks_by_team = {}
+            for task in self.browse(list(team_changed_ids)):
+                tasks_by_team.setdefault(task.team_id, self.browse())
+                tasks_by_team[task.team_id] |= task
+            for team, tasks in tasks_by_team.items():
+                assignee_ids = self._fsm_get_team_assignee_user_ids(team)
+                tasks.with_context(fsm_assignee_sync=True).write({"user_ids": [(6, 0, assignee_ids)]})
 
         return res
 
@@ -648,6 +886,100 @@ class ProjectTask(models.Model):
     def _fsm_format_coordinate(self, value):
         return f"{value:.7f}" if value else _("Not set")
 
+    def _fsm_post_coordinate_notes(self, coordinate_partner, old_latitude, old_longitude, new_latitude, new_longitude, author=None):
+        """Log a GPS change on the task and, when set, its customer."""
+        self.ensure_one()
+        author = author or self.env.user
+        self.message_post(
+            author_id=author.partner_id.id,
+            body=Markup(
+                "<p><strong>%s</strong></p>"
+                "<p>%s: %s &rarr; %s<br/>%s: %s &rarr; %s</p>"
+                "<p>%s: %s</p>"
+            ) % (
+                _("GPS coordinates updated"),
+                _("Latitude"),
+                self._fsm_format_coordinate(old_latitude),
+                self._fsm_format_coordinate(new_latitude),
+                _("Longitude"),
+                self._fsm_format_coordinate(old_longitude),
+                self._fsm_format_coordinate(new_longitude),
+                _("Partner/Service Address"),
+                coordinate_partner.display_name if coordinate_partner else _("Not set"),
+            ),
+            subtype_xmlid="mail.mt_note",
+        )
+        if self.partner_id:
+            self.partner_id.sudo().message_post(
+                author_id=author.partner_id.id,
+                body=Markup(
+                    "<p><strong>%s</strong></p>"
+                    "<p>%s: <a href=\"/web#id=%s&amp;model=project.task&amp;view_type=form\">%s</a></p>"
+                    "<p>%s: %s &rarr; %s<br/>%s: %s &rarr; %s</p>"
+                    "<p>%s: %s</p>"
+                ) % (
+                    _("GPS coordinates updated"),
+                    _("Task"),
+                    self.id,
+                    self.display_name,
+                    _("Latitude"),
+                    self._fsm_format_coordinate(old_latitude),
+                    self._fsm_format_coordinate(new_latitude),
+                    _("Longitude"),
+                    self._fsm_format_coordinate(old_longitude),
+                    self._fsm_format_coordinate(new_longitude),
+                    _("Partner/Service Address"),
+                    coordinate_partner.display_name if coordinate_partner else _("Not set"),
+                ),
+                subtype_xmlid="mail.mt_note",
+            )
+
+    def _fsm_queue_coordinate_changes(self, changes):
+        """Copy changed task GPS to partners set-based and queue the audit notes.
+
+        ``changes`` is a list of ``(task, old latitude, old longitude)``.
+        """
+        if not changes:
+            return
+        # Read the coordinates as flushed, so the raw UPDATE copies what is in the database.
+        self.browse([task.id for task, _lat, _lon in changes]).flush_recordset(["fsm_latitude", "fsm_longitude"])
+        coordinates_by_partner = {}
+        notes = []
+        for task, old_latitude, old_longitude in changes:
+            coordinate_partner = task.fsm_service_address_id or task.partner_id
+            if coordinate_partner:
+                coordinates_by_partner[coordinate_partner.id] = (task.fsm_latitude, task.fsm_longitude)
+            notes.append({
+                "task_id": task.id,
+                "coordinate_partner_id": coordinate_partner.id,
+                "user_id": self.env.user.id,
+                "old_latitude": old_latitude,
+                "old_longitude": old_longitude,
+                "new_latitude": task.fsm_latitude,
+                "new_longitude": task.fsm_longitude,
+            })
+
+        Partner = self.env["res.partner"]
+        Partner.flush_model(["partner_latitude", "partner_longitude"])
+        # Raw SQL on purpose: res.partner write overrides and tracking are
+        # skipped for bulk runs, so write_uid/write_date are set by hand.
+        for batch in split_every(500, coordinates_by_partner.items()):
+            self.env.cr.execute("""
+                UPDATE res_partner AS partner
+                   SET partner_latitude = v.latitude,
+                       partner_longitude = v.longitude,
+                       write_uid = %%s,
+                       write_date = %%s
+                  FROM (VALUES %s) AS v(id, latitude, longitude)
+                 WHERE partner.id = v.id
+            """ % ", ".join(["(%s, %s, %s)"] * len(batch)),
+                [self.env.uid, fields.Datetime.now()]
+                + [value for partner_id, (latitude, longitude) in batch for value in (partner_id, latitude, longitude)])
+        Partner.browse(list(coordinates_by_partner)).invalidate_recordset([
+            "partner_latitude", "partner_longitude", "write_uid", "write_date",
+        ])
+        self.env["fsm.coordinate.note"].sudo().create(notes)
+
     @api.depends_context("fsm_geo_edit_unlocked")
     def _compute_fsm_geo_edit_mode(self):
         unlocked = bool(self.env.context.get("fsm_geo_edit_unlocked"))
@@ -747,19 +1079,72 @@ class ProjectTask(models.Model):
         return True
 
     @api.model
-    def _fsm_cron_auto_invoice_done_tasks(self):
-        auto = self.env["ir.config_parameter"].sudo().get_param("fsm_guided_intake.auto_invoice_on_stage_done", default="False")
-        stage_name = (self.env["ir.config_parameter"].sudo().get_param("fsm_guided_intake.invoice_stage_done_name", default="Done") or "Done").strip().lower()
-        if auto not in ("True", True, "1", 1):
+    def _fsm_auto_invoice_done_tasks(self, batch_size=None, time_budget=None, commit=False):
+        """Draft invoices for done tasks, oldest stage change first.
+
+        Tasks are invoiced ``batch_size`` at a time and no new batch starts
+        once ``time_budget`` seconds have passed; the rest is picked up by the
+        next run. With ``commit`` every batch is committed on its own. A batch
+        is invoiced at once, one invoice per order; when it fails its tasks
+        are retried one by one. A task that fails alone is flagged with
+        ``fsm_invoice_error`` and skipped until its stage, order or materials
+        change; a task that simply has nothing to invoice is left unflagged.
+        """
+        settings = self.env["fsm.settings"]
+        stage_name = settings._get("invoice_stage_done_name").lower()
+        if not settings._get("auto_invoice_on_stage_done"):
             return True
         done_stages = self.env["project.task.type"].search([("name", "ilike", stage_name)])
         if not done_stages:
             return True
-        tasks = self.search([("stage_id", "in", done_stages.ids), ("fsm_invoiced", "=", False)])
-        for t in tasks:
-            if t.fsm_material_ids:
-                t._fsm_create_draft_invoice()
-        return True
+        if batch_size is None:
+            batch_size = max(settings._get("auto_invoice_batch_size"), 1)
+        if time_budget is None:
+            time_budget = max(settings._get("auto_invoice_time_budget_seconds"), 0.0)
+
+        started = perf_counter()
+        tasks = self.search([
+            ("stage_id", "in", done_stages.ids),
+            ("fsm_invoiced", "=", False),
+            ("fsm_invoice_error", "=", False),
+            ("fsm_material_ids", "!=", False),
+        ], order="date_last_stage_update, id")
+        totals = {"invoiced": 0, "failed": 0, "skipped": 0, "pending": len(tasks)}
+        for batch in split_every(batch_size, tasks.ids, self.browse):
+            processed = totals["invoiced"] + totals["failed"] + totals["skipped"]
+            if time_budget and processed and perf_counter() - started >= time_budget:
+                break
+            try:
+                with self.env.cr.savepoint():
+                    batch._fsm_create_draft_invoice()
+            except Exception:
+                _logger.info("FSM auto-invoicing batch failed; retrying its %s tasks one by one", len(batch))
+                for task in batch:
+                    try:
+                        with self.env.cr.savepoint():
+                            task._fsm_create_draft_invoice()
+                    except Exception as error:
+                        _logger.exception("FSM auto-invoicing failed for task %s", task.id)
+                        task.fsm_invoice_error = str(error) or error.__class__.__name__
+            for task in batch:
+                if task.fsm_invoiced:
+                    totals["invoiced"] += 1
+                elif task.fsm_invoice_error:
+                    totals["failed"] += 1
+                else:
+                    totals["skipped"] += 1
+            totals["pending"] -= len(batch)
+            if commit:
+                self.env.cr.commit()
+        return totals
+
+    def _fsm_reset_invoice_error(self):
+        """Let auto-invoicing retry tasks whose materials changed."""
+        self.sudo().filtered("fsm_invoice_error").write({"fsm_invoice_error": False})
+
+    @api.model
+    def _fsm_cron_auto_invoice_done_tasks(self):
+        return self._fsm_auto_invoice_done_tasks(commit=not self.env.registry.in_test_mode())
 
     def _write_scheduled_datetime(self, start_dt_utc, end_dt_utc, duration_hours=None, team=None, assignee_user_ids=None):
         """Apply schedule/team to an existing task and keep booking in sync."""
@@ -827,7 +1212,10 @@ class ProjectTask(models.Model):
 
         if booking:
             write_vals["fsm_booking_id"] = booking.id
-            booking.with_context(self.env.context).action_create_or_update_delivery()
+            # Batch callers such as the dispatch planner reserve stock for all
+            # bookings once scheduling is committed.
+            if not self.env.context.get("fsm_defer_delivery"):
+                booking.with_context(self.env.context).action_create_or_update_delivery()
 
         return self.with_context(fsm_skip_auto_stage=True).sudo().write(write_vals)
 
@@ -1002,14 +1390,7 @@ class ProjectTask(models.Model):
         elif not assignee_user_ids and self.user_ids:
             assignee_user_ids = self.user_ids.ids
 
-        rescheduled_stage = self._fsm_find_stage([
-            "rescheduled",
-            "reprogrammed",
-            "reprogramado",
-            "reprogramada",
-            "reagendado",
-            "reagendada",
-        ])
+        rescheduled_stage = self._fsm_role_stage("rescheduled")
         if not rescheduled_stage:
             raise UserError(_(
                 "No 'Rescheduled' task stage is configured for this Field Service project."
@@ -1120,3 +1501,47 @@ class ProjectTask(models.Model):
         if not self.sale_order_id:
             raise ValidationError(_("No subscription found for this task."))
         return {'type': 'ir.actions.client', 'tag': 'reload'}
+
+
+class FsmCoordinateNote(models.Model):
+    _name = "fsm.coordinate.note"
+    _description = "FSM Pending GPS Change Note"
+    _order = "id"
+
+    task_id = fields.Many2one("project.task", required=True, ondelete="cascade", index=True)
+    coordinate_partner_id = fields.Many2one("res.partner", string="Partner/Service Address", ondelete="set null")
+    user_id = fields.Many2one("res.users", string="Changed By", ondelete="set null")
+    old_latitude = fields.Float(digits=(16, 7))
+    old_longitude = fields.Float(digits=(16, 7))
+    new_latitude = fields.Float(digits=(16, 7))
+    new_longitude = fields.Float(digits=(16, 7))
+
+    @api.model
+    def process_queue(self, batch_size=200, commit=False):
+        """Post queued GPS change notes, ``batch_size`` at a time.
+
+        With ``commit`` every batch is committed on its own. Returns the
+        number of notes posted.
+        """
+        posted = 0
+        while True:
+            entries = self.sudo().search([], limit=batch_size)
+            if not entries:
+                return posted
+            for entry in entries:
+                entry.task_id._fsm_post_coordinate_notes(
+                    entry.coordinate_partner_id,
+                    entry.old_latitude,
+                    entry.old_longitude,
+                    entry.new_latitude,
+                    entry.new_longitude,
+                    author=entry.user_id or self.env.user,
+                )
+            posted += len(entries)
+            entries.unlink()
+            if commit:
+                self.env.cr.commit()
+
+    @api.model
+    def cron_process_queue(self):
+        return self.process_queue(commit=not self.env.registry.in_test_mode())
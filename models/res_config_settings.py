@@ -1,6 +1,15 @@
 # -*- coding: utf-8 -*-
 from odoo import fields, models
 
+# Parameters that change how generated capacity is split and reserved.
+CAPACITY_PROTECTION_PARAMS = (
+    "fsm_guided_intake.urgent_capacity_reserve_pct",
+    "fsm_guided_intake.protect_standard_to_basic_pct",
+    "fsm_guided_intake.protect_fiber_to_basic_pct",
+    "fsm_guided_intake.protect_fiber_to_standard_pct",
+    "fsm_guided_intake.capacity_forecast_enabled",
+)
+
 class ResConfigSettings(models.TransientModel):
     _inherit = "res.config.settings"
 
@@ -30,6 +39,21 @@ class ResConfigSettings(models.TransientModel):
         default="Done",
         help="When a task's stage name matches this value (case-insensitive), the system will prepare the Sales Order and create a draft invoice.",
     )
+    fsm_auto_invoice_batch_size = fields.Integer(
+        string="Auto-Invoice Batch Size",
+        config_parameter="fsm_guided_intake.auto_invoice_batch_size",
+        default=20,
+        help="Done tasks the scheduled auto-invoicing commits at a time.",
+    )
+    fsm_auto_invoice_time_budget_seconds = fields.Integer(
+        string="Auto-Invoice Time Budget (Seconds)",
+        config_parameter="fsm_guided_intake.auto_invoice_time_budget_seconds",
+        default=120,
+        help=(
+            "Seconds a scheduled auto-invoicing run may start new batches for; "
+            "remaining tasks are invoiced on the next run. 0 means no limit."
+        ),
+    )
     fsm_slot_start_lead_minutes = fields.Integer(
         string="Slot Start Lead Minutes",
         config_parameter="fsm_guided_intake.slot_start_lead_minutes",
@@ -90,6 +114,52 @@ class ResConfigSettings(models.TransientModel):
         default=0.40,
         help="Percent of a Fiber (L3) team's capacity kept reserved from Standard (L2) bookings when down-skilling.",
     )
+    fsm_capacity_forecast_enabled = fields.Boolean(
+        string="Forecast Urgent Capacity Reserve",
+        config_parameter="fsm_guided_intake.capacity_forecast_enabled",
+        default=False,
+        help=(
+            "Replace the static urgent reserve with a per team-day reserve forecast "
+            "from recent short-notice demand. Requires the numpy Python library."
+        ),
+    )
+    fsm_capacity_forecast_history_weeks = fields.Integer(
+        string="Forecast History (Weeks)",
+        config_parameter="fsm_guided_intake.capacity_forecast_history_weeks",
+        default=12,
+        help="Weeks of past reservations and appointments the demand forecast learns from.",
+    )
+    fsm_capacity_forecast_smoothing = fields.Float(
+        string="Forecast Smoothing Factor",
+        config_parameter="fsm_guided_intake.capacity_forecast_smoothing",
+        default=0.3,
+        help="Exponential smoothing factor between 0 and 1; higher values follow recent demand more closely.",
+    )
+    fsm_dispatch_parallel_workers = fields.Integer(
+        string="Parallel Dispatch Workers",
+        config_parameter="fsm_guided_intake.dispatch_parallel_workers",
+        default=0,
+        help=(
+            "Number of zones the scheduled dispatch planner processes at once, "
+            "each in its own transaction. 0 or 1 keeps the serial "
+            "single-transaction run; manual runs are always serial."
+        ),
+    )
+    fsm_shift_sync_horizon_weeks = fields.Integer(
+        string="Shift Sync Horizon (Weeks)",
+        config_parameter="fsm_guided_intake.shift_sync_horizon_weeks",
+        default=8,
+        help="Weeks ahead, from the current week, for which technician Planning shifts are generated.",
+    )
+    fsm_shift_sync_time_budget_seconds = fields.Integer(
+        string="Shift Sync Time Budget (Seconds)",
+        config_parameter="fsm_guided_intake.shift_sync_time_budget_seconds",
+        default=90,
+        help=(
+            "Seconds a scheduled shift synchronization may run before it stops "
+            "and resumes from its checkpoint on the next run. 0 means no limit."
+        ),
+    )
     fsm_l3_capacity_reserve_hours = fields.Float(
         string="L3 Capacity Reserve (Hours)",
         config_parameter="fsm_guided_intake.l3_capacity_reserve_hours",
@@ -97,3 +167,10 @@ class ResConfigSettings(models.TransientModel):
         help="Hours of daily capacity to keep reserved for L3 work when offering slots.",
     )
 
+    def set_values(self):
+        icp = self.env["ir.config_parameter"].sudo()
+        previous = {key: icp.get_param(key) for key in CAPACITY_PROTECTION_PARAMS}
+        super().set_values()
+        if any(icp.get_param(key) != value for key, value in previous.items()):
+            teams = self.env["fsm.team"].sudo().search([("active", "=", True)])
+            self.env["fsm.capacity.dirty"].mark(teams, reason="protection settings")
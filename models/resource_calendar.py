@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+
+class ResourceCalendar(models.Model):
+    _inherit = "resource.calendar"
+
+    # Attendance commands written through the calendar form reach the
+    # attendance overrides below, so the calendar itself needs no write hook.
+
+    def _fsm_mark_capacity_dirty(self):
+        teams = self.env["fsm.team"]._fsm_teams_for_calendars(self)
+        self.env["fsm.capacity.dirty"].mark(teams, reason="calendar")
+
+    def _fsm_mark_planning_dirty(self):
+        if not self:
+            return
+        employees = self.env["hr.employee"].sudo().search([("resource_calendar_id", "in", self.ids)])
+        self.env["fsm.planning.dirty"].mark(employees, reason="calendar")
+
+
+class ResourceCalendarAttendance(models.Model):
+    _inherit = "resource.calendar.attendance"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        attendances = super().create(vals_list)
+        attendances.calendar_id._fsm_mark_capacity_dirty()
+        attendances.calendar_id._fsm_mark_planning_dirty()
+        return attendances
+
+    def write(self, vals):
+        calendars = self.calendar_id
+        result = super().write(vals)
+        (calendars | self.calendar_id)._fsm_mark_capacity_dirty()
+        (calendars | self.calendar_id)._fsm_mark_planning_dirty()
+        return result
+
+    def unlink(self):
+        calendars = self.calendar_id
+        result = super().unlink()
+        calendars.exists()._fsm_mark_capacity_dirty()
+        calendars.exists()._fsm_mark_planning_dirty()
+        return result
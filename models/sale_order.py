@@ -21,3 +21,17 @@ class SaleOrder(models.Model):
                 "default_state": "type",
             },
         }
+
+
+class SaleOrderLine(models.Model):
+    _inherit = "sale.order.line"
+
+    fsm_task_id = fields.Many2one(
+        "project.task",
+        string="Field Service Task",
+        copy=False,
+        readonly=True,
+        index="btree_not_null",
+        ondelete="set null",
+        help="Task whose materials this line bills; preparing the task again updates the line.",
+    )
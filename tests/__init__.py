@@ -2,3 +2,5 @@ from . import test_initial_scheduling
 from . import test_slot_engine
 from . import test_planning_shift_sync
 from . import test_planning_availability
+from . import test_dispatch_planner
+from . import test_capacity_generation
@@ -0,0 +1,135 @@
+from datetime import date, timedelta
+import unittest
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.fsm_guided_intake.models.fsm_capacity_forecast import np
+
+
+class TestCapacityGeneration(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.team = cls.env["fsm.team"].create({
+            "skill_level": "L3",
+            "shift_ids": [(0, 0, {
+                "name": "Weekday",
+                "pattern": "mon_fri",
+                "start_time": 8.0,
+                "end_time": 16.0,
+                "capacity_hours": 8.0,
+            })],
+        })
+        cls.capacity_model = cls.env["fsm.capacity.day"]
+        cls.monday = date(2026, 8, 17)
+        cls.sunday = date(2026, 8, 16)
+
+    def _team_days(self):
+        return self.capacity_model.search([("team_id", "=", self.team.id)])
+
+    def test_generation_creates_days_and_protected_bucket_lines(self):
+        self.capacity_model.generate_from_shifts(self.sunday, self.monday)
+
+        day = self._team_days()
+        self.assertEqual(day.date, self.monday)
+        self.assertEqual(day.total_minutes, 480)
+        self.assertEqual(day.remaining_minutes, 480)
+        lines = {line.bucket_skill_level: line for line in day.line_ids}
+        self.assertEqual(set(lines), {"L1", "L2", "L3"})
+        self.assertEqual(lines["L3"].sellable_minutes, 480)
+        self.assertEqual(lines["L2"].protected_minutes, 192)
+        self.assertEqual(lines["L1"].available_minutes, 288)
+
+    def test_regeneration_updates_lines_in_place_and_keeps_consumption(self):
+        self.capacity_model.generate_from_shifts(self.monday, self.monday)
+        day = self._team_days()
+        line = day.line_ids.filtered(lambda l: l.bucket_skill_level == "L3")
+        self.env["fsm.capacity.ledger"].consume(line, 60)
+
+        self.env["ir.config_parameter"].sudo().set_param(
+            "fsm_guided_intake.urgent_capacity_reserve_pct", "0.25"
+        )
+        self.capacity_model.generate_from_shifts(self.monday, self.monday)
+
+        self.assertEqual(self._team_days(), day)
+        self.assertTrue(line.exists())
+        self.assertEqual(day.reserved_minutes, 120)
+        self.assertEqual(line.sellable_minutes, 360)
+        self.assertEqual(line.available_minutes, 300)
+        self.assertEqual(day.booked_minutes, 60)
+        self.assertEqual(day.remaining_minutes, 300)
+
+    def test_shift_edit_queues_and_rebuilds_only_the_team(self):
+        today, horizon_end = self.capacity_model._capacity_horizon()
+        self.capacity_model.generate_from_shifts(today, horizon_end)
+        Dirty = self.env["fsm.capacity.dirty"]
+        Dirty.search([]).unlink()
+
+        self.team.shift_ids.write({"end_time": 14.0, "capacity_hours": 6.0})
+
+        queued = Dirty.search([("team_id", "=", self.team.id)])
+        self.assertTrue(queued)
+        self.assertEqual(min(queued.mapped("date_from")), today)
+        Dirty.process_dirty()
+
+        self.assertFalse(Dirty.search([]))
+        self.assertEqual(set(self._team_days().mapped("total_minutes")), {360})
+
+    def test_new_team_is_queued_and_gets_capacity(self):
+        today, horizon_end = self.capacity_model._capacity_horizon()
+        Dirty = self.env["fsm.capacity.dirty"]
+        Dirty.search([]).unlink()
+
+        team = self.env["fsm.team"].create({
+            "skill_level": "L1",
+            "shift_ids": [(0, 0, {
+                "name": "Mornings",
+                "pattern": "mon_fri",
+                "start_time": 8.0,
+                "end_time": 12.0,
+                "capacity_hours": 4.0,
+            })],
+        })
+
+        self.assertIn("team", Dirty.search([("team_id", "=", team.id)]).mapped("reason"))
+        Dirty.process_dirty()
+
+        days = self.capacity_model.search([("team_id", "=", team.id)])
+        self.assertTrue(days)
+        self.assertTrue(all(today <= day <= horizon_end for day in days.mapped("date")))
+        self.assertEqual(set(days.mapped("total_minutes")), {240})
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_forecast_follows_weekday_demand(self):
+        days = [self.sunday - timedelta(days=27 - i) for i in range(28)]
+        # 60 minutes of urgent demand on Mondays, nothing on other days.
+        history = [[60.0 if day.weekday() == 0 else 0.0 for day in days]]
+        horizon = [self.monday, self.monday + timedelta(days=1)]
+
+        forecast = self.env["fsm.capacity.forecast"]._fit_daily_demand(
+            history, days, horizon, 0.3
+        )
+
+        self.assertAlmostEqual(forecast[0][0], 60.0, places=3)
+        self.assertAlmostEqual(forecast[0][1], 0.0, places=3)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_forecast_reserve_replaces_static_urgent_reserve(self):
+        icp = self.env["ir.config_parameter"].sudo()
+        icp.set_param("fsm_guided_intake.urgent_capacity_reserve_pct", "0.25")
+        icp.set_param("fsm_guided_intake.capacity_forecast_enabled", "True")
+        tuesday = self.monday + timedelta(days=1)
+        self.env["fsm.capacity.forecast"].create({
+            "team_id": self.team.id,
+            "date": self.monday,
+            "demand_minutes": 45,
+            "reserve_minutes": 45,
+        })
+
+        self.capacity_model.generate_from_shifts(self.monday, tuesday)
+
+        reserved = {day.date: day.reserved_minutes for day in self._team_days()}
+        self.assertEqual(reserved[self.monday], 45)
+        # Days without a forecast keep the static percentage.
+        self.assertEqual(reserved[tuesday], 120)
@@ -0,0 +1,321 @@
+from datetime import datetime, time, timedelta
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.fsm_guided_intake.models.fsm_dispatch_planner import _DispatchStats
+
+
+class TestDispatchPlanner(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.project = cls.env["project.project"].create({
+            "name": "Dispatch Planner Test",
+            "is_fsm": True,
+            "company_id": cls.env.company.id,
+        })
+        cls.team = cls.env["fsm.team"].create({
+            "lead_user_id": cls.env.user.id,
+            "warehouse_id": cls.env["stock.warehouse"].search([], limit=1).id,
+            "skill_level": "L1",
+        })
+        cls.task_type = cls.env["fsm.task.type"].create({
+            "name": "Dispatch Planner Visit",
+            "project_id": cls.project.id,
+            "skill_level": "L1",
+            "preferred_team_ids": [(6, 0, cls.team.ids)],
+        })
+        cls.partner = cls.env["res.partner"].create({
+            "name": "Dispatch Planner Customer",
+        })
+        cls.service_date = fields.Date.context_today(cls.env.user) + timedelta(days=1)
+        cls.capacity_day = cls.env["fsm.capacity.day"].create({
+            "team_id": cls.team.id,
+            "date": cls.service_date,
+            "skill_level": "L1",
+            "state": "ready",
+            "total_minutes": 480,
+            "line_ids": [(0, 0, {
+                "bucket_skill_level": "L1",
+                "total_minutes": 480,
+                "sellable_minutes": 480,
+                "available_minutes": 480,
+            })],
+        })
+
+    def _task(self):
+        return self.env["project.task"].with_context(
+            fsm_skip_auto_stage=True,
+        ).create({
+            "name": "Dispatch planner task",
+            "is_fsm": True,
+            "project_id": self.project.id,
+            "partner_id": self.partner.id,
+            "fsm_task_type_id": self.task_type.id,
+        })
+
+    def _reservation(self, required_minutes=60):
+        task = self._task()
+        return self.env["fsm.day.reservation"].create({
+            "task_id": task.id,
+            "service_date": self.service_date,
+            "task_type_id": self.task_type.id,
+            "required_minutes": required_minutes,
+            "capacity_bucket": "L1",
+        })
+
+    def _plan(self):
+        planner = self.env["fsm.dispatch.planner"].create({
+            "run_date": self.service_date,
+        })
+        planner.action_plan()
+        return planner
+
+    def test_run_history_records_assignments_and_utilization(self):
+        reservation = self._reservation(required_minutes=60)
+        skipped = self._reservation(required_minutes=0)
+
+        run = self._plan().run_id
+
+        self.assertEqual(reservation.dispatch_state, "finalized")
+        self.assertEqual(run.target_date, self.service_date)
+        self.assertEqual(run.reservation_count, 2)
+        self.assertEqual(run.assigned_count, 1)
+        self.assertEqual(run.skipped_count, 1)
+        self.assertEqual(run.skip_ids.reservation_id, skipped)
+        self.assertEqual(run.skip_ids.reason, "missing_minutes")
+        utilization = run.utilization_ids
+        self.assertEqual(utilization.team_id, self.team)
+        self.assertEqual(utilization.available_before_minutes, 480)
+        self.assertEqual(utilization.dispatched_minutes, 60)
+        self.assertEqual(utilization.available_after_minutes, 420)
+        self.assertAlmostEqual(utilization.utilization, 12.5)
+        self.assertGreaterEqual(run.duration_total, 0.0)
+
+    def test_run_history_is_kept_without_pending_reservations(self):
+        run = self._plan().run_id
+
+        self.assertTrue(run)
+        self.assertEqual(run.reservation_count, 0)
+        self.assertFalse(run.utilization_ids)
+
+    def test_zone_worker_resumes_after_committed_work_and_merge_reports_failures(self):
+        if not self.registry.in_test_mode():
+            # Zone workers open their own cursor; share the test transaction.
+            self.registry.enter_test_mode(self.cr)
+            self.addCleanup(self.registry.leave_test_mode)
+        first = self._reservation(required_minutes=60)
+        self._plan()
+        second = self._reservation(required_minutes=30)
+        planner = self.env["fsm.dispatch.planner"].create({"run_date": self.service_date})
+
+        result = planner._dispatch_zone_job(self.service_date, second.ids)
+        self.env.invalidate_all()
+
+        self.assertEqual(result["assigned"], second.ids)
+        self.assertEqual(second.assigned_start_datetime, first.assigned_end_datetime)
+
+        stats = _DispatchStats(self.cr)
+        assigned, skipped, dispatched, failed_zones = planner._merge_zone_results(
+            [result, {"zone": "North", "error": "boom"}], stats
+        )
+        self.assertEqual(assigned, [second])
+        self.assertEqual(skipped, [])
+        self.assertEqual(dispatched, {second.capacity_line_id.id: 30})
+        self.assertEqual(failed_zones, [("North", "boom")])
+
+        run = planner._record_run(
+            self.service_date, fields.Datetime.now(), stats, second, assigned, skipped,
+            {}, {}, dispatched, "partial", worker_count=2, state="partial", failed_zones=failed_zones,
+        )
+        self.assertEqual(run.state, "partial")
+        self.assertEqual(run.failed_zones, "North")
+
+    def test_parallel_cron_run_keeps_other_zones_when_one_worker_fails(self):
+        if not self.registry.in_test_mode():
+            self.registry.enter_test_mode(self.cr)
+            self.addCleanup(self.registry.leave_test_mode)
+        # Workers share the test transaction; the hand-off commit must not end it.
+        self.patch(self.env.cr, "commit", lambda: None)
+        north = self._reservation(required_minutes=60)
+        south = self._reservation(required_minutes=30)
+        north.zone = "North"
+        south.zone = "South"
+        Planner = type(self.env["fsm.dispatch.planner"])
+        zone_job = Planner._dispatch_zone_job
+
+        def failing_zone_job(planner, target_date, reservation_ids):
+            if reservation_ids == north.ids:
+                raise ValueError("North worker crashed")
+            return zone_job(planner, target_date, reservation_ids)
+
+        self.patch(Planner, "_parallel_worker_count", lambda planner: 2)
+        self.patch(Planner, "_dispatch_zone_job", failing_zone_job)
+        planner = self.env["fsm.dispatch.planner"].create({"run_date": self.service_date})
+        planner.with_context(fsm_dispatch_trigger="cron").action_plan()
+        self.env.invalidate_all()
+
+        run = planner.run_id
+        self.assertEqual(run.state, "partial")
+        self.assertEqual(run.failed_zones, "North")
+        self.assertEqual(run.worker_count, 2)
+        self.assertEqual(run.assigned_count, 1)
+        self.assertEqual(south.dispatch_state, "finalized")
+        self.assertEqual(north.dispatch_state, "pending")
+        self.assertIn("North worker crashed", run.result_message)
+
+    def test_ledger_refuses_to_oversell_a_line(self):
+        ledger = self.env["fsm.capacity.ledger"]
+        line = self.capacity_day.line_ids
+
+        self.assertTrue(ledger.consume(line, 400))
+        self.assertFalse(ledger.consume(line, 100))
+
+        self.assertEqual(line.available_minutes, 80)
+        self.assertEqual(self.capacity_day.booked_minutes, 400)
+        self.assertEqual(self.capacity_day.remaining_minutes, 80)
+
+    def test_cancelled_reservation_releases_capacity(self):
+        reservation = self._reservation(required_minutes=90)
+        self._plan()
+        line = self.capacity_day.line_ids
+        self.assertEqual(reservation.capacity_line_id, line)
+        self.assertEqual(line.available_minutes, 390)
+        # The dispatched booking is counted once, through its reservation.
+        self.assertEqual(self.capacity_day.booked_minutes, 90)
+        self.assertFalse(reservation.task_id.fsm_booking_id.capacity_day_id)
+
+        reservation.action_cancel_dispatch()
+
+        self.assertEqual(reservation.dispatch_state, "cancelled")
+        self.assertEqual(line.available_minutes, 480)
+        self.assertEqual(self.capacity_day.booked_minutes, 0)
+
+    def test_exact_booking_keeps_booked_minutes_live(self):
+        start = datetime.combine(self.service_date, time(16, 0))
+        booking = self.env["fsm.booking"].create({
+            "task_id": self._task().id,
+            "team_id": self.team.id,
+            "start_datetime": start,
+            "end_datetime": start + timedelta(hours=2),
+            "allocated_hours": 2.0,
+        })
+
+        self.assertEqual(booking.capacity_day_id, self.capacity_day)
+        self.assertEqual(self.capacity_day.booked_minutes, 120)
+        self.assertEqual(self.capacity_day.remaining_minutes, 360)
+
+        booking.write({
+            "start_datetime": start + timedelta(days=1),
+            "end_datetime": start + timedelta(days=1, hours=2),
+        })
+        self.assertFalse(booking.capacity_day_id)
+        self.assertEqual(self.capacity_day.booked_minutes, 0)
+
+        booking.write({
+            "start_datetime": start,
+            "end_datetime": start + timedelta(hours=2),
+        })
+        booking.action_cancel()
+        self.assertEqual(self.capacity_day.booked_minutes, 0)
+        self.assertEqual(self.capacity_day.remaining_minutes, 480)
+
+    def test_reconciliation_reports_and_fixes_drift(self):
+        start = datetime.combine(self.service_date, time(16, 0))
+        self.env["fsm.booking"].create({
+            "task_id": self._task().id,
+            "team_id": self.team.id,
+            "start_datetime": start,
+            "end_datetime": start + timedelta(hours=1),
+            "allocated_hours": 1.0,
+        })
+        self.capacity_day.write({"booked_minutes": 300})
+
+        drift = self.env["fsm.capacity.ledger"].reconcile_booked_minutes(
+            self.service_date, self.service_date
+        )
+
+        self.assertEqual(drift, [(self.capacity_day.id, 300, 60)])
+        self.assertEqual(self.capacity_day.booked_minutes, 60)
+        self.assertEqual(self.capacity_day.remaining_minutes, 420)
+
+    def test_capacity_report_aggregates_capacity_and_appointments(self):
+        start = datetime.combine(self.service_date, time(16, 0))
+        self.env["fsm.booking"].create({
+            "task_id": self._task().id,
+            "team_id": self.team.id,
+            "start_datetime": start,
+            "end_datetime": start + timedelta(minutes=90),
+            "allocated_hours": 1.5,
+        })
+        self.env.flush_all()
+
+        rows = self.env["fsm.capacity.report"].search([
+            ("team_id", "=", self.team.id),
+        ])
+
+        self.assertEqual(sum(rows.mapped("total_minutes")), 480)
+        self.assertEqual(sum(rows.mapped("booked_minutes")), 90)
+        self.assertEqual(sum(rows.mapped("remaining_minutes")), 390)
+        self.assertEqual(sum(rows.mapped("booking_minutes")), 90)
+        self.assertEqual(sum(rows.mapped("booking_count")), 1)
+
+    def test_capacity_report_counts_each_capacity_day_once(self):
+        fiber_team = self.env["fsm.team"].create({"skill_level": "L3"})
+        day = self.env["fsm.capacity.day"].create({
+            "team_id": fiber_team.id,
+            "date": self.service_date,
+            "skill_level": "L3",
+            "state": "ready",
+            "total_minutes": 480,
+            "reserved_minutes": 48,
+            "line_ids": [(0, 0, {
+                "bucket_skill_level": bucket,
+                "total_minutes": 432,
+                "protected_minutes": 432 - sellable,
+                "sellable_minutes": sellable,
+                "available_minutes": sellable,
+            }) for bucket, sellable in (("L3", 432), ("L2", 259), ("L1", 259))],
+        })
+        fiber_line = day.line_ids.filtered(lambda line: line.bucket_skill_level == "L3")
+        self.assertTrue(self.env["fsm.capacity.ledger"].consume(fiber_line, 60))
+        self.env.flush_all()
+
+        week_start = self.service_date - timedelta(days=self.service_date.weekday())
+        rows = self.env["fsm.capacity.report"].search([
+            ("team_id", "=", fiber_team.id),
+            ("week_start", "=", week_start),
+        ])
+
+        self.assertEqual(sum(rows.mapped("total_minutes")), day.total_minutes)
+        self.assertEqual(sum(rows.mapped("reserved_minutes")), day.reserved_minutes)
+        self.assertEqual(sum(rows.mapped("booked_minutes")), day.booked_minutes)
+        fiber = rows.filtered(lambda row: row.bucket == "L3")
+        self.assertEqual(fiber.sellable_minutes, day.sellable_minutes)
+        self.assertEqual(fiber.remaining_minutes, day.remaining_minutes)
+        basic = rows.filtered(lambda row: row.bucket == "L1")
+        self.assertEqual((basic.total_minutes, basic.sellable_minutes, basic.remaining_minutes), (0, 259, 259))
+
+    def test_capacity_report_dates_appointments_in_local_weeks(self):
+        self.env.company.partner_id.tz = "America/El_Salvador"
+        sunday = self.service_date + timedelta(days=6 - self.service_date.weekday())
+        # 04:00 UTC on Monday is still Sunday evening in San Salvador.
+        start = datetime.combine(sunday + timedelta(days=1), time(4, 0))
+        self.env["fsm.booking"].create({
+            "task_id": self._task().id,
+            "team_id": self.team.id,
+            "start_datetime": start,
+            "end_datetime": start + timedelta(hours=1),
+            "allocated_hours": 1.0,
+        })
+        self.env.flush_all()
+
+        row = self.env["fsm.capacity.report"].search([
+            ("team_id", "=", self.team.id),
+            ("booking_count", ">", 0),
+        ])
+
+        self.assertEqual(row.week_start, sunday - timedelta(days=6))
+        self.assertEqual(row.bucket, "L1")
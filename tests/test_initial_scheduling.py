@@ -144,3 +144,199 @@ class TestInitialScheduling(TransactionCase):
             fields.Datetime.to_datetime(defaults["search_start_dt"]),
             before_local,
         )
+
+    def test_stage_roles_are_cached_per_project_until_stages_change(self):
+        task = self._new_task()
+
+        self.assertEqual(task._fsm_role_stage("unscheduled"), self.to_schedule_stage)
+        self.assertEqual(task._fsm_role_stage("scheduled"), self.scheduled_stage)
+        self.assertEqual(task._fsm_role_stage("rescheduled"), self.rescheduled_stage)
+
+        self.scheduled_stage.name = "Scheduled (legacy)"
+
+        self.assertEqual(task._fsm_role_stage("scheduled"), self.planned_stage)
+
+    def test_stage_roles_follow_project_stage_list_changes(self):
+        task = self._new_task()
+        replacement = self.env["project.task.type"].create({"name": "To Be Scheduled"})
+        self.assertEqual(task._fsm_role_stage("unscheduled"), self.to_schedule_stage)
+
+        self.project.write({"type_ids": [(3, self.to_schedule_stage.id), (4, replacement.id)]})
+
+        self.assertEqual(task._fsm_role_stage("unscheduled"), replacement)
+
+    def test_bulk_created_scheduled_tasks_land_on_scheduled_stage(self):
+        start = fields.Datetime.now() + timedelta(days=3)
+        tasks = self.env["project.task"].create([
+            {
+                "name": "Bulk appointment %s" % index,
+                "is_fsm": True,
+                "project_id": self.project.id,
+                "stage_id": self.to_schedule_stage.id,
+                "planned_date_begin": start,
+                "date_deadline": start + timedelta(hours=1),
+            }
+            for index in range(3)
+        ])
+
+        self.assertEqual(tasks.stage_id, self.scheduled_stage)
+
+    def test_bulk_create_applies_prefetched_type_partner_and_team_values(self):
+        self.task_type.bonus_base_points = 7
+        self.partner.write({"partner_latitude": 13.6929, "partner_longitude": -89.2182})
+
+        tasks = self.env["project.task"].with_context(fsm_skip_auto_stage=True).create([
+            {
+                "name": "Imported appointment %s" % index,
+                "is_fsm": True,
+                "project_id": self.project.id,
+                "fsm_task_type_id": self.task_type.id,
+                "partner_id": self.partner.id,
+                "team_id": self.team.id,
+            }
+            for index in range(3)
+        ])
+
+        for task in tasks:
+            self.assertEqual(task.bonus_points, 7)
+            self.assertAlmostEqual(task.fsm_latitude, 13.6929)
+            self.assertAlmostEqual(task.fsm_longitude, -89.2182)
+            self.assertEqual(task.user_ids, self.env.user)
+
+    def test_bulk_coordinate_changes_update_partners_and_queue_notes(self):
+        tasks = self._new_task() | self._new_task(name="Second appointment")
+        message_counts = {task.id: len(task.message_ids) for task in tasks}
+
+        tasks.with_context(fsm_coordinate_async=True).write({"fsm_latitude": 13.7, "fsm_longitude": -89.2})
+
+        self.assertAlmostEqual(self.partner.partner_latitude, 13.7)
+        self.assertAlmostEqual(self.partner.partner_longitude, -89.2)
+        queued = self.env["fsm.coordinate.note"].search([("task_id", "in", tasks.ids)])
+        self.assertEqual(len(queued), 2)
+        for task in tasks:
+            self.assertEqual(len(task.message_ids), message_counts[task.id])
+
+        self.env["fsm.coordinate.note"].cron_process_queue()
+
+        self.assertFalse(queued.exists())
+        for task in tasks:
+            self.assertEqual(len(task.message_ids), message_counts[task.id] + 1)
+            self.assertIn("GPS coordinates updated", task.message_ids[0].body)
+
+    def test_interactive_coordinate_change_posts_note_immediately(self):
+        tasks = self._new_task() | self._new_task(name="Second appointment")
+        message_count = len(tasks[0].message_ids)
+
+        tasks.write({"fsm_latitude": 13.8, "fsm_longitude": -89.1})
+
+        self.assertFalse(self.env["fsm.coordinate.note"].search([("task_id", "in", tasks.ids)]))
+        self.assertEqual(len(tasks[0].message_ids), message_count + 1)
+        self.assertAlmostEqual(self.partner.partner_latitude, 13.8)
+
+    def test_auto_invoice_cron_flags_failures_and_stops_on_time_budget(self):
+        icp = self.env["ir.config_parameter"].sudo()
+        icp.set_param("fsm_guided_intake.auto_invoice_on_stage_done", "True")
+        icp.set_param("fsm_guided_intake.invoice_stage_done_name", "Invoice Ready")
+        done_stage = self.env["project.task.type"].create({
+            "name": "Invoice Ready",
+            "project_ids": [(4, self.project.id)],
+        })
+        product = self.env["product.product"].create({"name": "Drop cable", "type": "consu"})
+        tasks = self._new_task(stage_id=done_stage.id) | self._new_task(stage_id=done_stage.id)
+        for task in tasks:
+            self.env["fsm.task.material"].create({"task_id": task.id, "product_id": product.id})
+
+        Task = self.env["project.task"]
+        first_run = Task._fsm_auto_invoice_done_tasks(batch_size=1, time_budget=1e-9)
+
+        # Draft orders cannot be invoiced: the oldest task is flagged, the other waits for the next run.
+        self.assertEqual(first_run, {"invoiced": 0, "failed": 1, "skipped": 0, "pending": 1})
+        self.assertTrue(tasks[0].fsm_invoice_error)
+        self.assertFalse(tasks[1].fsm_invoice_error)
+
+        second_run = Task._fsm_auto_invoice_done_tasks(batch_size=1, time_budget=0)
+        self.assertEqual(second_run, {"invoiced": 0, "failed": 1, "skipped": 0, "pending": 0})
+        self.assertTrue(tasks[1].fsm_invoice_error)
+
+        tasks[0].with_context(fsm_skip_auto_stage=True).write({"stage_id": self.scheduled_stage.id})
+        self.assertFalse(tasks[0].fsm_invoice_error)
+
+        # A failing batch falls back to one savepoint per task.
+        more = self._new_task(stage_id=done_stage.id) | self._new_task(stage_id=done_stage.id)
+        for task in more:
+            self.env["fsm.task.material"].create({"task_id": task.id, "product_id": product.id})
+        batched_run = Task._fsm_auto_invoice_done_tasks(batch_size=2, time_budget=0)
+        self.assertEqual(batched_run, {"invoiced": 0, "failed": 2, "skipped": 0, "pending": 0})
+        self.assertTrue(all(more.mapped("fsm_invoice_error")))
+
+    def test_auto_invoice_retries_a_flagged_task_once_an_order_is_linked(self):
+        icp = self.env["ir.config_parameter"].sudo()
+        icp.set_param("fsm_guided_intake.auto_invoice_on_stage_done", "True")
+        icp.set_param("fsm_guided_intake.invoice_stage_done_name", "Invoice Ready")
+        done_stage = self.env["project.task.type"].create({
+            "name": "Invoice Ready",
+            "project_ids": [(4, self.project.id)],
+        })
+        product = self.env["product.product"].create({
+            "name": "Fiber drop",
+            "type": "consu",
+            "invoice_policy": "order",
+            "fsm_bill_from_task": True,
+        })
+        task = self._new_task(stage_id=done_stage.id)
+        self.env["fsm.task.material"].create({"task_id": task.id, "product_id": product.id})
+        Task = self.env["project.task"]
+
+        Task._fsm_auto_invoice_done_tasks(batch_size=1, time_budget=0)
+        self.assertTrue(task.fsm_invoice_error)
+        self.assertFalse(task.fsm_invoiced)
+
+        order = self.env["sale.order"].create({"partner_id": self.partner.id})
+        order.action_confirm()
+        task.sale_order_id = order
+        self.assertFalse(task.fsm_invoice_error)
+
+        run = Task._fsm_auto_invoice_done_tasks(batch_size=1, time_budget=0)
+
+        self.assertEqual(run, {"invoiced": 1, "failed": 0, "skipped": 0, "pending": 0})
+        self.assertTrue(task.fsm_invoiced)
+        self.assertEqual(task.fsm_last_invoiced_so_id, order)
+        self.assertTrue(order.invoice_ids)
+
+    def test_prepare_invoice_is_idempotent_and_leaves_other_lines_alone(self):
+        product = self.env["product.product"].create({
+            "name": "Fiber drop",
+            "type": "consu",
+            "fsm_bill_from_task": True,
+        })
+        order = self.env["sale.order"].create({"partner_id": self.partner.id})
+        manual_line = self.env["sale.order.line"].create({
+            "order_id": order.id,
+            "product_id": product.id,
+            "product_uom_qty": 1.0,
+        })
+        shared = self._new_task(sale_order_id=order.id) | self._new_task(sale_order_id=order.id)
+        standalone = self._new_task()
+        for task, qty in zip(shared | standalone, (2.0, 3.0, 4.0)):
+            self.env["fsm.task.material"].create({
+                "task_id": task.id,
+                "product_id": product.id,
+                "product_uom_qty": qty,
+            })
+
+        (shared | standalone).action_fsm_prepare_invoice()
+        (shared | standalone).action_fsm_prepare_invoice()
+
+        task_lines = order.order_line - manual_line
+        self.assertEqual(manual_line.product_uom_qty, 1.0)
+        self.assertEqual(task_lines.fsm_task_id, shared)
+        self.assertEqual(sorted(task_lines.mapped("product_uom_qty")), [2.0, 3.0])
+        self.assertNotEqual(standalone.sale_order_id, order)
+        self.assertEqual(standalone.sale_order_id.order_line.mapped("product_uom_qty"), [4.0])
+
+        shared[0].fsm_material_ids.product_uom_qty = 5.0
+        shared.action_fsm_prepare_invoice()
+        self.assertEqual(
+            (order.order_line - manual_line).filtered(lambda line: line.fsm_task_id == shared[0]).product_uom_qty,
+            5.0,
+        )
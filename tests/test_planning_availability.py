@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 
 from odoo.tests.common import TransactionCase
 
@@ -171,6 +171,42 @@ class TestPlanningAvailability(TransactionCase):
         self.assertEqual(slots[0]["start"], datetime(2026, 8, 17, 10, 0))
         self.assertEqual(set(users.ids), {self.user_one.id, self.user_two.id})
 
+    def test_crew_windows_are_stored_by_shift_hooks_not_by_searches(self):
+        self.env.company.partner_id.tz = "America/El_Salvador"
+        shift = self._shift(
+            self.employee_one,
+            datetime(2026, 8, 17, 14, 0),
+            datetime(2026, 8, 17, 23, 0),
+        )
+        stored = self.env["fsm.crew.window"].search([
+            ("team_id", "=", self.team.id),
+            ("date", "=", date(2026, 8, 17)),
+        ])
+        self.assertEqual(stored.tz, "America/El_Salvador")
+        self.assertEqual(stored.windows, [["2026-08-17 08:00:00", "2026-08-17 17:00:00"]])
+
+        shift.write({"start_datetime": datetime(2026, 8, 17, 21, 0)})
+        slots = self._slots(
+            datetime(2026, 8, 17, 7, 0),
+            datetime(2026, 8, 18, 0, 0),
+            limit=1,
+        )
+
+        self.assertEqual(slots[0]["start"], datetime(2026, 8, 17, 15, 0))
+        self.assertEqual(stored.windows, [["2026-08-17 15:00:00", "2026-08-17 17:00:00"]])
+
+        # Searching from another timezone converts the stored rows and never writes any.
+        stored.unlink()
+        utc_slots = self.engine.with_context(tz="UTC").compute_top_slots(
+            teams=self.team,
+            start_dt_local=datetime(2026, 8, 17, 13, 0),
+            date_end_local=datetime(2026, 8, 18, 6, 0),
+            needed_hours=1.0,
+            limit=1,
+        )
+        self.assertEqual(utc_slots[0]["start"], datetime(2026, 8, 17, 21, 0))
+        self.assertFalse(self.env["fsm.crew.window"].search([("team_id", "=", self.team.id)]))
+
     def test_team_roster_change_updates_only_effective_and_future_shifts(self):
         old_team = self.env["fsm.team"].create({
             "member_ids": [(6, 0, [self.employee_one.id])],
@@ -198,3 +234,70 @@ class TestPlanningAvailability(TransactionCase):
 
         self.assertEqual(historical.fsm_team_id, old_team)
         self.assertEqual(future.fsm_team_id, new_team)
+
+    def test_roster_propagation_resolves_leads_and_members_in_one_pass(self):
+        first = self._shift(
+            self.employee_one,
+            datetime(2026, 8, 20, 14, 0),
+            datetime(2026, 8, 20, 23, 0),
+        )
+        second = self._shift(
+            self.employee_two,
+            datetime(2026, 8, 20, 14, 0),
+            datetime(2026, 8, 20, 23, 0),
+        )
+        crew = self.env["fsm.team"].with_context(
+            fsm_team_effective_date="2026-08-18",
+        ).create({
+            "lead_user_id": self.user_one.id,
+            "member_ids": [(6, 0, [self.employee_two.id])],
+        })
+
+        self.assertEqual(
+            crew._fsm_planning_team_by_employee(self.employee_one | self.employee_two),
+            {self.employee_one.id: crew, self.employee_two.id: crew},
+        )
+        self.assertEqual(first.fsm_team_id, crew)
+        self.assertEqual(second.fsm_team_id, crew)
+
+    def test_planning_capacity_sums_crew_overlap(self):
+        self._shift(
+            self.employee_one,
+            datetime(2026, 8, 17, 14, 0),
+            datetime(2026, 8, 17, 23, 0),
+        )
+        self._shift(
+            self.employee_two,
+            datetime(2026, 8, 17, 16, 0),
+            datetime(2026, 8, 17, 22, 0),
+        )
+        draft = self._shift(
+            self.employee_two,
+            datetime(2026, 8, 18, 14, 0),
+            datetime(2026, 8, 18, 22, 0),
+            state="draft",
+        )
+
+        capacity = self.env["fsm.capacity.day"].with_context(
+            tz="America/El_Salvador"
+        )
+        days = capacity.generate_capacity(
+            date(2026, 8, 17), date(2026, 8, 18), teams=self.team
+        )
+
+        self.assertEqual(days.mapped("date"), [date(2026, 8, 17)])
+        self.assertEqual(days.capacity_kind, "planning")
+        self.assertFalse(days.shift_id)
+        self.assertEqual(days.total_minutes, 360)
+
+        draft.write({"state": "published"})
+        days = capacity.generate_capacity(
+            date(2026, 8, 17), date(2026, 8, 18), teams=self.team, prune=True
+        )
+
+        self.assertEqual(
+            sorted(days.mapped("total_minutes")), [360, 480]
+        )
+        self.assertEqual(
+            len(capacity.search([("team_id", "=", self.team.id)])), 2
+        )
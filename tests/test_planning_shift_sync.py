@@ -1,5 +1,6 @@
-from datetime import date
+from datetime import date, datetime, timedelta
 
+from odoo import fields
 from odoo.tests.common import TransactionCase
 
 
@@ -85,9 +86,28 @@ class TestPlanningShiftSync(TransactionCase):
         ])
         self.assertEqual(first["created"], 1)
         self.assertEqual(second["created"], 0)
-        self.assertGreaterEqual(second["updated"], 1)
+        self.assertEqual(second["updated"], 0)
         self.assertEqual(len(slots), 1)
 
+    def test_sync_writes_only_changed_shifts(self):
+        self.slot_model.sync_fsm_technician_shifts(self.monday, self.monday)
+        slot = self.slot_model.search([
+            ("fsm_employee_schedule_generated", "=", True),
+            ("resource_id", "=", self.technician.resource_id.id),
+            ("fsm_schedule_date", "=", self.monday),
+        ])
+        self.calendar.attendance_ids.filtered(
+            lambda attendance: attendance.day_period == "afternoon"
+        ).write({"hour_to": 16.5})
+
+        result = self.slot_model.sync_fsm_technician_shifts(
+            self.monday, self.monday
+        )
+
+        self.assertEqual(result["created"], 0)
+        self.assertEqual(result["updated"], 1)
+        self.assertEqual(str(slot.end_datetime), "2026-08-17 22:30:00")
+
     def test_sync_removes_generated_shift_when_day_is_no_longer_worked(self):
         self.slot_model.sync_fsm_technician_shifts(self.monday, self.monday)
         self.calendar.attendance_ids.unlink()
@@ -120,3 +140,67 @@ class TestPlanningShiftSync(TransactionCase):
         self.assertTrue(slot.exists())
         self.assertEqual(slot.state, "published")
         self.assertEqual(slot.start_datetime, original_start)
+
+    def test_calendar_edit_queues_and_resyncs_only_affected_employees(self):
+        today = fields.Date.context_today(self.slot_model)
+        next_monday = today + timedelta(days=7 - today.weekday())
+        self.slot_model.sync_fsm_technician_shifts(next_monday, next_monday)
+        slot = self.slot_model.search([
+            ("fsm_employee_schedule_generated", "=", True),
+            ("resource_id", "=", self.technician.resource_id.id),
+            ("fsm_schedule_date", "=", next_monday),
+        ])
+        queue = self.env["fsm.planning.dirty"]
+        queue.search([]).unlink()
+
+        self.calendar.attendance_ids.filtered(
+            lambda attendance: attendance.day_period == "afternoon"
+        ).write({"hour_to": 16.5})
+
+        queued = queue.search([])
+        self.assertEqual(queued.employee_id, self.technician | self.other_employee)
+        self.assertEqual(queue.process_dirty(batch_size=1), 2)
+        self.assertFalse(queue.search([]))
+        self.assertEqual(slot.end_datetime.hour, 22)
+        self.assertFalse(self.slot_model.search([
+            ("resource_id", "=", self.other_employee.resource_id.id),
+            ("fsm_employee_schedule_generated", "=", True),
+        ]))
+
+    def test_chunked_sync_resumes_from_checkpoint(self):
+        window_start, _window_end = self.slot_model._fsm_sync_window(2)
+
+        first = self.slot_model.sync_fsm_technician_shifts_chunked(weeks=2, batch_size=1, time_budget=1e-9)
+        second = self.slot_model.sync_fsm_technician_shifts_chunked(weeks=2, batch_size=1, time_budget=1e-9)
+        third = self.slot_model.sync_fsm_technician_shifts_chunked(weeks=2, batch_size=1, time_budget=1e-9)
+
+        self.assertEqual((first["chunks"], first["done"]), (1, False))
+        self.assertEqual((second["chunks"], second["done"]), (1, True))
+        self.assertEqual(third["chunks"], 0)
+        self.assertTrue(self.env["fsm.shift.sync.checkpoint"].search([]).done)
+        slots = self.slot_model.search([
+            ("fsm_employee_schedule_generated", "=", True),
+            ("resource_id", "=", self.technician.resource_id.id),
+        ])
+        self.assertEqual(
+            sorted(slots.mapped("fsm_schedule_date")),
+            [window_start, window_start + timedelta(days=7)],
+        )
+
+    def test_batched_bounds_cover_range_for_all_employees(self):
+        bounds = self.slot_model._fsm_calendar_shift_bounds_batch(
+            self.technician | self.other_employee,
+            self.monday,
+            self.monday + timedelta(days=7),
+        )
+
+        next_monday = self.monday + timedelta(days=7)
+        expected = {
+            (employee.id, day): (
+                datetime.combine(day, datetime.min.time()) + timedelta(hours=13, minutes=30),
+                datetime.combine(day, datetime.min.time()) + timedelta(hours=23, minutes=30),
+            )
+            for employee in (self.technician, self.other_employee)
+            for day in (self.monday, next_monday)
+        }
+        self.assertEqual(bounds, expected)
@@ -71,3 +71,89 @@ class TestSlotEngineOperationalStatus(TransactionCase):
         )
 
         self.assertIn((start, end), busy[self.team.id])
+
+    def test_stage_closed_names_are_normalized_once_per_stage(self):
+        closed = self.env["project.task.type"].create({"name": "Finalizado Técnico"})
+        open_stage = self.env["project.task.type"].create({"name": "En Ruta"})
+
+        self.assertTrue(closed.fsm_closes_availability)
+        self.assertFalse(open_stage.fsm_closes_availability)
+        self.assertTrue(self.completed_stage.fsm_closes_availability)
+
+    def test_stage_closed_flag_checks_every_translation(self):
+        self.env["res.lang"]._activate_lang("es_ES")
+        stage = self.env["project.task.type"].create({"name": "Field Review"})
+        self.assertFalse(stage.fsm_closes_availability)
+
+        stage.with_context(lang="es_ES").write({"name": "Revisión Cerrada"})
+
+        self.assertEqual(stage.with_context(lang="en_US").name, "Field Review")
+        self.assertTrue(stage.fsm_closes_availability)
+        self.assertTrue(stage.with_context(lang="en_US").fsm_closes_availability)
+
+    def test_cancelled_task_is_filtered_from_busy_search(self):
+        start = fields.Datetime.now() + timedelta(days=1)
+        end = start + timedelta(hours=2)
+        task = self._task(planned_date_begin=start, date_deadline=end)
+        self.assertTrue(task.fsm_blocks_availability)
+
+        task.write({"state": "1_canceled"})
+        busy = self.engine._busy_intervals_by_team_utc(
+            self.team,
+            start - timedelta(hours=1),
+            end + timedelta(hours=1),
+        )
+
+        self.assertFalse(task.fsm_blocks_availability)
+        self.assertEqual(busy[self.team.id], [])
+
+    def test_busy_end_falls_back_to_allocated_hours(self):
+        start = fields.Datetime.now().replace(microsecond=0) + timedelta(days=2)
+        task = self._task(planned_date_begin=start, allocated_hours=3.0)
+        task.date_deadline = False
+
+        self.assertEqual(task.fsm_busy_start, start)
+        self.assertEqual(task.fsm_busy_end, start + timedelta(hours=3))
+
+    def test_roster_user_index_follows_roster_writes(self):
+        user = self.env["res.users"].with_context(no_reset_password=True).create({
+            "name": "Roster Index Technician",
+            "login": "roster.index.technician@gmail.com",
+        })
+        employee = self.env["hr.employee"].create({
+            "name": "Roster Index Technician",
+            "user_id": user.id,
+        })
+        self.assertEqual(self.engine._get_team_users(self.team), self.env.user)
+
+        self.team.write({"member_ids": [(4, employee.id)]})
+
+        _users_by_team, teams_by_user = self.env["fsm.team"]._fsm_roster_user_index()
+        self.assertEqual(self.engine._get_team_users(self.team), self.env.user | user)
+        self.assertIn(self.team.id, teams_by_user[user.id])
+
+    def test_settings_are_typed_and_follow_set_param(self):
+        icp = self.env["ir.config_parameter"].sudo()
+        settings = self.env["fsm.settings"]
+
+        icp.set_param("fsm_guided_intake.slot_travel_buffer_minutes", "15")
+        icp.set_param("fsm_guided_intake.availability_source", "unknown")
+        self.assertEqual(settings._get("slot_travel_buffer_minutes"), 15)
+        self.assertEqual(settings._get("availability_source"), "calendar")
+
+        icp.set_param("fsm_guided_intake.slot_travel_buffer_minutes", "not a number")
+        self.assertEqual(settings._get("slot_travel_buffer_minutes"), 0)
+
+    def test_team_change_resyncs_assignees_in_one_pass(self):
+        user = self.env["res.users"].with_context(no_reset_password=True).create({
+            "name": "Reassigned Team Lead",
+            "login": "reassigned.team.lead@gmail.com",
+        })
+        other_team = self.env["fsm.team"].create({"lead_user_id": user.id})
+        tasks = self._task() | self._task() | self._task()
+
+        tasks.write({"team_id": other_team.id})
+
+        self.assertEqual(tasks.team_id, other_team)
+        for task in tasks:
+            self.assertEqual(task.user_ids, user)
@@ -270,9 +270,7 @@ class FsmChangeAppointmentWizard(models.TransientModel):
         if not teams:
             return []
 
-        lead_minutes = int(self.env["ir.config_parameter"].sudo().get_param(
-            "fsm_guided_intake.slot_start_lead_minutes", "0"
-        ) or 0)
+        lead_minutes = self.env["fsm.settings"]._get("slot_start_lead_minutes")
         task_type = self.task_id.fsm_task_type_id if self.task_id else False
         priority_windows = self.env["fsm.task.priority.slot"].get_windows_for_priority(
             task_type.priority if task_type else False
@@ -568,9 +568,7 @@ class FsmTaskIntakeWizard(models.TransientModel):
         if not teams:
             return []
 
-        lead_minutes = int(self.env["ir.config_parameter"].sudo().get_param(
-            "fsm_guided_intake.slot_start_lead_minutes", "0"
-        ) or 0)
+        lead_minutes = self.env["fsm.settings"]._get("slot_start_lead_minutes")
         priority_windows = self.env["fsm.task.priority.slot"].get_windows_for_priority(
             self.task_type_id.priority if self.task_type_id else False
         )